@@ -1,38 +1,155 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Blueprint, Flask, Response, current_app, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
+from werkzeug.local import LocalProxy
+from werkzeug.middleware.proxy_fix import ProxyFix
 import sqlite3
-import unicodedata
-import re
 import random
+import re
+import secrets
 import string
+import os
+import weakref
+import zlib
+
+import bdd
+import charges
+import demarrage
+import fragments
+import importation
+import limitation
+import migrations
+import mots_de_passe
+import rapports
+import recherche
+import retention
+import cache
+import sla
+from cache import creer_cache
+from bdd import get_db_connection
+from validation import cle_mairie, valider_format_strict_email, valider_securite_mdp
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'votre_cle_secrete'
+
+RACINE = os.path.dirname(os.path.abspath(__file__))
+
+# Configuration par défaut. Chaque clé se surcharge par une variable d'environnement MAIRIE_<CLÉ>,
+# lue comme du JSON quand c'est possible (MAIRIE_POOL_TAILLE=16, MAIRIE_SQLITE_PRAGMAS='{"cache_size": -32000}'),
+# puis par le dictionnaire passé à create_app. SECRET_KEY vient de MAIRIE_SECRET_KEY.
+CONFIG_DEFAUT = {
+    'DATABASE': os.path.join(RACINE, 'mairie.db'),
+    'POOL_TAILLE': 8,  # connexions SQLite gardées ouvertes par worker (au moins WSGI_THREADS)
+    # Profil de PRAGMA : 'dev', 'production' ou 'bench' (voir bdd.PROFILS_PRAGMA)
+    'SQLITE_PROFIL': 'dev',
+    # Surcharges ponctuelles, ex. {'cache_size': -32000}
+    'SQLITE_PRAGMAS': {},
+    'MIGRATIONS_AUTO': True,  # sinon : flask --app app migrer
+    'USAGER_CACHE_TAILLE': 1024,
+    'USAGER_CACHE_TTL': 300,  # secondes : borne la durée de vie d'un profil périmé
+    # Stockage des caches (usagers, tableaux de tickets) : 'memoire' (par worker), 'sqlite' (fichier
+    # CACHE_CHEMIN, à côté de la base par défaut, partagé par les workers) ou 'nul'.
+    # Invalidation entre workers dans tous les cas (cache.py)
+    'CACHE_BACKEND': 'memoire',
+    # Rétention des tickets par statut (jours après date_fin), purgée par lots en tâche de fond
+    'RETENTION_JOURS': {'Terminé': 30},
+    'RETENTION_LOT': 500,
+    'RETENTION_INTERVALLE': 3600,  # secondes, 0 = uniquement via flask --app app purger
+    'TICKETS_PAR_PAGE': 50,
+    'TICKETS_PAGE_MAX': 200,
+    'IMPORT_LIGNES_MAX': 5000,  # lignes par fichier importé
+    'TICKETS_LOT_MAX': 500,  # tickets par action groupée (assignation, statut, clôture)
+    # Hachage des mots de passe : méthode et coût au format werkzeug (mesurer avec outils/bench_mdp.py),
+    # calculé par MDP_THREADS threads par worker
+    'MDP_METHODE': 'scrypt:32768:8:1',
+    'MDP_THREADS': 2,
+    # Tentatives de connexion / récupération de mot de passe : seaux à jetons par IP et par email
+    'LIMITE_CONNEXION_IP': {'capacite': 30, 'par_minute': 10},
+    'LIMITE_CONNEXION_EMAIL': {'capacite': 5, 'par_minute': 1},
+    # Tableaux de tickets rendus (technicien, agent, référent) gardés dans le stockage CACHE_BACKEND, voir fragments.py
+    'FRAGMENTS_TAILLE': 512,
+    # Threads par worker du serveur WSGI (gunicorn.conf.py), pour les contrôles de demarrage.py
+    'WSGI_THREADS': None,
+    # Nombre de proxys (nginx...) devant l'application : X-Forwarded-For donne alors la vraie IP,
+    # indispensable à la limitation des connexions par IP. 0 = en-têtes ignorés
+    'PROXY_NIVEAUX': 0,
+}
 
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-def simplifier_chaine(texte):
-    """Supprime les accents, espaces et met en minuscule."""
-    if not texte: return ""
-    texte = unicodedata.normalize('NFD', texte)
-    texte = "".join([c for c in texte if unicodedata.category(c) != 'Mn']).lower()
-    return texte.replace(" ", "")
-
-def valider_format_strict_email(email, prenom, nom):
-    """Vérifie le format prenom.nom@... ou p.nom@... avec domaines .fr ou gmail.com"""
-    email = email.lower().strip()
-    p = simplifier_chaine(prenom)
-    n = simplifier_chaine(nom)
-    
-    format1 = f"{p}.{n}"          # prenom.nom
-    format2 = f"{p[0]}.{n}"       # p.nom
-    
-    # Regex : accepte gmail.com ou n'importe quel domaine finissant par .fr
-    suffixe_pattern = r"@(gmail\.com|[a-zA-Z0-9-]+\.fr)$"
-    pattern = f"^({re.escape(format1)}|{re.escape(format2)}){suffixe_pattern}"
-    
-    return re.match(pattern, email) is not None
+login_manager.login_view = 'principal.login'
+
+# Routes de l'application, enregistrées sur chaque application construite par create_app
+principal = Blueprint('principal', __name__)
+
+
+# Objets propres à l'application courante (créés par les init_app), utilisables dans les vues
+versions_cache = LocalProxy(lambda: current_app.extensions['versions_cache'])
+cache_fragments = LocalProxy(lambda: current_app.extensions['fragments'])
+hacheur = LocalProxy(lambda: current_app.extensions['mots_de_passe'])
+limiteur = LocalProxy(lambda: current_app.extensions['limitation'])
+# Profils déjà chargés : évite un SELECT sur usager à chaque @login_required. Chaque profil est
+# rangé avec la version de ('usager', id) : une écriture faite par un autre worker le périme aussitôt
+cache_usagers = LocalProxy(lambda: current_app.extensions['cache_usagers'])
+
+
+def create_app(config=None):
+    """Construit l'application : configuration, pool SQLite, migrations, caches, routes.
+
+    Priorité de la configuration : CONFIG_DEFAUT, puis les variables MAIRIE_*,
+    puis `config`. Les serveurs WSGI importent wsgi.py ; `flask --app app`
+    trouve cette fonction tout seul.
+    """
+    app = Flask(__name__)
+    app.config.from_mapping(CONFIG_DEFAUT)
+    app.config.from_prefixed_env('MAIRIE')
+    app.config.update(config or {})
+    if not app.config.get('SECRET_KEY'):
+        # Sessions valables pour ce process seulement : refusé en production (demarrage.py)
+        app.config['SECRET_KEY'] = secrets.token_hex(32)
+        app.config['SECRET_KEY_EPHEMERE'] = True
+        app.logger.warning("MAIRIE_SECRET_KEY absente : clé de session temporaire, propre à ce process")
+    if app.config['PROXY_NIVEAUX']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_NIVEAUX'],
+                                x_proto=app.config['PROXY_NIVEAUX'])
+
+    bdd.init_app(app)
+    migrations.init_app(app)
+    cache.init_app(app)
+    retention.init_app(app)
+    charges.init_app(app)
+    recherche.init_app(app)
+    rapports.init_app(app)
+    fragments.init_app(app)
+    mots_de_passe.init_app(app)
+    importation.init_app(app)
+    limitation.init_app(app)
+    demarrage.init_app(app)
+    app.extensions['cache_usagers'] = creer_cache(app.config['CACHE_BACKEND'], 'usagers',
+                                                  app.config['USAGER_CACHE_TAILLE'],
+                                                  app.config['USAGER_CACHE_TTL'], app.config['CACHE_CHEMIN'])
+
+    login_manager.init_app(app)
+    app.register_blueprint(principal)
+    app.register_error_handler(mots_de_passe.HachageSature, hachage_sature)
+    app.register_error_handler(LotInvalide, lot_invalide)
+    _applications.add(app)
+    return app
+
+
+# Applications vivantes de ce process (les outils et les tests en construisent plusieurs)
+_applications = weakref.WeakSet()
+
+
+def apres_fork():
+    """Application préchargée puis forkée par gunicorn (preload_app) : chaque worker
+    rouvre ses propres connexions SQLite au lieu de partager celles du parent."""
+    for app in list(_applications):
+        app.extensions['pool_sqlite'].apres_fork()
+        app.extensions['versions_cache'].apres_fork()
+        app.extensions['fragments'].apres_fork()
+        if hasattr(app.extensions['cache_usagers'], 'apres_fork'):
+            app.extensions['cache_usagers'].apres_fork()
+
+
+os.register_at_fork(after_in_child=apres_fork)
+
 # --- Modèle Utilisateur ---
 class Usager(UserMixin):
      def __init__(self, id, nom, prenom, role, mairie_id=None, premier_login=1):
@@ -43,34 +160,62 @@ class Usager(UserMixin):
         self.mairie_id = mairie_id
         self.premier_login = premier_login
 
-def get_db_connection():
-    conn = sqlite3.connect('mairie.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+def invalider_usager(user_id):
+    """À appeler après toute écriture qui change l'identité, le rôle ou le mot de passe d'un usager."""
+    cache_usagers.invalider(int(user_id))
 
 @login_manager.user_loader
 def load_user(user_id):
+    version = versions_cache.version('usager', int(user_id))
+    entree = cache_usagers.lire(int(user_id))
+    if entree is not None and entree[0] == version:
+        return entree[1]
     conn = get_db_connection()
     u = conn.execute('SELECT * FROM usager WHERE id = ?', (user_id,)).fetchone()
-    conn.close()
     if u:
-        return Usager(u['id'], u['nom'], u['prenom'], u['role'], u['mairie_id'],u['premier_login'])
+        user = Usager(u['id'], u['nom'], u['prenom'], u['role'], u['mairie_id'],u['premier_login'])
+        cache_usagers.ecrire(user.id, (version, user))
+        return user
     return None
 
 # --- ROUTES DE CONNEXION ---
 
-@app.route('/', methods=['GET', 'POST'])
+def hachage_sature(e):
+    # Pool de hachage plein : mieux vaut refuser vite que laisser les requêtes s'empiler
+    return Response("Serveur momentanément surchargé, réessayez dans quelques secondes.",
+                    status=503, headers={'Retry-After': '5'})
+
+def trop_de_tentatives(nom_route, email_saisi, template, **contexte):
+    """Réponse 429 si l'IP ou l'email a épuisé ses tentatives, sinon None. Aucun accès à la base."""
+    attente = limiteur.attente(nom_route, request.remote_addr, email_saisi)
+
+    if not attente:
+        return None
+    flash(f"Trop de tentatives. Réessayez dans {attente} seconde(s).")
+    return render_template(template, **contexte), 429, {'Retry-After': str(attente)}
+
+@principal.route('/', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
         mdp = request.form.get('mdp')
-        
+
+        refus = trop_de_tentatives('login', email, 'login.html')
+        if refus:
+            return refus
+
         conn = get_db_connection()
-        user_data = conn.execute('SELECT * FROM usager WHERE email = ? AND mdp = ?', 
-                                (email, mdp)).fetchone()
-        conn.close()
-        
-        if user_data:
+        user_data = conn.execute('SELECT * FROM usager WHERE email = ?', (email,)).fetchone()
+        # Calcul lent, fait dans le pool de hachage ; None = email inconnu (même coût)
+        correct, nouveau_hachage = hacheur.verifier(user_data['mdp'] if user_data else None, mdp)
+        if correct and nouveau_hachage:
+            # Mot de passe en clair ou haché avec un ancien coût : remplacé au passage.
+            # "AND mdp = ?" : ne pas écraser un changement de mot de passe concurrent
+            conn.execute('UPDATE usager SET mdp = ? WHERE id = ? AND mdp = ?',
+                         (nouveau_hachage, user_data['id'], user_data['mdp']))
+            conn.commit()
+
+        if correct:
             user = Usager(user_data['id'], user_data['nom'], user_data['prenom'], 
                           user_data['role'], user_data['mairie_id'], user_data['premier_login'])
             login_user(user)
@@ -78,44 +223,95 @@ def login():
             # --- LOGIQUE DE PREMIÈRE CONNEXION ---
             if user.premier_login == 1:
                 flash("Ceci est votre première connexion. Veuillez sécuriser votre compte en changeant votre mot de passe.")
-                return redirect(url_for('modifier_mdp'))
+                return redirect(url_for('principal.modifier_mdp'))
 
             # --- LOGIQUE DE REDIRECTION (Bien indentée) ---
             if user.role == 'personnel_mairie':
-                return redirect(url_for('espace_mairie'))
+                return redirect(url_for('principal.espace_mairie'))
             elif user.role == 'referent' or user.role == 'référent':
-                return redirect(url_for('dashboard_referent'))
+                return redirect(url_for('principal.dashboard_referent'))
             elif user.role == 'admin_prestataire':
-                return redirect(url_for('menu_admin'))
+                return redirect(url_for('principal.menu_admin'))
             else:
-                return redirect(url_for('dashboard_technicien'))
+                return redirect(url_for('principal.dashboard_technicien'))
         else:
             flash("Identifiants incorrects")
             
     return render_template('login.html')
 
-@app.route('/logout')
+@principal.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash("Vous avez été déconnecté.")
-    return redirect(url_for('login'))
+    return redirect(url_for('principal.login'))
 
 # --- ROUTES ADMIN PRESTATAIRE ---
 
-@app.route('/admin/menu')
+@principal.route('/admin/menu')
 @login_required
 def menu_admin():
     return render_template('menu_admin.html')
 
-@app.route('/admin/prestations')
+@principal.route('/admin/statistiques')
 @login_required
-def prestations_admin():
-    conn = get_db_connection()
-    conn.execute("DELETE FROM ticket WHERE statut = 'Terminé' AND date_fin < datetime('now', '-30 days')")
-    conn.commit()
+def statistiques_admin():
+    # Compteurs internes du worker qui répond (pool SQLite...) pour dimensionner en charge
+    if current_user.role != 'admin_prestataire':
+        flash("Accès refusé.")
+        return redirect(url_for('principal.login'))
+    return jsonify({
+        'pool_sqlite': current_app.extensions['pool_sqlite'].statistiques(),
+        'cache_usagers': cache_usagers.statistiques(),
+        'mots_de_passe': hacheur.statistiques(),
+        'limitation_connexions': limiteur.statistiques(),
+        'fragments_tickets': cache_fragments.statistiques(),
+        'versions_cache': versions_cache.statistiques(),
+
+    })
+
+# Filtres de la liste admin : paramètre d'URL -> colonne (chacune indexée avec date_creation)
+FILTRES_TICKETS = {
+    'statut': 't.statut',
+    'contrat': 't.contrat',
+    'type_prestation': 't.type_prestation',
+    'mairie': 't.mairie_id',
+    'technicien': 't.technicien_id',
+}
+
+# Identifiant en chiffres ASCII : str.isdigit() accepte aussi '²' ou '٣', que int() refuse ou convertit
+IDENTIFIANT = re.compile(r'[0-9]+')
+
+def lire_curseur(curseur):
+    """'date_creation|id' -> (date_creation, id), ou None si absent ou illisible."""
+    if not curseur or '|' not in curseur:
+        return None
+    date_creation, _, ticket_id = curseur.rpartition('|')
+    if not IDENTIFIANT.fullmatch(ticket_id):
+        return None
+    return date_creation, int(ticket_id)
+
+def filtres_tickets_admin(args):
+    """Paramètres d'URL de la liste admin -> (filtres retenus, conditions SQL, paramètres), hors curseur."""
+    filtres = {cle: args[cle] for cle in FILTRES_TICKETS if args.get(cle)}
+    conditions = [f"{FILTRES_TICKETS[cle]} = ?" for cle in filtres]
+    params = list(filtres.values())
+    # Tickets ouverts dont l'échéance SLA est passée (index partiel idx_ticket_sla_ouverts)
+    if args.get('en_retard'):
+        filtres['en_retard'] = '1'
+        conditions.append("t.statut != 'Terminé' AND t.sla_echeance < datetime('now')")
+    return filtres, conditions, params
+
+def page_tickets_admin(conn, conditions, params, curseur, taille):
+    """Une page de la liste admin et le curseur de la suivante (None sur la dernière page)."""
+    # Pagination par clé (date_creation, id) : la page N coûte autant que la page 1
+    if curseur:
+        conditions = conditions + ["(t.date_creation, t.id) < (?, ?)"]
+        params = params + list(curseur)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
     # On ajoute "LEFT JOIN usager AS tech" pour récupérer les infos du technicien
-    tickets = conn.execute('''
+    tickets = conn.execute(f'''
         SELECT t.*, 
                strftime('%d/%m/%Y', t.date_creation) as date_formatee, 
                u.nom as demandeur, 
@@ -125,52 +321,257 @@ def prestations_admin():
         FROM ticket t 
         JOIN usager u ON t.createur_id = u.id 
         LEFT JOIN usager tech ON t.technicien_id = tech.id
-        ORDER BY t.date_creation DESC
-    ''').fetchall()
+        {where}
+        ORDER BY t.date_creation DESC, t.id DESC
+        LIMIT ?
+    ''', params + [taille + 1]).fetchall()
+
+    # Une ligne de plus que demandé indique qu'il existe une page suivante
+    curseur_suivant = None
+    if len(tickets) > taille:
+        tickets = tickets[:taille]
+        curseur_suivant = f"{tickets[-1]['date_creation']}|{tickets[-1]['id']}"
+    return tickets, curseur_suivant
+
+def taille_page(args):
+    taille = args.get('taille', current_app.config['TICKETS_PAR_PAGE'], type=int)
+    return max(1, min(taille, current_app.config['TICKETS_PAGE_MAX']))
+
+@principal.route('/admin/prestations')
+@login_required
+def prestations_admin():
+    filtres, conditions, params = filtres_tickets_admin(request.args)
+    taille = taille_page(request.args)
+    curseur = lire_curseur(request.args.get('curseur'))
+
+    conn = get_db_connection()
+    tickets, curseur_suivant = page_tickets_admin(conn, conditions, params, curseur, taille)
+
+    mairies = conn.execute('SELECT id, nom, ville FROM mairie ORDER BY ville ASC').fetchall()
     
     # On s'assure de récupérer les techniciens pour le menu déroulant
     # Note: J'ai changé 'IS NULL' par 'technicien' si vous utilisez des rôles
+    # La charge vient de charge_technicien, tenue à jour par triggers (voir charges.py)
     techniciens = conn.execute('''
-        SELECT u.id, u.prenom, u.nom,
-               (SELECT COUNT(t.id) FROM ticket t 
-                WHERE t.technicien_id = u.id 
-                AND t.statut != 'Terminé') as charge
+        SELECT u.id, u.prenom, u.nom, COALESCE(c.actifs, 0) as charge
         FROM usager u 
+        LEFT JOIN charge_technicien c ON c.technicien_id = u.id
         WHERE u.role = 'technicien' OR u.role IS NULL
     ''').fetchall()
-    conn.close()
-    return render_template('dashboard_admin.html', tickets=tickets, techniciens=techniciens)
-@app.route('/admin/assigner/<int:ticket_id>', methods=['POST'])
+    return render_template('dashboard_admin.html', tickets=tickets, techniciens=techniciens,
+                           mairies=mairies, filtres=filtres, taille=taille,
+                           curseur_suivant=curseur_suivant, est_premiere_page=curseur is None)
+# Clôture d'un ticket : le temps écoulé et le dépassement SLA sont figés à ce moment-là
+SQL_CLOTURE = f'''statut = 'Terminé', date_fin = CURRENT_TIMESTAMP,
+        sla_heures_ecoulees = ROUND((julianday(CURRENT_TIMESTAMP) - julianday(date_creation)) * 24, 2),
+        sla_depasse = CURRENT_TIMESTAMP > {sla.SQL_ECHEANCE},
+        sla_retard_heures = CASE WHEN CURRENT_TIMESTAMP > {sla.SQL_ECHEANCE}
+            THEN ROUND((julianday(CURRENT_TIMESTAMP) - julianday({sla.SQL_ECHEANCE})) * 24, 2) END'''
+
+# Dictionnaire de correspondance des durées
+DUREES_CONTRAT = {contrat: f"{heures} heures" for contrat, heures in sla.SLA_HEURES.items()}
+
+# L'échéance SLA est calculée une fois ici au lieu d'être recalculée à chaque affichage.
+# Repasser "En cours" rouvre un ticket clos : son SLA figé n'a plus lieu d'être
+SQL_ASSIGNATION = '''
+    UPDATE ticket 
+    SET technicien_id = ?, contrat = ?, duree = ?, statut = "En cours",
+        sla_echeance = datetime(date_creation, ?),
+        date_fin = NULL, sla_heures_ecoulees = NULL, sla_depasse = NULL, sla_retard_heures = NULL
+    WHERE id = ?
+'''
+
+def parametres_assignation(ticket_id, tech_id, contrat):
+    # On récupère la durée correspondante (ou "Non définie" par sécurité)
+    return (tech_id, contrat, DUREES_CONTRAT.get(contrat, 'Non définie'),
+            f"+{sla.limite_heures(contrat)} hours", ticket_id)
+
+@principal.route('/admin/assigner/<int:ticket_id>', methods=['POST'])
 @login_required
 def assigner_ticket(ticket_id):
     tech_id = request.form.get('technicien_id')
     contrat = request.form.get('contrat')
-
-    # Dictionnaire de correspondance des durées
-    durées = {
-        'Gold': '4 heures',
-        'Silver': '24 heures',
-        'Bronze': '72 heures'
-    }
-    
-    # On récupère la durée correspondante (ou "Non définie" par sécurité)
-    duree_intervention = durées.get(contrat, 'Non définie')
+    duree_intervention = DUREES_CONTRAT.get(contrat, 'Non définie')
 
     conn = get_db_connection()
     # On ajoute la durée dans la mise à jour (assurez-vous d'avoir la colonne 'duree' en BDD)
-    conn.execute('''
-        UPDATE ticket 
-        SET technicien_id = ?, contrat = ?, duree = ?, statut = "En cours" 
-        WHERE id = ?
-    ''', (tech_id, contrat, duree_intervention, ticket_id))
+    conn.execute(SQL_ASSIGNATION, parametres_assignation(ticket_id, tech_id, contrat))
     
     conn.commit()
-    conn.close()
     flash(f"Assigné en contrat {contrat} (Délai : {duree_intervention})")
-    return redirect(url_for('prestations_admin'))
+    return redirect(url_for('principal.prestations_admin'))
+
+class LotInvalide(Exception):
+    """Action groupée refusée en entier (lot trop gros ou mal formé), avant toute écriture."""
+
+    def __init__(self, message, statut=400):
+        super().__init__(message)
+        self.statut = statut
+
+def lot_invalide(e):
+    if request.is_json:
+        return jsonify({'erreur': str(e)}), e.statut
+    flash(f"❌ {e}")
+    return redirect(request.referrer or url_for('principal.login'))
+
+def verifier_taille_lot(n):
+    # Refus explicite plutôt que troncature : aucun ticket ne disparaît sans résultat
+    maximum = current_app.config['TICKETS_LOT_MAX']
+    if n > maximum:
+        raise LotInvalide(f"Lot de {n} tickets : au plus {maximum} par requête, découpez-le.", 413)
+
+def lire_affectations():
+    """Affectations demandées : [(ticket_id, technicien_id, contrat)].
+
+    JSON {"affectations": [{"ticket_id", "technicien_id", "contrat"}, ...]} (un technicien
+    et un contrat par ticket), ou formulaire du tableau de bord : cases "tickets" cochées,
+    un même technicien_id et un même contrat pour toute la sélection.
+    """
+    if request.is_json:
+        donnees = request.get_json(silent=True)
+        affectations = donnees.get('affectations') if isinstance(donnees, dict) else None
+        if not isinstance(affectations, list):
+            raise LotInvalide('Corps attendu : {"affectations": [{"ticket_id", "technicien_id", "contrat"}, ...]}.')
+        for rang, a in enumerate(affectations, 1):
+            if not isinstance(a, dict):
+                raise LotInvalide(f"Affectation n° {rang} : objet {{ticket_id, technicien_id, contrat}} attendu.")
+        verifier_taille_lot(len(affectations))
+        return [(a.get('ticket_id'), a.get('technicien_id'), a.get('contrat')) for a in affectations]
+    tech_id = request.form.get('technicien_id')
+    contrat = request.form.get('contrat')
+    tickets = request.form.getlist('tickets')
+    verifier_taille_lot(len(tickets))
+    return [(ticket_id, tech_id, contrat) for ticket_id in tickets]
+
+@principal.route('/admin/assigner-lot', methods=['POST'])
+@login_required
+def assigner_tickets_lot():
+    if current_user.role != 'admin_prestataire':
+        if request.is_json:
+            return refus_api()
+        flash("Accès refusé.")
+        return redirect(url_for('principal.login'))
+
+    affectations = lire_affectations()
+    ids_tickets = {str(t) for t, _, _ in affectations}
+    ids_techs = {str(tech) for _, tech, _ in affectations}
+
+    conn = get_db_connection()
+    # Verrou d'écriture pris d'entrée : les contrôles et les mises à jour voient le même état
+    conn.execute('BEGIN IMMEDIATE')
+    # Contrôles en deux requêtes pour tout le lot, pas une par ticket
+    tickets = {str(t['id']): t for t in conn.execute(f'''
+        SELECT id, statut, technicien_id FROM ticket WHERE id IN ({','.join('?' * len(ids_tickets))})
+    ''', list(ids_tickets))}
+    techniciens = {str(u['id']) for u in conn.execute(f'''
+        SELECT id FROM usager
+        WHERE id IN ({','.join('?' * len(ids_techs))}) AND (role = 'technicien' OR role IS NULL)
+    ''', list(ids_techs))}
+
+    resultats, lignes, vus = [], [], set()
+    for ticket_id, tech_id, contrat in affectations:
+        ticket = tickets.get(str(ticket_id))
+        if ticket is None:
+            erreur = "ticket introuvable"
+        elif str(ticket_id) in vus:
+            erreur = "ticket en double dans le lot"
+        elif ticket['statut'] == 'Terminé':
+            erreur = "ticket déjà terminé"
+        elif str(tech_id) not in techniciens:
+            erreur = "technicien inconnu"
+        elif contrat not in DUREES_CONTRAT:
+            erreur = "contrat inconnu"
+        else:
+            erreur = None
+            vus.add(str(ticket_id))
+            lignes.append(parametres_assignation(ticket['id'], int(tech_id), contrat))
+        resultats.append({'ticket_id': ticket_id, 'technicien_id': tech_id, 'contrat': contrat,
+                          'ok': erreur is None, 'erreur': erreur})
+
+    # Un seul executemany et un seul commit ; charge_technicien suit par triggers dans la même transaction
+    conn.executemany(SQL_ASSIGNATION, lignes)
+    conn.commit()
+
+    if request.is_json:
+        return jsonify({'assignes': len(lignes), 'resultats': resultats})
+    echecs = [r for r in resultats if not r['ok']]
+    flash(f"{len(lignes)} ticket(s) assigné(s)."
+          + (f" {len(echecs)} refusé(s) : " + ", ".join(f"#{r['ticket_id']} ({r['erreur']})" for r in echecs)
+             if echecs else ""))
+    return redirect(request.referrer or url_for('principal.prestations_admin'))
+
+
+SQL_DEMANDE_CLOTURE = 'UPDATE ticket SET statut = "En attente de validation" WHERE id = ?'
+# Réouverture ou avancement : le SLA figé à une éventuelle clôture n'a plus lieu d'être
+SQL_CHANGEMENT_STATUT = '''
+    UPDATE ticket SET statut = ?, date_fin = NULL, sla_heures_ecoulees = NULL, sla_depasse = NULL,
+                      sla_retard_heures = NULL
+    WHERE id = ?
+'''
+STATUTS_INTERVENTION = ['Nouveau', 'En cours', 'Terminé']
+
+def lire_ids_tickets():
+    """Tickets visés par une action groupée : JSON {"tickets": [...]} ou cases "tickets" du formulaire."""
+    if request.is_json:
+        donnees = request.get_json(silent=True)
+        ids = donnees.get('tickets') if isinstance(donnees, dict) else None
+        if not isinstance(ids, list):
+            raise LotInvalide('Corps attendu : {"tickets": [id, ...]}.')
+    else:
+        ids = request.form.getlist('tickets')
+    invalides = [i for i in ids if not IDENTIFIANT.fullmatch(str(i))]
+    if invalides:
+        raise LotInvalide(f"Identifiant(s) de ticket invalide(s) : {', '.join(map(str, invalides[:10]))}.")
+    ids = sorted({int(i) for i in ids})
+    verifier_taille_lot(len(ids))
+    return ids
+
+def tickets_autorises(conn, ids, condition, params):
+    """Sous-ensemble de ids sur lequel l'usager a la main : une requête pour tout le lot."""
+    if not ids:
+        return []
+    return [t['id'] for t in conn.execute(f'''
+        SELECT id FROM ticket WHERE id IN ({','.join('?' * len(ids))}) AND {condition}
+    ''', list(ids) + list(params))]
+
+def reponse_lot(traites, refuses, message):
+    if request.is_json:
+        return jsonify({'traites': traites, 'refuses': refuses})
+    flash(message + (f" Refusé(s) : {', '.join(f'#{i}' for i in refuses)}." if refuses else ""))
+    return redirect(request.referrer or url_for('principal.login'))
 
+@principal.route('/tickets/statut-lot', methods=['POST'])
+@login_required
+def update_statut_lot():
+    # Technicien : ses tickets non clos ; admin : tous les tickets non clos
+    nouveau_statut = (request.get_json(silent=True) or {}).get('statut') if request.is_json \
+        else request.form.get('statut')
+    if nouveau_statut not in STATUTS_INTERVENTION:
+        if request.is_json:
+            return jsonify({'erreur': "Statut inconnu."}), 400
+        flash("Statut inconnu.")
+        return redirect(request.referrer or url_for('principal.login'))
+    if current_user.role == 'admin_prestataire':
+        condition, params = "statut != 'Terminé'", ()
+    elif current_user.role in ['technicien', None]:
+        condition, params = "statut != 'Terminé' AND technicien_id = ?", (current_user.id,)
+    else:
+        return refus_api() if request.is_json else redirect(url_for('principal.login'))
+
+    ids = lire_ids_tickets()
+    conn = get_db_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    autorises = tickets_autorises(conn, ids, condition, params)
+    # Comme update_statut : "Terminé" attend la confirmation du client
+    if nouveau_statut == 'Terminé':
+        conn.executemany(SQL_DEMANDE_CLOTURE, [(i,) for i in autorises])
+    else:
+        conn.executemany(SQL_CHANGEMENT_STATUT, [(nouveau_statut, i) for i in autorises])
+    conn.commit()
+    refuses = sorted(set(ids) - set(autorises))
+    return reponse_lot(autorises, refuses, f"{len(autorises)} ticket(s) mis à jour.")
 
-@app.route('/admin/update_statut/<int:ticket_id>', methods=['POST'])
+@principal.route('/admin/update_statut/<int:ticket_id>', methods=['POST'])
 @login_required
 def update_statut(ticket_id):
     nouveau_statut = request.form.get('statut')
@@ -179,43 +580,57 @@ def update_statut(ticket_id):
     # Si on veut terminer, on ne met pas "Terminé" tout de suite
     # On met un statut intermédiaire
     if nouveau_statut == 'Terminé':
-        conn.execute('''
-            UPDATE ticket SET statut = "En attente de validation" WHERE id = ?
-        ''', (ticket_id,))
+        conn.execute(SQL_DEMANDE_CLOTURE, (ticket_id,))
         flash("Ticket mis en attente de confirmation par le client.")
     else:
-        conn.execute('UPDATE ticket SET statut = ?, date_fin = NULL WHERE id = ?', 
-                    (nouveau_statut, ticket_id))
+        conn.execute(SQL_CHANGEMENT_STATUT, (nouveau_statut, ticket_id))
         flash(f"Statut mis à jour : {nouveau_statut}")
     
     conn.commit()
-    conn.close()
-    return redirect(url_for('prestations_admin'))
+    return redirect(url_for('principal.prestations_admin'))
     
-@app.route('/mairie/confirmer-cloture/<int:ticket_id>', methods=['POST'])
+@principal.route('/mairie/confirmer-cloture/<int:ticket_id>', methods=['POST'])
 @login_required
 def confirmer_cloture(ticket_id):
     conn = get_db_connection()
     # On vérifie que le ticket appartient bien à l'utilisateur ou sa mairie
-    conn.execute('''
+    conn.execute(f'''
         UPDATE ticket 
-        SET statut = 'Terminé', date_fin = CURRENT_TIMESTAMP 
+        SET {SQL_CLOTURE}
         WHERE id = ?
     ''', (ticket_id,))
     conn.commit()
-    conn.close()
     flash("✅ Merci ! Le ticket est maintenant clôturé officiellement.")
     return redirect(request.referrer)
     
-@app.route('/admin/inventaire')
+@principal.route('/mairie/confirmer-cloture-lot', methods=['POST'])
+@login_required
+def confirmer_cloture_lot():
+    # Référent : tickets de sa mairie ; agent : ses propres demandes
+    if current_user.role in ['referent', 'référent']:
+        condition, params = "statut = 'En attente de validation' AND mairie_id = ?", (current_user.mairie_id,)
+    elif current_user.role == 'personnel_mairie':
+        condition, params = "statut = 'En attente de validation' AND createur_id = ?", (current_user.id,)
+    else:
+        return refus_api() if request.is_json else redirect(url_for('principal.login'))
+
+    ids = lire_ids_tickets()
+    conn = get_db_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    autorises = tickets_autorises(conn, ids, condition, params)
+    conn.executemany(f'UPDATE ticket SET {SQL_CLOTURE} WHERE id = ?', [(i,) for i in autorises])
+    conn.commit()
+    refuses = sorted(set(ids) - set(autorises))
+    return reponse_lot(autorises, refuses, f"✅ {len(autorises)} ticket(s) clôturé(s).")
+
+@principal.route('/admin/inventaire')
 @login_required
 def inventaire_admin():
     conn = get_db_connection()
     materiels = conn.execute('SELECT * FROM inventaire').fetchall()
-    conn.close()
     return render_template('inventaire_admin.html', materiels=materiels)
 
-@app.route('/admin/nouvelle-mairie', methods=['GET', 'POST'])
+@principal.route('/admin/nouvelle-mairie', methods=['GET', 'POST'])
 @login_required
 def ajouter_mairie():
     conn = get_db_connection()
@@ -224,34 +639,54 @@ def ajouter_mairie():
         nom = request.form.get('nom')
         ville = request.form.get('ville')
         
-        # Vérification si la mairie existe déjà
-        existe = conn.execute('SELECT id FROM mairie WHERE nom = ? AND ville = ?', 
-                             (nom, ville)).fetchone()
-        
-        if existe:
+        # L'index unique sur (nom, ville) normalisés refuse le doublon : pas de SELECT préalable
+        cursor = conn.execute('''
+            INSERT INTO mairie (nom, ville, nom_normalise, ville_normalise) VALUES (?, ?, ?, ?)
+            ON CONFLICT (nom_normalise, ville_normalise) DO NOTHING
+        ''', (nom, ville, *cle_mairie(nom, ville)))
+        conn.commit()
+
+        if cursor.rowcount == 0:
             flash("Erreur : Cette mairie existe déjà dans le système.")
         else:
-            cursor = conn.cursor()
-            cursor.execute('INSERT INTO mairie (nom, ville) VALUES (?, ?)', (nom, ville))
             mairie_id = cursor.lastrowid
-            conn.commit()
             flash(f"Mairie de {ville} créée avec succès.")
-            conn.close()
-            return redirect(url_for('ajouter_referent', mairie_id=mairie_id))
+            return redirect(url_for('principal.ajouter_referent', mairie_id=mairie_id))
             
     # On récupère toutes les mairies pour les afficher sous le formulaire
     mairies = conn.execute('SELECT * FROM mairie ORDER BY ville ASC').fetchall()
-    conn.close()
     
     return render_template('ajouter_mairie.html', mairies=mairies)
-    
-@app.route('/admin/supprimer-mairie/<int:mairie_id>', methods=['POST'])
+
+@principal.route('/admin/importer-mairies', methods=['POST'])
+@login_required
+def importer_mairies_admin():
+    # Fichier CSV/XLSX : mairie, ville et éventuellement referent_prenom, referent_nom, referent_email, referent_mdp
+    if current_user.role != 'admin_prestataire':
+        flash("Accès refusé.")
+        return redirect(url_for('principal.login'))
+    fichier = request.files.get('fichier')
+    if not fichier or not fichier.filename:
+        flash("Choisissez un fichier CSV ou XLSX.")
+        return redirect(url_for('principal.ajouter_mairie'))
+
+    try:
+        rapport = importation.importer_mairies(
+            get_db_connection(), importation.lire_lignes(fichier.stream, fichier.filename), hacheur,
+            request.form.get('mdp_initial'), current_app.config['IMPORT_LIGNES_MAX'])
+    except importation.ImportationInvalide as e:
+        flash(f"❌ {e}")
+        return redirect(url_for('principal.ajouter_mairie'))
+    return render_template('rapport_import.html', titre="Import des mairies et référents", rapport=rapport,
+                           retour=url_for('principal.ajouter_mairie'))
+
+@principal.route('/admin/supprimer-mairie/<int:mairie_id>', methods=['POST'])
 @login_required
 def supprimer_mairie(mairie_id):
     # Sécurité : Seul l'admin peut supprimer une mairie
     if current_user.role != 'admin_prestataire':
         flash("Accès refusé.")
-        return redirect(url_for('login'))
+        return redirect(url_for('principal.login'))
 
     conn = get_db_connection()
     
@@ -265,10 +700,9 @@ def supprimer_mairie(mairie_id):
         conn.commit()
         flash("Mairie supprimée avec succès.")
     
-    conn.close()
-    return redirect(url_for('ajouter_mairie'))
+    return redirect(url_for('principal.ajouter_mairie'))
 
-@app.route('/admin/nouveau-referent/<int:mairie_id>', methods=['GET', 'POST'])
+@principal.route('/admin/nouveau-referent/<int:mairie_id>', methods=['GET', 'POST'])
 @login_required
 def ajouter_referent(mairie_id):
     if request.method == 'POST':
@@ -280,32 +714,30 @@ def ajouter_referent(mairie_id):
         # Validation du format d'email
         if not valider_format_strict_email(email, prenom, nom):
             flash(f"Format d'email invalide. Utilisez {prenom.lower()}.{nom.lower()}@... (gmail.com ou .fr)")
-            return redirect(url_for('ajouter_referent', mairie_id=mairie_id))
+            return redirect(url_for('principal.ajouter_referent', mairie_id=mairie_id))
 
         conn = get_db_connection()
         try:
             conn.execute('''
                 INSERT INTO usager (nom, prenom, email, mdp, role, mairie_id) 
                 VALUES (?, ?, ?, ?, 'referent', ?)
-            ''', (nom, prenom, email, mdp, mairie_id))
+            ''', (nom, prenom, email, hacheur.hacher(mdp), mairie_id))
             conn.commit()
             flash("Compte référent créé avec succès.")
         except sqlite3.IntegrityError:
             flash("Erreur : Cette adresse email est déjà utilisée.")
-        finally:
-            conn.close()
         
-        return redirect(url_for('menu_admin'))
+        return redirect(url_for('principal.menu_admin'))
         
     return render_template('ajouter_referent.html', mairie_id=mairie_id)
 
-@app.route('/admin/equipe', methods=['GET', 'POST'])
+@principal.route('/admin/equipe', methods=['GET', 'POST'])
 @login_required
 def gestion_equipe():
     # Sécurité : seul l'admin prestataire peut accéder
     if current_user.role != 'admin_prestataire':
         flash("Accès refusé.")
-        return redirect(url_for('login'))
+        return redirect(url_for('principal.login'))
 
     conn = get_db_connection()
 
@@ -324,7 +756,7 @@ def gestion_equipe():
                 conn.execute('''
                     INSERT INTO usager (nom, prenom, email, mdp, role, premier_login) 
                     VALUES (?, ?, ?, ?, ?, 1)
-                ''', (nom, prenom, email, mdp, role))
+                ''', (nom, prenom, email, hacheur.hacher(mdp), role))
                 conn.commit()
                 flash(f"Membre {prenom} {nom} ajouté avec succès !")
             except sqlite3.IntegrityError:
@@ -337,15 +769,14 @@ def gestion_equipe():
         WHERE role IN ('technicien', 'admin_prestataire')
     ''').fetchall()
     
-    conn.close()
     return render_template('gestion_equipe.html', equipe=equipe)
 # --- ROUTES RÉFÉRENT MAIRIE ---
 
-@app.route('/referent/dashboard')
+@principal.route('/referent/dashboard')
 @login_required
 def dashboard_referent():
     if current_user.role not in ['referent', 'référent']:
-        return redirect(url_for('login'))
+        return redirect(url_for('principal.login'))
 
     conn = get_db_connection()
     
@@ -356,19 +787,25 @@ def dashboard_referent():
         WHERE mairie_id = ? AND role = 'personnel_mairie'
     ''', (current_user.mairie_id,)).fetchall()
 
-    # On récupère aussi les tickets (on garde la jointure pour avoir le service du demandeur)
-    tickets = conn.execute('''
+    tableau = cache_fragments.rendre(
+        'dashboard_referent', 'mairie', current_user.mairie_id,
+        lambda: render_template('tableau_tickets_referent.html',
+                                tickets=tickets_referent(conn, current_user.mairie_id)))
+    return render_template('dashboard_referent.html', membres=membres, tableau_tickets=tableau)
+
+def tickets_referent(conn, mairie_id):
+    # On récupère aussi les tickets (on garde la jointure pour avoir le service du demandeur).
+    # Un ticket reste rattaché à la mairie où il a été créé (t.mairie_id), même si son
+    # auteur ou le référent change ensuite de mairie (importer_mairies).
+    return conn.execute('''
         SELECT t.*, u.nom as demandeur, u.service 
         FROM ticket t 
         JOIN usager u ON t.createur_id = u.id 
-        WHERE u.mairie_id = ? 
+        WHERE t.mairie_id = ? 
         ORDER BY t.date_creation DESC
-    ''', (current_user.mairie_id,)).fetchall()
-    
-    conn.close()
-    return render_template('dashboard_referent.html', membres=membres, tickets=tickets)
+    ''', (mairie_id,)).fetchall()
 
-@app.route('/referent/ajouter-personnel', methods=['POST'])
+@principal.route('/referent/ajouter-personnel', methods=['POST'])
 @login_required
 def ajouter_personnel_referent():
     nom = request.form.get('nom')
@@ -380,29 +817,48 @@ def ajouter_personnel_referent():
     # Validation du format d'email
     if not valider_format_strict_email(email, prenom, nom):
         flash("L'email doit correspondre au nom/prénom et finir par gmail.com ou .fr")
-        return redirect(url_for('dashboard_referent'))
+        return redirect(url_for('principal.dashboard_referent'))
 
     conn = get_db_connection()
     try:
         conn.execute('''
            INSERT INTO usager (nom, prenom, email, mdp, role, mairie_id, service) 
             VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (nom, prenom, email, mdp, 'personnel_mairie', current_user.mairie_id, service))
+        ''', (nom, prenom, email, hacheur.hacher(mdp), 'personnel_mairie', current_user.mairie_id, service))
         conn.commit()
         flash("Nouveau personnel mairie ajouté.")
     except sqlite3.IntegrityError:
         flash("Erreur : Cet email existe déjà.")
-    finally:
-        conn.close()
     
-    return redirect(url_for('dashboard_referent'))
+    return redirect(url_for('principal.dashboard_referent'))
+
+@principal.route('/referent/importer-personnel', methods=['POST'])
+@login_required
+def importer_personnel_referent():
+    # Fichier CSV/XLSX : prenom, nom, email, service et éventuellement mdp
+    if current_user.role not in ['referent', 'référent']:
+        return redirect(url_for('principal.login'))
+    fichier = request.files.get('fichier')
+    if not fichier or not fichier.filename:
+        flash("Choisissez un fichier CSV ou XLSX.")
+        return redirect(url_for('principal.dashboard_referent'))
+
+    try:
+        rapport = importation.importer_personnel(
+            get_db_connection(), importation.lire_lignes(fichier.stream, fichier.filename),
+            current_user.mairie_id, hacheur, request.form.get('mdp_initial'), current_app.config['IMPORT_LIGNES_MAX'])
+    except importation.ImportationInvalide as e:
+        flash(f"❌ {e}")
+        return redirect(url_for('principal.dashboard_referent'))
+    return render_template('rapport_import.html', titre="Import du personnel", rapport=rapport,
+                           retour=url_for('principal.dashboard_referent'))
 
-@app.route('/referent/supprimer-personnel/<int:user_id>', methods=['POST'])
+@principal.route('/referent/supprimer-personnel/<int:user_id>', methods=['POST'])
 @login_required
 def supprimer_personnel(user_id):
     # Sécurité : seul le référent peut supprimer
     if current_user.role not in ['referent', 'référent']:
-        return redirect(url_for('login'))
+        return redirect(url_for('principal.login'))
 
     conn = get_db_connection()
     
@@ -413,42 +869,52 @@ def supprimer_personnel(user_id):
     if membre:
         conn.execute('DELETE FROM usager WHERE id = ?', (user_id,))
         conn.commit()
+        invalider_usager(user_id)
         flash(f"L'agent {membre['prenom']} {membre['nom']} a été supprimé.")
     else:
         flash("Erreur : Vous n'avez pas l'autorisation de supprimer ce profil.")
         
-    conn.close()
-    return redirect(url_for('dashboard_referent'))
+    return redirect(url_for('principal.dashboard_referent'))
 
 # --- ROUTES TECHNICIEN ---
 
-@app.route('/technicien/mes-tickets')
+@principal.route('/technicien/mes-tickets')
 @login_required
 def dashboard_technicien():
-    conn = get_db_connection()
-    mes_interventions = conn.execute('''
+    # Aucune connexion SQL si le tableau de ce technicien est à jour en cache
+    tableau = cache_fragments.rendre(
+        'dashboard_technicien', 'technicien', current_user.id,
+        lambda: render_template('tableau_tickets_technicien.html',
+                                tickets=tickets_technicien(get_db_connection(), current_user.id)))
+    return render_template('dashboard_technicien.html', tableau_tickets=tableau)
+
+def tickets_technicien(conn, technicien_id):
+    return conn.execute('''
         SELECT t.*, strftime('%d/%m/%Y', t.date_creation) as date_formatee, 
                u.nom as demandeur, u.service 
         FROM ticket t 
         JOIN usager u ON t.createur_id = u.id 
         WHERE t.technicien_id = ? 
         ORDER BY t.date_creation DESC
-    ''', (current_user.id,)).fetchall()
-    conn.close()
-    return render_template('dashboard_technicien.html', tickets=mes_interventions)
+    ''', (technicien_id,)).fetchall()
 
 # --- ROUTES AGENTS MAIRIE ---
 
-@app.route('/mairie/dashboard')
+@principal.route('/mairie/dashboard')
 @login_required
 def espace_mairie():
-    conn = get_db_connection()
-    mes_tickets = conn.execute('SELECT *, strftime("%d/%m/%Y", date_creation) as date_formatee FROM ticket WHERE createur_id = ? ORDER BY date_creation DESC', 
-                               (current_user.id,)).fetchall()
-    conn.close()
-    return render_template('espace_mairie.html', tickets=mes_tickets)
+    tableau = cache_fragments.rendre(
+        'espace_mairie', 'createur', current_user.id,
+        lambda: render_template('tableau_tickets_mairie.html',
+                                tickets=tickets_createur(get_db_connection(), current_user.id)))
+    return render_template('espace_mairie.html', tableau_tickets=tableau)
+
+
+def tickets_createur(conn, createur_id):
+    return conn.execute('SELECT *, strftime("%d/%m/%Y", date_creation) as date_formatee FROM ticket WHERE createur_id = ? ORDER BY date_creation DESC', 
+                        (createur_id,)).fetchall()
 
-@app.route('/mairie/nouveau-ticket', methods=['GET', 'POST'])
+@principal.route('/mairie/nouveau-ticket', methods=['GET', 'POST'])
 @login_required
 def nouveau_ticket():
     if request.method == 'POST':
@@ -458,131 +924,200 @@ def nouveau_ticket():
         
         conn = get_db_connection()
         conn.execute('''
-            INSERT INTO ticket (titre, description, type_prestation, createur_id, statut) 
-            VALUES (?, ?, ?, ?, ?)
-        ''', (titre, description, type_p, current_user.id, 'Nouveau'))
+            INSERT INTO ticket (titre, description, type_prestation, createur_id, mairie_id, statut) 
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (titre, description, type_p, current_user.id, current_user.mairie_id, 'Nouveau'))
         conn.commit()
-        conn.close()
         if current_user.role in ['referent', 'référent']:
             flash("Ticket créé avec succès.")
-            return redirect(url_for('dashboard_referent'))
+            return redirect(url_for('principal.dashboard_referent'))
         
-        return redirect(url_for('espace_mairie'))
+        return redirect(url_for('principal.espace_mairie'))
         
     return render_template('nouveau_ticket.html')
 
-from datetime import datetime
+# --- API JSON DES TABLEAUX DE BORD ---
+# Mêmes données que les pages HTML, pour les écrans de suivi qui interrogent en boucle.
+# L'ETag est la version des tickets de la portée, tenue par les triggers : un 304 ne coûte
+# qu'une lecture de clé primaire, quel que soit le nombre de tickets de la portée.
+
+def version_tickets(conn, portee=None, ident=None):
+    """Version des tickets d'une portée : change à chaque ajout, modification ou suppression.
+
+    Avec une portée ('technicien', 'createur', 'mairie'), c'est sa ligne de cache_version
+    (la même que pour les fragments) ; sans portée, le compteur global de la table ticket.
+    """
+    if portee is None:
+        return str(conn.execute("SELECT valeur FROM compteur WHERE nom = 'ticket'").fetchone()[0])
+    return str(versions_cache.version(portee, ident))
+
+def reponse_api(etag, charger):
+    """304 si le client a déjà cette version, sinon le JSON produit par charger()."""
+    if etag in request.if_none_match:
+        reponse = current_app.response_class(status=304)
+    else:
+        reponse = jsonify(charger())
+    reponse.set_etag(etag)
+    # Le client garde sa copie mais revalide à chaque fois
+    reponse.headers['Cache-Control'] = 'private, no-cache'
+    return reponse
 
-@app.template_filter('to_datetime')
-def to_datetime_filter(s):
-    if not s: return None
+def refus_api():
+    return jsonify({'erreur': "Accès refusé."}), 403
+
+@principal.route('/api/v1/technicien/tickets')
+@login_required
+def api_tickets_technicien():
+    if current_user.role not in ['technicien', None]:
+        return refus_api()
+    conn = get_db_connection()
+    version = version_tickets(conn, 'technicien', current_user.id)
+    return reponse_api(f"tech{current_user.id}-{version}", lambda: {
+        'version': version,
+        'tickets': [dict(t) for t in tickets_technicien(conn, current_user.id)],
+    })
+
+@principal.route('/api/v1/mairie/tickets')
+@login_required
+def api_tickets_mairie():
+    if current_user.role not in ['personnel_mairie', 'referent', 'référent']:
+        return refus_api()
+    conn = get_db_connection()
+    version = version_tickets(conn, 'createur', current_user.id)
+    return reponse_api(f"agent{current_user.id}-{version}", lambda: {
+        'version': version,
+        'tickets': [dict(t) for t in tickets_createur(conn, current_user.id)],
+    })
+
+@principal.route('/api/v1/referent/tickets')
+@login_required
+def api_tickets_referent():
+    if current_user.role not in ['referent', 'référent']:
+        return refus_api()
+    conn = get_db_connection()
+    version = version_tickets(conn, 'mairie', current_user.mairie_id)
+    return reponse_api(f"mairie{current_user.mairie_id}-{version}", lambda: {
+        'version': version,
+        'tickets': [dict(t) for t in tickets_referent(conn, current_user.mairie_id)],
+    })
+
+@principal.route('/api/v1/admin/tickets')
+@login_required
+def api_tickets_admin():
+    # Mêmes filtres et même pagination que /admin/prestations
+    if current_user.role != 'admin_prestataire':
+        return refus_api()
+    filtres, conditions, params = filtres_tickets_admin(request.args)
+    taille = taille_page(request.args)
+    curseur = lire_curseur(request.args.get('curseur'))
+
+    conn = get_db_connection()
+    # Aucune version par statut, contrat ou période : le compteur global change à chaque
+    # écriture sur ticket, donc avec toute page filtrée (au prix de 304 moins fréquents)
+    version = version_tickets(conn)
+    if 'en_retard' in filtres:
+        # Un ticket devient en retard sans être modifié : la version change avec la minute
+        version += datetime.now().strftime('-%H%M')
+    # Une page = des filtres et un curseur : ils font partie de l'ETag
+    portee = zlib.crc32(request.query_string)
+    def charger():
+        tickets, curseur_suivant = page_tickets_admin(conn, conditions, params, curseur, taille)
+        return {'version': version, 'filtres': filtres, 'taille': taille,
+                'curseur_suivant': curseur_suivant, 'tickets': [dict(t) for t in tickets]}
+    return reponse_api(f"admin{portee:x}-{version}", charger)
+
+def portee_recherche():
+    """Tickets visibles dans la recherche : (condition SQL sur t, paramètres)."""
+    if current_user.role == 'admin_prestataire':
+        return None, ()
+    if current_user.role in ['referent', 'référent']:
+        return "t.mairie_id = ?", (current_user.mairie_id,)
+    if current_user.role == 'personnel_mairie':
+        return "t.createur_id = ?", (current_user.id,)
+    return "t.technicien_id = ?", (current_user.id,)
+
+def lire_jour(valeur):
+    """'AAAA-MM-JJ' -> la même chaîne, ou None si absente ou illisible."""
     try:
-        # SQLite stocke souvent sous ce format : 2023-10-27 14:30:00
-        return datetime.strptime(s, '%Y-%m-%d %H:%M:%S')
-    except:
+        return datetime.strptime(valeur, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
         return None
-        
+
+def resultats_recherche():
+    """Une page de résultats et de quoi l'afficher : q, page, tickets, page_suivante, tronque..."""
+    texte = request.args.get('q', '').strip()
+    page = max(1, min(request.args.get('page', 1, type=int), current_app.config['RECHERCHE_PAGES_MAX']))
+    taille = current_app.config['RECHERCHE_PAR_PAGE']
+    candidats = current_app.config['RECHERCHE_CANDIDATS']
+    condition, params = portee_recherche()
+    conditions, params = ([condition] if condition else []), list(params)
+    # Période de création (du / au inclus) : quand la recherche est tronquée, elle atteint les plus anciens
+    du, au = lire_jour(request.args.get('du')), lire_jour(request.args.get('au'))
+    if du:
+        conditions.append("t.date_creation >= ?")
+        params.append(du)
+    if au:
+        conditions.append("t.date_creation < date(?, '+1 day')")
+        params.append(au)
+    # Une ligne de plus que demandé indique qu'il existe une page suivante
+    tickets, tronque = recherche.rechercher(get_db_connection(), texte, ' AND '.join(conditions) or None, params,
+                                            taille + 1, (page - 1) * taille, candidats)
+    return {'q': texte, 'du': du, 'au': au, 'page': page, 'page_suivante': len(tickets) > taille,
+            'tronque': tronque, 'candidats': candidats, 'tickets': tickets[:taille]}
+
+@principal.route('/api/v1/tickets/recherche')
+@login_required
+def api_recherche_tickets():
+    return jsonify(resultats_recherche())
+
+@principal.route('/recherche')
+@login_required
+def recherche_tickets():
+    return render_template('recherche.html', **resultats_recherche())
+
+from datetime import datetime
+
 from flask import send_file
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-import io
-@app.route('/admin/rapport-mensuel')
+
+@principal.route('/admin/rapport-mensuel')
 @login_required
 def generer_rapport_pdf():
-    conn = get_db_connection()
-    
-    # Requête complète pour avoir toutes les infos avant suppression
-    tickets = conn.execute('''
-        SELECT t.*, 
-               u.nom as demandeur, 
-               m.nom as nom_mairie, 
-               m.ville as ville_mairie,
-               tech.prenom as tech_prenom, 
-               tech.nom as tech_nom
-        FROM ticket t
-        JOIN usager u ON t.createur_id = u.id
-        JOIN mairie m ON u.mairie_id = m.id
-        LEFT JOIN usager tech ON t.technicien_id = tech.id
-        WHERE strftime('%m', t.date_creation) = strftime('%m', 'now')
-    ''').fetchall()
+    if current_user.role != 'admin_prestataire':
+        flash("Accès refusé.")
+        return redirect(url_for('principal.login'))
+    # Période : ?mois=AAAA-MM, ?trimestre=AAAA-T1, ?du=AAAA-MM-JJ&au=AAAA-MM-JJ (défaut : mois en cours)
+    try:
+        periode = rapports.periode(request.args.get('mois'), request.args.get('trimestre'),
+                                   request.args.get('du'), request.args.get('au'))
+    except rapports.PeriodeInvalide as e:
+        flash(f"❌ {e}")
+        return redirect(url_for('principal.prestations_admin'))
 
-    # --- NETTOYAGE APRÈS RÉCUPÉRATION ---
-    # On supprime les tickets terminés de plus de 30 jours
-    conn.execute("DELETE FROM ticket WHERE statut = 'Terminé' AND date_fin < datetime('now', '-30 days')")
-    conn.commit()
-    conn.close()
-
-    # --- GÉNÉRATION DU PDF ---
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=18)
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Titre avec le mois actuel
-    import datetime
-    mois_actuel = datetime.datetime.now().strftime("%B %Y")
-    elements.append(Paragraph(f"Rapport d'Interventions - {mois_actuel}", styles['Title']))
-    elements.append(Spacer(1, 12))
-
-    # Entête du tableau (ajout de la colonne Mairie)
-    data = [['Date', 'Mairie / Ville', 'Sujet', 'Intervenant', 'Contrat', 'SLA']]
-    
-    for t in tickets:
-        # Calcul du SLA
-        sla_info = "OK"
-        if t['statut'] == 'Terminé' and t['date_fin']:
-            # Utilisation de notre logique de calcul de délai
-            debut = datetime.datetime.strptime(t['date_creation'], '%Y-%m-%d %H:%M:%S')
-            fin = datetime.datetime.strptime(t['date_fin'], '%Y-%m-%d %H:%M:%S')
-            diff = (fin - debut).total_seconds() / 3600
-            limite = 4 if t['contrat'] == 'Gold' else 24 if t['contrat'] == 'Silver' else 72
-            if diff > limite:
-                sla_info = f"RETARD (+{int(diff-limite)}h)"
-
-        data.append([
-            t['date_creation'][:10],
-            f"{t['nom_mairie']}\n({t['ville_mairie']})",
-            t['titre'][:20],
-            f"{t['tech_prenom']} {t['tech_nom'][0] if t['tech_nom'] else ''}.",
-            t['contrat'] if t['contrat'] else "-",
-            sla_info
-        ])
-
-    # Configuration du tableau (ajustement des largeurs)
-    table = Table(data, colWidths=[60, 100, 110, 90, 60, 80])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.whitesmoke])
-    ]))
-    
-    elements.append(table)
-    doc.build(elements)
-    
-    buffer.seek(0)
-    return send_file(buffer, as_attachment=True, download_name=f"Rapport_{mois_actuel}.pdf", mimetype='application/pdf')
+    rapports_jobs = current_app.extensions['rapports']
+    version = rapports.version_donnees(get_db_connection(), periode)
 
+    # Déjà généré pour cette version des données : on resert le fichier (ETag + Content-Length)
+    chemin = rapports_jobs.chemin(periode, version)
+    if os.path.exists(chemin):
+        return send_file(chemin, as_attachment=True, download_name=f"Rapport_{periode['cle']}.pdf",
+                         mimetype='application/pdf', etag=f"{periode['cle']}-{version}", conditional=True)
 
-def valider_securite_mdp(mdp):
-    """
-    Vérifie la force du mot de passe :
-    - 8 caractères minimum
-    - Au moins une majuscule
-    - Au moins une minuscule
-    - Au moins un chiffre
-    - Au moins un caractère spécial (@$!%*?&)
-    """
-    pattern = r"^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[@$!%*?&])[A-Za-z\d@$!%*?&]{8,}$"
-    return re.match(pattern, mdp) is not None
+    # Sinon la génération part en tâche de fond ; la page d'attente se recharge toute seule
+    job = rapports_jobs.demander(periode, version)
+    return render_template('rapport_attente.html', job=job), 202
 
-@app.route('/profil/modifier-mdp', methods=['GET', 'POST'])
+@principal.route('/admin/rapports/<job_id>')
+@login_required
+def etat_rapport(job_id):
+    if current_user.role != 'admin_prestataire':
+        return refus_api()
+    job = current_app.extensions['rapports'].etat(job_id)
+    if job is None:
+        return jsonify({'erreur': 'job inconnu'}), 404
+    return jsonify(job)
+
+
+@principal.route('/profil/modifier-mdp', methods=['GET', 'POST'])
 @login_required
 def modifier_mdp():
     if request.method == 'POST':
@@ -591,11 +1126,11 @@ def modifier_mdp():
 
         if nouveau_mdp != confirmation:
             flash("❌ Les mots de passe ne correspondent pas.")
-            return redirect(url_for('modifier_mdp'))
+            return redirect(url_for('principal.modifier_mdp'))
 
         if not valider_securite_mdp(nouveau_mdp):
             flash("❌ Le mot de passe n'est pas assez sécurisé.")
-            return redirect(url_for('modifier_mdp'))
+            return redirect(url_for('principal.modifier_mdp'))
 
         conn = get_db_connection()
         # CETTE LIGNE EST CRUCIALE : on change le MDP ET on passe premier_login à 0
@@ -603,20 +1138,23 @@ def modifier_mdp():
             UPDATE usager 
             SET mdp = ?, premier_login = 0 
             WHERE id = ?
-        ''', (nouveau_mdp, current_user.id))
+        ''', (hacheur.hacher(nouveau_mdp), current_user.id))
         
         conn.commit()
-        conn.close()
+        invalider_usager(current_user.id)
 
         flash("✅ Mot de passe mis à jour ! Veuillez vous reconnecter.")
-        return redirect(url_for('logout')) # On déconnecte pour valider le nouveau MDP
+        return redirect(url_for('principal.logout')) # On déconnecte pour valider le nouveau MDP
 
     return render_template('modifier_mdp.html')
 
-@app.route('/mot-de-passe-oublie', methods=['GET', 'POST'])
+@principal.route('/mot-de-passe-oublie', methods=['GET', 'POST'])
 def mdp_oublie():
     if request.method == 'POST':
         email = request.form.get('email')
+        refus = trop_de_tentatives('mdp_oublie', email, 'mdp_oublie_demande.html')
+        if refus:
+            return refus
         conn = get_db_connection()
         user = conn.execute('SELECT * FROM usager WHERE email = ?', (email,)).fetchone()
         
@@ -625,28 +1163,32 @@ def mdp_oublie():
             code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
             conn.execute('UPDATE usager SET code_recup = ? WHERE email = ?', (code, email))
             conn.commit()
-            conn.close()
             
             # Simulation d'envoi de mail via Flash
             flash(f"🔑 [SIMULATION MAIL] Votre code de récupération est : {code}")
-            return redirect(url_for('reinitialiser_mdp', email=email))
+            return redirect(url_for('principal.reinitialiser_mdp', email=email))
         
-        conn.close()
         flash("Si cet email est reconnu, un code vous a été envoyé.")
-        return redirect(url_for('login'))
+        return redirect(url_for('principal.login'))
         
     return render_template('mdp_oublie_demande.html')
 
-@app.route('/reinitialiser-mdp/<email>', methods=['GET', 'POST'])
+@principal.route('/reinitialiser-mdp/<email>', methods=['GET', 'POST'])
 def reinitialiser_mdp(email):
     if request.method == 'POST':
         code_saisi = request.form.get('code')
         nouveau_mdp = request.form.get('nouveau_mdp')
         confirmation = request.form.get('confirmation_mdp')
+
+        # Le code de récupération ne fait que 6 caractères : même limite que la connexion
+        refus = trop_de_tentatives('reinitialiser_mdp', email, 'mdp_oublie_reset.html', email=email)
+        if refus:
+            return refus
         
+
         if nouveau_mdp != confirmation:
             flash("❌ Les mots de passe ne correspondent pas.")
-            return redirect(url_for('reinitialiser_mdp', email=email))
+            return redirect(url_for('principal.reinitialiser_mdp', email=email))
 
         conn = get_db_connection()
         user = conn.execute('SELECT * FROM usager WHERE email = ? AND code_recup = ?', 
@@ -656,16 +1198,16 @@ def reinitialiser_mdp(email):
             if valider_securite_mdp(nouveau_mdp):
                 # Mise à jour du MDP et suppression du code temporaire
                 conn.execute('UPDATE usager SET mdp = ?, code_recup = NULL WHERE email = ?', 
-                             (nouveau_mdp, email))
+                             (hacheur.hacher(nouveau_mdp), email))
+
                 conn.commit()
-                conn.close()
+                invalider_usager(user['id'])
                 flash("✅ Mot de passe réinitialisé ! Vous pouvez vous connecter.")
-                return redirect(url_for('login'))
+                return redirect(url_for('principal.login'))
             else:
                 flash("❌ Le mot de passe ne respecte pas les règles de sécurité.")
         else:
             flash("❌ Code de validation incorrect.")
-        conn.close()
             
     return render_template('mdp_oublie_reset.html', email=email)
     
@@ -675,4 +1217,5 @@ def reinitialiser_mdp(email):
     
    
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Serveur de développement ; debug via MAIRIE_DEBUG=true. En production : wsgi.py
+    create_app().run()
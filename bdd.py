@@ -0,0 +1,200 @@
+"""Accès à la base SQLite : pool de connexions par worker, une connexion par requête."""
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g
+
+
+# Profils de PRAGMA appliqués à chaque connexion ouverte par l'application.
+# cache_size négatif = taille en Kio ; mmap_size en octets.
+PROFILS_PRAGMA = {
+    'dev': {
+        'busy_timeout': 5000,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -8000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+    },
+    'production': {
+        'busy_timeout': 10000,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
+    # Mesures de débit uniquement : synchronous=OFF ne survit pas à une coupure
+    'bench': {
+        'busy_timeout': 30000,
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -256000,
+        'mmap_size': 1073741824,
+        'temp_store': 'MEMORY',
+    },
+}
+
+_NOMS_SYNCHRONOUS = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+_NOMS_TEMP_STORE = {0: 'DEFAULT', 1: 'FILE', 2: 'MEMORY'}
+
+
+def resoudre_pragmas(profil, surcharges=None):
+    """Fusionne un profil nommé avec d'éventuelles surcharges {pragma: valeur}."""
+    if profil not in PROFILS_PRAGMA:
+        raise ValueError(f"Profil SQLite inconnu : {profil} (choix : {', '.join(PROFILS_PRAGMA)})")
+    pragmas = dict(PROFILS_PRAGMA[profil])
+    pragmas.update(surcharges or {})
+    return pragmas
+
+
+def appliquer_pragmas(conn, pragmas):
+    # busy_timeout en premier pour que le passage en WAL attende un éventuel verrou
+    for nom in sorted(pragmas, key=lambda n: n != 'busy_timeout'):
+        conn.execute(f"PRAGMA {nom} = {pragmas[nom]}")
+
+
+def lire_pragmas(conn, noms):
+    """Valeurs réellement en vigueur sur la connexion (lisibles pour un humain)."""
+    effectifs = {}
+    for nom in noms:
+        valeur = conn.execute(f"PRAGMA {nom}").fetchone()[0]
+        if nom == 'synchronous':
+            valeur = _NOMS_SYNCHRONOUS.get(valeur, valeur)
+        elif nom == 'temp_store':
+            valeur = _NOMS_TEMP_STORE.get(valeur, valeur)
+        elif nom == 'journal_mode':
+            valeur = valeur.upper()
+        effectifs[nom] = valeur
+    return effectifs
+
+
+class PoolSature(Exception):
+    """Aucune connexion ne s'est libérée avant la fin du délai d'attente."""
+
+
+class PoolConnexions:
+    """Garde un nombre borné de connexions SQLite ouvertes ("chaudes") pour ce worker."""
+
+    def __init__(self, chemin, taille_max=8, attente_max=10.0, pragmas=None):
+        self.chemin = chemin
+        self.pragmas = pragmas or {}
+        self.taille_max = taille_max
+        self.attente_max = attente_max
+        self._libres = []
+        self._ouvertes = 0
+        self._condition = threading.Condition()
+        self._stats = {'hits': 0, 'creations': 0, 'attentes': 0, 'saturations': 0}
+
+    def _ouvrir(self):
+        # check_same_thread=False : une connexion peut servir des requêtes
+        # successives traitées par des threads différents (jamais en même temps).
+        conn = sqlite3.connect(self.chemin, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        appliquer_pragmas(conn, self.pragmas)
+        return conn
+
+    def acquerir(self):
+        with self._condition:
+            if not self._libres and self._ouvertes >= self.taille_max:
+                self._stats['attentes'] += 1
+                debut = time.monotonic()
+                while not self._libres and self._ouvertes >= self.taille_max:
+                    reste = self.attente_max - (time.monotonic() - debut)
+                    if reste <= 0:
+                        self._stats['saturations'] += 1
+                        raise PoolSature(f"Pool SQLite saturé ({self.taille_max} connexions)")
+                    self._condition.wait(reste)
+            if self._libres:
+                self._stats['hits'] += 1
+                return self._libres.pop()
+            # On réserve la place avant d'ouvrir, l'ouverture se fait hors verrou
+            self._ouvertes += 1
+            self._stats['creations'] += 1
+        try:
+            return self._ouvrir()
+        except Exception:
+            with self._condition:
+                self._ouvertes -= 1
+                self._condition.notify()
+            raise
+
+    def liberer(self, conn):
+        try:
+            # Une requête qui a planté ne doit pas laisser de transaction ouverte
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._condition:
+                self._ouvertes -= 1
+                self._condition.notify()
+            return
+        with self._condition:
+            self._libres.append(conn)
+            self._condition.notify()
+
+    def apres_fork(self):
+        """À appeler dans un process fils (worker préchargé) : repart d'un pool vide.
+
+        SQLite interdit d'utiliser une connexion à travers un fork. Celles héritées
+        du process parent sont abandonnées sans être fermées : les fermer ici
+        relâcherait des verrous qui appartiennent au parent.
+        """
+        self._heritees = self._libres
+        self._libres = []
+        self._ouvertes = 0
+        self._condition = threading.Condition()
+
+    def fermer_tout(self):
+        with self._condition:
+            for conn in self._libres:
+                conn.close()
+            self._ouvertes -= len(self._libres)
+            self._libres.clear()
+
+    def statistiques(self):
+        with self._condition:
+            return dict(self._stats,
+                        ouvertes=self._ouvertes,
+                        libres=len(self._libres),
+                        taille_max=self.taille_max)
+
+
+def get_db_connection():
+    """Renvoie la connexion de la requête courante (prise dans le pool au premier appel)."""
+    if 'db' not in g:
+        g.db = current_app.extensions['pool_sqlite'].acquerir()
+    return g.db
+
+
+def fermer_connexion(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        current_app.extensions['pool_sqlite'].liberer(conn)
+
+
+def init_app(app):
+    app.config.setdefault('DATABASE', 'mairie.db')
+    app.config.setdefault('POOL_TAILLE', 8)
+    app.config.setdefault('POOL_ATTENTE', 10.0)
+    app.config.setdefault('SQLITE_PROFIL', 'dev')
+    app.config.setdefault('SQLITE_PRAGMAS', {})
+    pragmas = resoudre_pragmas(app.config['SQLITE_PROFIL'], app.config['SQLITE_PRAGMAS'])
+    pool = PoolConnexions(app.config['DATABASE'],
+                          app.config['POOL_TAILLE'],
+                          app.config['POOL_ATTENTE'],
+                          pragmas)
+    app.extensions['pool_sqlite'] = pool
+    app.teardown_appcontext(fermer_connexion)
+
+    # Première connexion ouverte dès le démarrage : elle passe la base en WAL
+    # et permet de journaliser ce que SQLite a réellement accepté.
+    conn = pool.acquerir()
+    try:
+        effectifs = lire_pragmas(conn, pragmas)
+    finally:
+        pool.liberer(conn)
+    app.logger.info("SQLite %s profil=%s %s", app.config['DATABASE'], app.config['SQLITE_PROFIL'],
+                    " ".join(f"{nom}={valeur}" for nom, valeur in effectifs.items()))
@@ -0,0 +1,257 @@
+"""Caches de l'application et versions partagées qui les invalident entre workers.
+
+Trois stockages au choix (CACHE_BACKEND) offrent la même interface lire /
+ecrire / invalider / vider / statistiques :
+- 'memoire' : CacheLRU, propre à chaque worker ;
+- 'sqlite'  : CacheSQLite, un fichier (CACHE_CHEMIN) partagé par les workers
+  de la machine, donc une seule copie en mémoire ;
+- 'nul'     : CacheNul, ne garde rien (mesures, débogage).
+
+Quel que soit le stockage, la validité d'une entrée est décidée par une
+version de portée ('mairie', 2), ('usager', 7)... tenue par des triggers dans
+mairie.db (table cache_version, migration 10), donc incrémentée dans la
+transaction même de l'écriture, quel que soit le worker ou la commande qui
+l'a faite. VersionsPartagees relit ces versions dès que PRAGMA data_version
+signale une écriture d'une autre connexion.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_ABSENT = object()
+
+
+class CacheLRU:
+    """Cache borné : éviction LRU au-delà de taille_max, expiration après ttl secondes (None = jamais)."""
+
+    def __init__(self, taille_max=1024, ttl=None):
+        self.taille_max = taille_max
+        self.ttl = ttl
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+        self._stats = {'hits': 0, 'miss': 0, 'evictions': 0, 'expirations': 0}
+
+    def lire(self, cle, defaut=None):
+        with self._verrou:
+            entree = self._entrees.get(cle, _ABSENT)
+            if entree is _ABSENT:
+                self._stats['miss'] += 1
+                return defaut
+            valeur, expire_a = entree
+            if expire_a is not None and expire_a <= time.monotonic():
+                del self._entrees[cle]
+                self._stats['expirations'] += 1
+                self._stats['miss'] += 1
+                return defaut
+            self._entrees.move_to_end(cle)
+            self._stats['hits'] += 1
+            return valeur
+
+    def ecrire(self, cle, valeur):
+        expire_a = time.monotonic() + self.ttl if self.ttl else None
+        with self._verrou:
+            self._entrees[cle] = (valeur, expire_a)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalider(self, cle):
+        with self._verrou:
+            self._entrees.pop(cle, None)
+
+    def vider(self):
+        with self._verrou:
+            self._entrees.clear()
+
+    def statistiques(self):
+        with self._verrou:
+            lectures = self._stats['hits'] + self._stats['miss']
+            return dict(self._stats,
+                        taille=len(self._entrees),
+                        taille_max=self.taille_max,
+                        taux_hits=round(self._stats['hits'] / lectures, 3) if lectures else None)
+
+
+class CacheNul:
+    """Stockage qui ne garde rien : chaque lecture est un miss."""
+
+    def __init__(self, *args, **kwargs):
+        self._verrou = threading.Lock()
+        self._stats = {'hits': 0, 'miss': 0}
+
+    def lire(self, cle, defaut=None):
+        with self._verrou:
+            self._stats['miss'] += 1
+        return defaut
+
+    def ecrire(self, cle, valeur):
+        pass
+
+    def invalider(self, cle):
+        pass
+
+    def vider(self):
+        pass
+
+    def statistiques(self):
+        with self._verrou:
+            return dict(self._stats, taille=0, taux_hits=0.0 if self._stats['miss'] else None)
+
+
+class CacheSQLite:
+    """Stockage partagé par les workers dans un fichier SQLite à part (jetable, hors de mairie.db).
+
+    Les valeurs sont sérialisées par pickle : le fichier ne doit être
+    accessible qu'à l'application. Au-delà de taille_max entrées, les plus
+    anciennement écrites sont évincées (FIFO par rowid, contrôlé toutes les
+    64 écritures) : un LRU exact demanderait une écriture par lecture.
+    """
+
+    def __init__(self, chemin='cache.db', espace='defaut', taille_max=1024, ttl=None):
+        self.espace = espace
+        self.taille_max = taille_max
+        self.ttl = ttl
+        self.chemin = chemin
+        self._verrou = threading.Lock()
+        self._stats = {'hits': 0, 'miss': 0, 'evictions': 0, 'expirations': 0}
+        self._ecritures = 0
+        self._ouvrir()
+
+    def _ouvrir(self):
+        self._conn = sqlite3.connect(self.chemin, check_same_thread=False, isolation_level=None)
+        with self._verrou:
+            self._conn.execute('PRAGMA busy_timeout = 5000')
+            self._conn.execute('PRAGMA journal_mode = WAL')
+            # Un cache perdu lors d'une coupure se reconstruit : inutile d'attendre le disque
+            self._conn.execute('PRAGMA synchronous = OFF')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache (
+                    espace TEXT NOT NULL,
+                    cle TEXT NOT NULL,
+                    valeur BLOB NOT NULL,
+                    expire_a REAL,
+                    PRIMARY KEY (espace, cle)
+                )''')
+
+    def lire(self, cle, defaut=None):
+        with self._verrou:
+            ligne = self._conn.execute('SELECT valeur, expire_a FROM cache WHERE espace = ? AND cle = ?',
+                                       (self.espace, repr(cle))).fetchone()
+            if ligne is not None and ligne[1] is not None and ligne[1] <= time.time():
+                self._conn.execute('DELETE FROM cache WHERE espace = ? AND cle = ?', (self.espace, repr(cle)))
+                self._stats['expirations'] += 1
+                ligne = None
+            self._stats['hits' if ligne is not None else 'miss'] += 1
+        return pickle.loads(ligne[0]) if ligne is not None else defaut
+
+    def ecrire(self, cle, valeur):
+        # Horloge murale et non monotonic : l'échéance est lue par d'autres process
+        expire_a = time.time() + self.ttl if self.ttl else None
+        donnees = pickle.dumps(valeur, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._verrou:
+            # REPLACE donne un nouveau rowid : l'ordre des rowid est l'ordre d'écriture
+            self._conn.execute('INSERT OR REPLACE INTO cache (espace, cle, valeur, expire_a) VALUES (?, ?, ?, ?)',
+                               (self.espace, repr(cle), donnees, expire_a))
+            self._ecritures += 1
+            if self._ecritures % 64 == 0:
+                cur = self._conn.execute('''
+                    DELETE FROM cache WHERE rowid IN (
+                        SELECT rowid FROM cache WHERE espace = ? ORDER BY rowid DESC LIMIT -1 OFFSET ?)
+                ''', (self.espace, self.taille_max))
+                self._stats['evictions'] += cur.rowcount
+
+    def invalider(self, cle):
+        with self._verrou:
+            self._conn.execute('DELETE FROM cache WHERE espace = ? AND cle = ?', (self.espace, repr(cle)))
+
+    def vider(self):
+        with self._verrou:
+            self._conn.execute('DELETE FROM cache WHERE espace = ?', (self.espace,))
+
+    def apres_fork(self):
+        """Nouvelle connexion dans le process fils ; celle du parent est gardée, jamais refermée ici."""
+        self._heritee = self._conn
+        self._verrou = threading.Lock()
+        self._ouvrir()
+
+    def statistiques(self):
+        with self._verrou:
+            taille = self._conn.execute('SELECT COUNT(*) FROM cache WHERE espace = ?', (self.espace,)).fetchone()[0]
+            lectures = self._stats['hits'] + self._stats['miss']
+            # hits/miss de ce worker ; taille commune à tous
+            return dict(self._stats,
+                        taille=taille,
+                        taille_max=self.taille_max,
+                        taux_hits=round(self._stats['hits'] / lectures, 3) if lectures else None)
+
+
+BACKENDS = {'memoire': CacheLRU, 'sqlite': CacheSQLite, 'nul': CacheNul}
+
+
+def creer_cache(backend, espace, taille_max, ttl=None, chemin='cache.db'):
+    """Stockage de cache CACHE_BACKEND pour un usage donné (espace : 'usagers', 'fragments'...)."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de cache inconnu : {backend} (choix : {', '.join(BACKENDS)})")
+    if backend == 'sqlite':
+        return CacheSQLite(chemin, espace, taille_max, ttl)
+    return BACKENDS[backend](taille_max, ttl)
+
+
+class VersionsPartagees:
+    """Versions des portées (table cache_version de mairie.db), vues par ce worker.
+
+    Une connexion dédiée interroge PRAGMA data_version, qui change dès qu'une
+    autre connexion (autre worker, pool de ce worker, commande flask) a écrit
+    dans la base. Tant qu'il ne change pas, les versions déjà lues sont
+    servies de mémoire ; sinon elles sont oubliées et relues à la demande
+    (une lecture de clé primaire par portée utilisée).
+    """
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self._conn = sqlite3.connect(chemin, check_same_thread=False)
+        self._verrou = threading.Lock()
+        self._data_version = None
+        self._versions = {}
+        self._stats = {'changements_base': 0, 'lectures_sql': 0}
+
+    def version(self, portee, ident):
+        with self._verrou:
+            data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._versions.clear()
+                self._stats['changements_base'] += 1
+            cle = (portee, ident)
+            if cle not in self._versions:
+                ligne = self._conn.execute('SELECT version FROM cache_version WHERE portee = ? AND ident = ?',
+                                           cle).fetchone()
+                self._versions[cle] = ligne[0] if ligne else 0
+                self._stats['lectures_sql'] += 1
+            return self._versions[cle]
+
+    def apres_fork(self):
+        """Nouvelle connexion dans le process fils ; celle du parent est gardée, jamais refermée ici."""
+        self._heritee = self._conn
+        self._conn = sqlite3.connect(self.chemin, check_same_thread=False)
+        self._verrou = threading.Lock()
+        self._data_version = None
+        self._versions = {}
+
+    def statistiques(self):
+        with self._verrou:
+            return dict(self._stats, portees_connues=len(self._versions))
+
+
+def init_app(app):
+    app.config.setdefault('CACHE_BACKEND', 'memoire')
+    # À côté de la base, quel que soit le répertoire courant du process
+    app.config.setdefault('CACHE_CHEMIN', os.path.join(os.path.dirname(os.path.abspath(app.config['DATABASE'])),
+                                                       'cache.db'))
+    if app.config['CACHE_BACKEND'] not in BACKENDS:
+        raise ValueError(f"Backend de cache inconnu : {app.config['CACHE_BACKEND']} (choix : {', '.join(BACKENDS)})")
+    app.extensions['versions_cache'] = VersionsPartagees(app.config['DATABASE'])
@@ -0,0 +1,42 @@
+"""Charge des techniciens : nombre de tickets actifs (non terminés) assignés à chacun.
+
+La table charge_technicien est tenue à jour par des triggers sur ticket
+(migration 5), dans la même transaction que l'écriture du ticket.
+`flask recalculer-charges` la reconstruit depuis ticket en cas de doute.
+"""
+import click
+
+SQL_RECALCUL = '''
+    INSERT INTO charge_technicien (technicien_id, actifs)
+    SELECT technicien_id, COUNT(*) FROM ticket
+    WHERE technicien_id IS NOT NULL AND statut != 'Terminé'
+    GROUP BY technicien_id
+'''
+
+
+def recalculer(conn):
+    """Reconstruit charge_technicien depuis ticket. Renvoie le nombre de techniciens corrigés."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        avant = dict(conn.execute('SELECT technicien_id, actifs FROM charge_technicien WHERE actifs != 0'))
+        conn.execute('DELETE FROM charge_technicien')
+        conn.execute(SQL_RECALCUL)
+        apres = dict(conn.execute('SELECT technicien_id, actifs FROM charge_technicien'))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return sum(1 for tech in set(avant) | set(apres) if avant.get(tech) != apres.get(tech))
+
+
+def init_app(app):
+    @app.cli.command('recalculer-charges')
+    def recalculer_charges():
+        """Reconstruit les compteurs de charge des techniciens depuis la table ticket."""
+        pool = app.extensions['pool_sqlite']
+        conn = pool.acquerir()
+        try:
+            corriges = recalculer(conn)
+        finally:
+            pool.liberer(conn)
+        click.echo(f"Charges recalculées : {corriges} technicien(s) corrigé(s).")
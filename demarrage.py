@@ -0,0 +1,87 @@
+"""Vérifications au démarrage : configuration, base et dimensionnement des workers.
+
+verifier() renvoie deux listes de messages. Les problèmes bloquants
+empêchent un démarrage en production (wsgi.py), les avertissements sont
+seulement journalisés. `flask --app app verifier-demarrage` fait le même
+contrôle sans lancer de serveur.
+"""
+import os
+
+import click
+
+from bdd import lire_pragmas
+from migrations import MIGRATIONS, version_actuelle
+
+
+class DemarrageImpossible(Exception):
+    """La configuration ne permet pas de servir des requêtes en production."""
+
+
+def _dossier_inscriptible(chemin):
+    dossier = os.path.dirname(os.path.abspath(chemin))
+    return os.path.isdir(dossier) and os.access(dossier, os.W_OK)
+
+
+def verifier(app, production=False):
+    """(problèmes bloquants, avertissements) pour l'application déjà construite."""
+    bloquants, avertissements = [], []
+    config = app.config
+
+    if config.get('SECRET_KEY_EPHEMERE'):
+        message = ("MAIRIE_SECRET_KEY absente : clé de session tirée au hasard, "
+                   "propre à chaque process et perdue au redémarrage")
+        (bloquants if production else avertissements).append(message)
+    if production and app.debug:
+        bloquants.append("Mode debug actif : le débogueur werkzeug permet d'exécuter du code à distance")
+
+    # WAL crée base-wal et base-shm à côté de la base : le dossier doit être inscriptible
+    for cle in ('DATABASE', 'CACHE_CHEMIN'):
+        if not _dossier_inscriptible(config[cle]):
+            bloquants.append(f"{cle} : dossier absent ou non inscriptible ({config[cle]})")
+    os.makedirs(config['RAPPORTS_DOSSIER'], exist_ok=True)
+    if not os.access(config['RAPPORTS_DOSSIER'], os.W_OK):
+        bloquants.append(f"RAPPORTS_DOSSIER non inscriptible ({config['RAPPORTS_DOSSIER']})")
+
+    pool = app.extensions['pool_sqlite']
+    conn = pool.acquerir()
+    try:
+        journal = lire_pragmas(conn, ['journal_mode'])['journal_mode']
+        version = version_actuelle(conn)
+    finally:
+        pool.liberer(conn)
+    if journal != 'WAL':
+        bloquants.append(f"journal_mode={journal} : plusieurs workers exigent le mode WAL")
+    if version != MIGRATIONS[-1][0]:
+        bloquants.append(f"Schéma en version {version}, attendu {MIGRATIONS[-1][0]} "
+                         f"(flask --app app migrer)")
+
+    threads = config.get('WSGI_THREADS')
+    if threads:
+        if config['POOL_TAILLE'] < threads:
+            avertissements.append(f"POOL_TAILLE={config['POOL_TAILLE']} < {threads} threads par worker : "
+                                  f"des requêtes attendront une connexion SQLite")
+    return bloquants, avertissements
+
+
+def journaliser(app, bloquants, avertissements):
+    for message in bloquants:
+        app.logger.error("Démarrage impossible : %s", message)
+    for message in avertissements:
+        app.logger.warning("Démarrage : %s", message)
+
+
+def init_app(app):
+    app.config.setdefault('WSGI_THREADS', None)
+
+    @app.cli.command('verifier-demarrage')
+    @click.option('--production', is_flag=True, help="Contrôles d'un démarrage de production (wsgi.py).")
+    def verifier_demarrage(production):
+        """Vérifie la configuration, la base et le dimensionnement avant de lancer les workers."""
+        bloquants, avertissements = verifier(app, production)
+        for message in bloquants:
+            click.echo(f"ERREUR : {message}", err=True)
+        for message in avertissements:
+            click.echo(f"attention : {message}", err=True)
+        if bloquants:
+            raise click.ClickException(f"{len(bloquants)} problème(s) bloquant(s)")
+        click.echo("Démarrage possible.")
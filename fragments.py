@@ -0,0 +1,53 @@
+"""Cache des tableaux de tickets déjà rendus (HTML), par portée et version des données.
+
+Une portée est ('mairie', id), ('technicien', id) ou ('createur', id). Sa
+version (cache.VersionsPartagees) est incrémentée par les triggers de
+cache_version à chaque écriture sur un de ses tickets, et quand le demandeur
+d'un de ses tickets est renommé ou supprimé, quel que soit le worker qui
+écrit. La clé d'un fragment contient la version lue avant la
+requête SQL : un fragment périmé n'est plus jamais demandé et finit évincé.
+"""
+import threading
+
+from markupsafe import Markup
+
+from cache import creer_cache
+
+
+class CacheFragments:
+    """Fragments HTML rangés dans un stockage de cache (voir cache.creer_cache)."""
+
+    def __init__(self, stockage, versions):
+        self._fragments = stockage
+        self.versions = versions
+        self._verrou = threading.Lock()
+        self._stats = {}
+
+    def rendre(self, route, portee, ident, produire):
+        """HTML du fragment (route, portee, ident) ; produire() le calcule s'il n'est pas en cache."""
+        cle = (route, portee, ident, self.versions.version(portee, ident))
+        html = self._fragments.lire(cle)
+        with self._verrou:
+            stats = self._stats.setdefault(route, {'hits': 0, 'miss': 0})
+            stats['hits' if html is not None else 'miss'] += 1
+        if html is None:
+            html = Markup(produire())
+            self._fragments.ecrire(cle, html)
+        return html
+
+    def apres_fork(self):
+        if hasattr(self._fragments, 'apres_fork'):
+            self._fragments.apres_fork()
+
+    def statistiques(self):
+        with self._verrou:
+            routes = {route: dict(s, taux_hits=round(s['hits'] / (s['hits'] + s['miss']), 3))
+                      for route, s in self._stats.items()}
+        return {'routes': routes, 'fragments': self._fragments.statistiques()}
+
+
+def init_app(app):
+    app.config.setdefault('FRAGMENTS_TAILLE', 512)
+    stockage = creer_cache(app.config['CACHE_BACKEND'], 'fragments', app.config['FRAGMENTS_TAILLE'],
+                           chemin=app.config['CACHE_CHEMIN'])
+    app.extensions['fragments'] = CacheFragments(stockage, app.extensions['versions_cache'])
@@ -0,0 +1,37 @@
+"""Réglages gunicorn : gunicorn -c gunicorn.conf.py wsgi:application
+
+Dimensionnement (chaque valeur se règle par variable d'environnement) :
+
+- MAIRIE_WORKERS (défaut : nombre de cœurs) : process indépendants, chacun
+  avec son pool SQLite, ses caches et son pool de hachage. SQLite en WAL sert
+  les lectures de tous les workers en parallèle mais une seule écriture à la
+  fois ; au-delà de quelques workers par cœur, on n'ajoute que de l'attente
+  sur le verrou d'écriture (busy_timeout du profil SQLite).
+- MAIRIE_WSGI_THREADS (défaut 8) : requêtes servies en même temps par worker
+  (worker gthread). Un thread garde une connexion du pool pendant la requête :
+  POOL_TAILLE doit valoir au moins ce nombre.
+- MDP_THREADS (défaut 2) : calculs scrypt simultanés par worker ;
+  workers x MDP_THREADS ne devrait pas dépasser le nombre de cœurs.
+- MAIRIE_PROXY_NIVEAUX=1 derrière nginx, pour que la limitation des
+  connexions voie la vraie IP du client.
+
+`flask --app app verifier-demarrage --production` contrôle ces règles avant
+le lancement ; wsgi.py refuse de démarrer en cas de problème bloquant.
+"""
+import multiprocessing
+import os
+
+# Lu aussi par l'application (WSGI_THREADS) pour les contrôles de demarrage.py
+os.environ.setdefault('MAIRIE_WSGI_THREADS', '8')
+
+bind = os.environ.get('MAIRIE_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('MAIRIE_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ['MAIRIE_WSGI_THREADS'])
+# Migrations et chargement faits une fois dans le parent, puis partagés par fork
+preload_app = True
+# Silence maximal d'un worker avant redémarrage
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
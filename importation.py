@@ -0,0 +1,266 @@
+"""Imports en masse depuis un fichier CSV ou XLSX.
+
+Le fichier est lu ligne à ligne (jamais chargé en entier). Toutes les lignes
+sont validées avant la moindre écriture. Les doublons avec la base sont
+cherchés en une requête pour tout le fichier, et les lignes valides sont
+insérées par un seul executemany, dans une seule transaction. Les mairies
+(et leur référent) s'importent aussi par `flask importer-mairies`.
+"""
+
+import csv
+import io
+import json
+import time
+
+import click
+
+from validation import cle_mairie, simplifier_chaine, valider_format_strict_email, valider_securite_mdp
+
+
+class ImportationInvalide(ValueError):
+    pass
+
+
+# Services proposés dans le formulaire du référent, indexés par forme simplifiée
+SERVICES = {simplifier_chaine(s): s for s in ['Accueil', 'Technique', 'RH', 'Comptabilité', 'Scolaire']}
+
+
+def _colonnes(entete, attendues):
+    """Position de chaque colonne attendue ; l'en-tête est comparé sans accents ni casse."""
+    positions = {simplifier_chaine(c or ''): i for i, c in enumerate(entete)}
+    return {nom: positions[simplifier_chaine(nom)] for nom in attendues if simplifier_chaine(nom) in positions}
+
+
+def lire_lignes(fichier, nom_fichier):
+    """Itère sur les lignes d'un CSV (',' ou ';', UTF-8) ou d'un XLSX ; la première donne l'en-tête."""
+    if nom_fichier.lower().endswith('.xlsx'):
+        try:
+            import openpyxl
+        except ImportError:
+            raise ImportationInvalide("Format XLSX indisponible sur ce serveur (openpyxl absent) : "
+                                      "enregistrez le fichier en CSV.")
+        # read_only : les feuilles sont lues en flux, sans charger tout le classeur
+        classeur = openpyxl.load_workbook(fichier, read_only=True, data_only=True)
+        try:
+            for ligne in classeur.active.iter_rows(values_only=True):
+                yield ['' if v is None else str(v).strip() for v in ligne]
+        finally:
+            classeur.close()
+    elif nom_fichier.lower().endswith('.csv'):
+        texte = io.TextIOWrapper(fichier, encoding='utf-8-sig', newline='')
+        try:
+            entete = texte.readline()
+            # Excel en français enregistre avec des ';'
+            separateur = ';' if entete.count(';') > entete.count(',') else ','
+            yield [c.strip() for c in next(csv.reader([entete], delimiter=separateur), [])]
+            for ligne in csv.reader(texte, delimiter=separateur):
+                yield [c.strip() for c in ligne]
+        except UnicodeDecodeError:
+            raise ImportationInvalide("Le fichier CSV doit être encodé en UTF-8.")
+        finally:
+            texte.detach()
+    else:
+        raise ImportationInvalide("Formats acceptés : .csv ou .xlsx")
+
+
+def _lignes_utiles(lignes, attendues, obligatoires, lignes_max):
+    """(numéro de ligne du fichier, {colonne: valeur}) des lignes non vides, en-tête vérifié."""
+    lignes = iter(lignes)
+    colonnes = _colonnes(next(lignes, []), attendues)
+    manquantes = [c for c in obligatoires if c not in colonnes]
+    if manquantes:
+        raise ImportationInvalide(f"Colonne(s) manquante(s) : {', '.join(manquantes)}")
+    for numero, ligne in enumerate(lignes, start=2):
+        if not any(ligne):
+            continue
+        if numero - 1 > lignes_max:
+            raise ImportationInvalide(f"Fichier trop long : {lignes_max} lignes au plus.")
+        yield numero, {nom: ligne[i] if i < len(ligne) else '' for nom, i in colonnes.items()}
+
+
+def emails_existants(conn, emails):
+    """Emails déjà présents dans usager : une seule requête, quel que soit leur nombre."""
+    # json_each évite la limite du nombre de paramètres ; chaque valeur est cherchée dans l'index UNIQUE
+    return {r[0] for r in conn.execute(
+        'SELECT email FROM usager WHERE email IN (SELECT value FROM json_each(?))', (json.dumps(list(emails)),))}
+
+
+SQL_MAIRIES_CONNUES = '''
+    SELECT id, nom_normalise, ville_normalise FROM mairie
+    WHERE (nom_normalise, ville_normalise) IN (
+        SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?))
+'''
+
+# UPSERT sur la clé normalisée : une mairie déjà connue garde son id, seul son libellé est repris du fichier
+SQL_UPSERT_MAIRIE = '''
+    INSERT INTO mairie (nom, ville, nom_normalise, ville_normalise) VALUES (?, ?, ?, ?)
+    ON CONFLICT (nom_normalise, ville_normalise) DO UPDATE SET nom = excluded.nom, ville = excluded.ville
+'''
+
+
+def importer_personnel(conn, lignes, mairie_id, hacheur, mdp_initial=None, lignes_max=5000):
+    """Crée les agents de mairie_id décrits par lignes (voir lire_lignes).
+
+    Colonnes : prenom, nom, email, service, et mdp (facultative : mdp_initial sinon).
+    Les mots de passe sont hachés par hacheur (mots_de_passe.Hacheur).
+    Les lignes valides sont créées, les autres rapportées. Renvoie
+    {'crees', 'erreurs': [(ligne, message)], 'durees': {...}}.
+    """
+    debut = time.perf_counter()
+    candidats, erreurs, vus = [], [], set()
+    for numero, ligne in _lignes_utiles(lignes, ['prenom', 'nom', 'email', 'service', 'mdp'],
+                                        ['prenom', 'nom', 'email', 'service'], lignes_max):
+        email = ligne['email'].lower()
+        mdp = ligne.get('mdp') or mdp_initial
+        service = SERVICES.get(simplifier_chaine(ligne['service']))
+        if not (ligne['prenom'] and ligne['nom'] and email):
+            erreurs.append((numero, "prénom, nom et email sont obligatoires"))
+        elif not valider_format_strict_email(email, ligne['prenom'], ligne['nom']):
+            erreurs.append((numero, f"{email} : l'email doit correspondre au nom/prénom et finir par gmail.com ou .fr"))
+        elif service is None:
+            erreurs.append((numero, f"service inconnu : {ligne['service']}"))
+        elif not valider_securite_mdp(mdp):
+            erreurs.append((numero, "mot de passe absent ou trop faible"))
+        elif email in vus:
+            erreurs.append((numero, f"{email} : en double dans le fichier"))
+        else:
+            vus.add(email)
+            candidats.append((numero, (ligne['nom'], ligne['prenom'], email, mdp,
+                                       'personnel_mairie', mairie_id, service)))
+    validation = time.perf_counter()
+    # Hachage avant le verrou d'écriture : le calcul est lent et ne doit pas bloquer les autres écritures
+    haches = hacheur.hacher_lot(ligne[3] for _, ligne in candidats)
+    hachage = time.perf_counter()
+
+    # Verrou d'écriture pris avant la recherche des doublons : personne ne peut créer l'email entre-temps
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        deja = emails_existants(conn, vus)
+        erreurs.extend((numero, f"{ligne[2]} : cet email existe déjà") for numero, ligne in candidats
+                       if ligne[2] in deja)
+        valides = [(*ligne[:3], haches[ligne[3]], *ligne[4:]) for _, ligne in candidats if ligne[2] not in deja]
+        conn.executemany('''
+            INSERT INTO usager (nom, prenom, email, mdp, role, mairie_id, service)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', valides)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    fin = time.perf_counter()
+    return {'crees': len(valides),
+            'erreurs': sorted(erreurs),
+            'durees': {'lecture_validation_s': round(validation - debut, 3),
+                       'hachage_s': round(hachage - validation, 3),
+                       'ecriture_s': round(fin - hachage, 3)}}
+
+
+def importer_mairies(conn, lignes, hacheur, mdp_initial=None, lignes_max=5000):
+    """Crée ou met à jour des mairies et leur référent décrits par lignes (voir lire_lignes).
+
+    Colonnes : mairie, ville, puis pour le référent (facultatif) referent_prenom,
+    referent_nom, referent_email et referent_mdp (mdp_initial sinon). Une mairie
+    déjà connue sous le même nom et la même ville (sans accents ni casse) est
+    mise à jour. Un référent déjà inscrit change de nom ou de mairie, jamais de
+    mot de passe. Renvoie {'crees', 'mis_a_jour', 'referents': {'crees',
+    'mis_a_jour'}, 'erreurs': [(ligne, message)], 'durees': {...}}.
+    """
+    debut = time.perf_counter()
+    mairies, referents, erreurs, vus = {}, [], [], set()
+    for numero, ligne in _lignes_utiles(lignes, ['mairie', 'ville', 'referent_prenom', 'referent_nom',
+                                                 'referent_email', 'referent_mdp'],
+                                        ['mairie', 'ville'], lignes_max):
+        cle = cle_mairie(ligne['mairie'], ligne['ville'])
+        prenom, nom = ligne.get('referent_prenom', ''), ligne.get('referent_nom', '')
+        email = ligne.get('referent_email', '').lower()
+        if not all(cle):
+            erreurs.append((numero, "le nom de la mairie et la ville sont obligatoires"))
+        elif cle in mairies:
+            erreurs.append((numero, f"{ligne['mairie']} ({ligne['ville']}) : déjà en ligne {mairies[cle][0]}"))
+        elif (prenom or nom or email) and not (prenom and nom and email):
+            erreurs.append((numero, "référent incomplet : prénom, nom et email sont obligatoires"))
+        elif email and not valider_format_strict_email(email, prenom, nom):
+            erreurs.append((numero, f"{email} : l'email doit correspondre au nom/prénom et finir par gmail.com ou .fr"))
+        elif email in vus:
+            erreurs.append((numero, f"{email} : en double dans le fichier"))
+        else:
+            mairies[cle] = (numero, ligne['mairie'], ligne['ville'])
+            if email:
+                vus.add(email)
+                referents.append((numero, cle, nom, prenom, email, ligne.get('referent_mdp') or mdp_initial))
+    validation = time.perf_counter()
+    # Seuls les référents inconnus utiliseront leur hachage, mais on ne le sait que sous le verrou
+    haches = hacheur.hacher_lot(r[5] for r in referents if valider_securite_mdp(r[5]))
+    hachage = time.perf_counter()
+
+    cles = json.dumps([list(cle) for cle in mairies])
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        connues = {(r[1], r[2]) for r in conn.execute(SQL_MAIRIES_CONNUES, (cles,))}
+        conn.executemany(SQL_UPSERT_MAIRIE, [(nom, ville, *cle) for cle, (_, nom, ville) in mairies.items()])
+        ids = {(r[1], r[2]): r[0] for r in conn.execute(SQL_MAIRIES_CONNUES, (cles,))}
+
+        # Un email déjà pris n'est repris que s'il appartient déjà à un référent. Un référent
+        # déplacé vers une autre mairie ne suit pas ses tickets : ils restent à leur mairie d'origine
+        roles = {r[0]: r[1] for r in conn.execute(
+            'SELECT email, role FROM usager WHERE email IN (SELECT value FROM json_each(?))',
+            (json.dumps(list(vus)),))}
+        nouveaux, modifies = [], []
+        for numero, cle, nom, prenom, email, mdp in referents:
+            if email not in roles:
+                if mdp in haches:
+                    nouveaux.append((nom, prenom, email, haches[mdp], ids[cle]))
+                else:
+                    erreurs.append((numero, f"mairie enregistrée, référent {email} refusé : "
+                                            "mot de passe absent ou trop faible"))
+            elif roles[email] in ['referent', 'référent']:
+                modifies.append((nom, prenom, ids[cle], email))
+            else:
+                erreurs.append((numero, f"mairie enregistrée, référent {email} refusé : "
+                                        "email déjà utilisé par un autre compte"))
+        conn.executemany('''
+            INSERT INTO usager (nom, prenom, email, mdp, role, mairie_id)
+            VALUES (?, ?, ?, ?, 'referent', ?)
+        ''', nouveaux)
+        conn.executemany('UPDATE usager SET nom = ?, prenom = ?, mairie_id = ? WHERE email = ?', modifies)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    fin = time.perf_counter()
+    return {'crees': len(mairies) - len(connues),
+            'mis_a_jour': len(connues),
+            'referents': {'crees': len(nouveaux), 'mis_a_jour': len(modifies)},
+            'erreurs': sorted(erreurs),
+            'durees': {'lecture_validation_s': round(validation - debut, 3),
+                       'hachage_s': round(hachage - validation, 3),
+                       'ecriture_s': round(fin - hachage, 3)}}
+
+
+def init_app(app):
+    app.config.setdefault('IMPORT_LIGNES_MAX', 5000)
+
+    @app.cli.command('importer-mairies')
+    @click.argument('fichier', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--mdp-initial', default=None, help="Mot de passe des référents créés sans colonne referent_mdp.")
+    def importer_mairies_cli(fichier, mdp_initial):
+        """Crée ou met à jour mairies et référents depuis un fichier CSV ou XLSX."""
+        pool = app.extensions['pool_sqlite']
+        conn = pool.acquerir()
+        try:
+            with open(fichier, 'rb') as f:
+                rapport = importer_mairies(conn, lire_lignes(f, fichier), app.extensions['mots_de_passe'],
+                                           mdp_initial, app.config['IMPORT_LIGNES_MAX'])
+
+        except ImportationInvalide as e:
+            raise click.ClickException(str(e))
+        finally:
+            pool.liberer(conn)
+        click.echo(f"Mairies : {rapport['crees']} créée(s), {rapport['mis_a_jour']} mise(s) à jour - "
+                   f"référents : {rapport['referents']['crees']} créé(s), "
+                   f"{rapport['referents']['mis_a_jour']} mis à jour - "
+                   f"{len(rapport['erreurs'])} ligne(s) refusée(s)")
+        for numero, message in rapport['erreurs']:
+            click.echo(f"    ligne {numero} : {message}")
+        click.echo(', '.join(f"{etape} : {duree} s" for etape, duree in rapport['durees'].items()))
+
@@ -0,0 +1,88 @@
+"""Limitation des tentatives de connexion (seaux à jetons par IP et par email), en mémoire du worker.
+
+Chaque IP et chaque email a un seau de `capacite` jetons, rechargé de
+`par_minute` jetons par minute ; une tentative consomme un jeton. Le contrôle
+se fait avant toute requête SQL ou tout calcul de mot de passe : une rafale de
+credential stuffing coûte un accès à un dict, pas une connexion au pool. Le
+nombre de seaux est borné (éviction LRU) ; un seau évincé repart plein.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class SeauxJetons:
+    """Seaux à jetons indexés par clé, au plus entrees_max (les moins récemment utilisés sont évincés)."""
+
+    def __init__(self, capacite=10, par_minute=5, entrees_max=10000):
+        self.capacite = capacite
+        self.debit = par_minute / 60
+        self.entrees_max = entrees_max
+        self._seaux = OrderedDict()
+        self._verrou = threading.Lock()
+        self._stats = {'autorises': 0, 'refuses': 0, 'evictions': 0}
+
+    def prendre(self, cle):
+        """0 si un jeton a été pris, sinon le nombre de secondes avant le prochain jeton."""
+        maintenant = time.monotonic()
+        with self._verrou:
+            jetons, mis_a_jour = self._seaux.get(cle, (self.capacite, maintenant))
+            jetons = min(self.capacite, jetons + (maintenant - mis_a_jour) * self.debit)
+            attente = 0
+            if jetons >= 1:
+                jetons -= 1
+                self._stats['autorises'] += 1
+            else:
+                attente = (1 - jetons) / self.debit
+                self._stats['refuses'] += 1
+            self._seaux[cle] = (jetons, maintenant)
+            self._seaux.move_to_end(cle)
+            while len(self._seaux) > self.entrees_max:
+                self._seaux.popitem(last=False)
+                self._stats['evictions'] += 1
+            return attente
+
+    def statistiques(self):
+        with self._verrou:
+            return dict(self._stats, seaux=len(self._seaux), entrees_max=self.entrees_max,
+                        capacite=self.capacite, par_minute=round(self.debit * 60, 2))
+
+
+class LimiteurConnexions:
+    """Un seau par IP et un par email, partagés par les routes de connexion et de récupération."""
+
+    def __init__(self, limite_ip, limite_email, entrees_max=10000):
+        self.ip = SeauxJetons(limite_ip['capacite'], limite_ip['par_minute'], entrees_max)
+        self.email = SeauxJetons(limite_email['capacite'], limite_email['par_minute'], entrees_max)
+        self._verrou = threading.Lock()
+        self._refus = {}
+
+    def attente(self, route, ip, email=None):
+        """0 si la tentative est permise, sinon les secondes (arrondies) à attendre."""
+        attente = self.ip.prendre(ip)
+        motif = 'ip'
+        # Email non vérifié tel quel : "A@x.fr " et "a@x.fr" partagent le même seau
+        email = (email or '').strip().lower()
+        if not attente and email:
+            attente = self.email.prendre(email)
+            motif = 'email'
+        if attente:
+            with self._verrou:
+                refus = self._refus.setdefault(route, {'ip': 0, 'email': 0})
+                refus[motif] += 1
+        return math.ceil(attente)
+
+    def statistiques(self):
+        with self._verrou:
+            refus = {route: dict(r) for route, r in self._refus.items()}
+        return {'refus_par_route': refus, 'ip': self.ip.statistiques(), 'email': self.email.statistiques()}
+
+
+def init_app(app):
+    app.config.setdefault('LIMITE_CONNEXION_IP', {'capacite': 30, 'par_minute': 10})
+    app.config.setdefault('LIMITE_CONNEXION_EMAIL', {'capacite': 5, 'par_minute': 1})
+    app.config.setdefault('LIMITE_SEAUX_MAX', 10000)
+    app.extensions['limitation'] = LimiteurConnexions(app.config['LIMITE_CONNEXION_IP'],
+                                                      app.config['LIMITE_CONNEXION_EMAIL'],
+                                                      app.config['LIMITE_SEAUX_MAX'])
@@ -0,0 +1,544 @@
+"""Migrations numérotées du schéma de mairie.db.
+
+La version appliquée est enregistrée dans la table schema_version. Les
+migrations tournent au démarrage (MIGRATIONS_AUTO) ou via `flask migrer`.
+
+Le texte d'une migration est figé : son SQL est recopié ici plutôt qu'importé
+des modules (charges, recherche, cache), dont les constantes peuvent évoluer
+après coup. Une base migrée hier et une base neuve ont ainsi le même schéma ;
+un changement passe par une nouvelle migration.
+"""
+import re
+import sys
+import unicodedata
+
+import click
+
+import recherche
+
+
+def _tables(conn):
+    return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def _schema_initial(conn):
+    # Base neuve : on crée directement les tables avec les bonnes références
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS mairie (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nom TEXT NOT NULL,
+            ville TEXT NOT NULL
+        )''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS usager (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nom TEXT NOT NULL,
+            prenom TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            mdp TEXT NOT NULL,
+            role TEXT,
+            service TEXT,
+            specialite TEXT,
+            mairie_id INTEGER,
+            prestataire_id INTEGER,
+            premier_login INTEGER DEFAULT 1,
+            code_recup TEXT
+        )''')
+    if 'ticket' not in _tables(conn):
+        conn.execute(_SQL_TICKET.format(table='ticket'))
+    if 'prestataire' not in _tables(conn):
+        conn.execute(_SQL_PRESTATAIRE.format(table='prestataire'))
+
+
+_SQL_TICKET = '''
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        titre TEXT NOT NULL,
+        description TEXT,
+        type_prestation TEXT NOT NULL, -- 'connexion', 'materiel', 'logiciel', 'securite'
+        statut TEXT DEFAULT 'Nouveau',
+        date_creation DATETIME DEFAULT CURRENT_TIMESTAMP,
+        createur_id INTEGER NOT NULL,
+        admin_id INTEGER, technicien_id INTEGER, duree TEXT, contrat TEXT, date_fin DATETIME,
+        FOREIGN KEY (createur_id) REFERENCES usager(id),
+        FOREIGN KEY (admin_id) REFERENCES usager(id),
+        FOREIGN KEY (technicien_id) REFERENCES usager(id)
+    )'''
+
+_SQL_PRESTATAIRE = '''
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nom_entreprise TEXT NOT NULL,
+        telephone_entreprise TEXT,
+        contact_admin_id INTEGER,
+        FOREIGN KEY (contact_admin_id) REFERENCES usager(id)
+    )'''
+
+
+def _cle_mairie_v9(nom, ville):
+    # Copie figée de validation.cle_mairie telle qu'au moment de la migration 9 : sans accents,
+    # sans espaces, en minuscules. validation.py peut évoluer, les clés déjà calculées non
+    def simplifier(texte):
+        texte = unicodedata.normalize('NFD', (texte or '').strip())
+        return "".join(c for c in texte if unicodedata.category(c) != 'Mn').lower().replace(" ", "")
+    return simplifier(nom), simplifier(ville)
+
+
+def _cle_unique_mairie(conn):
+    conn.execute('ALTER TABLE mairie ADD COLUMN nom_normalise TEXT')
+    conn.execute('ALTER TABLE mairie ADD COLUMN ville_normalise TEXT')
+    cles = set()
+    for id_mairie, nom, ville in conn.execute('SELECT id, nom, ville FROM mairie ORDER BY id').fetchall():
+        cle = _cle_mairie_v9(nom, ville)
+        # Doublons déjà en base : rien n'est fusionné d'office, la plus ancienne
+        # garde la clé et les suivantes sont marquées "#id" (à fusionner à la main)
+        if cle in cles:
+            cle = (f"{cle[0]}#{id_mairie}", cle[1])
+        cles.add(cle)
+        conn.execute('UPDATE mairie SET nom_normalise = ?, ville_normalise = ? WHERE id = ?', (*cle, id_mairie))
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_mairie_cle ON mairie (nom_normalise, ville_normalise)')
+
+
+def _reconstruire(conn, table, sql_creation, colonnes):
+    """Reconstruit une table (seul moyen de changer ses FOREIGN KEY sous SQLite)."""
+    sql_actuel = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                              (table,)).fetchone()
+    if sql_actuel is None or 'usager_old' not in sql_actuel[0]:
+        return
+    liste = ', '.join(colonnes)
+    conn.execute(sql_creation.format(table=f'{table}_nouveau'))
+    conn.execute(f'INSERT INTO {table}_nouveau ({liste}) SELECT {liste} FROM {table}')
+    conn.execute(f'DROP TABLE {table}')
+    conn.execute(f'ALTER TABLE {table}_nouveau RENAME TO {table}')
+
+
+def _corriger_usager_old(conn):
+    _reconstruire(conn, 'ticket', _SQL_TICKET,
+                  ['id', 'titre', 'description', 'type_prestation', 'statut', 'date_creation',
+                   'createur_id', 'admin_id', 'technicien_id', 'duree', 'contrat', 'date_fin'])
+    _reconstruire(conn, 'prestataire', _SQL_PRESTATAIRE,
+                  ['id', 'nom_entreprise', 'telephone_entreprise', 'contact_admin_id'])
+
+
+# (numéro, description, liste de requêtes SQL ou fonction(conn))
+MIGRATIONS = [
+    (1, "Schéma initial", _schema_initial),
+    (2, "ticket/prestataire : clés étrangères vers usager au lieu de usager_old", _corriger_usager_old),
+    (3, "Index des tableaux de bord (technicien, créateur, mairie, rôle, purge)", [
+        "CREATE INDEX IF NOT EXISTS idx_ticket_technicien_date ON ticket (technicien_id, date_creation)",
+        "CREATE INDEX IF NOT EXISTS idx_ticket_createur_date ON ticket (createur_id, date_creation)",
+        "CREATE INDEX IF NOT EXISTS idx_ticket_statut_date_fin ON ticket (statut, date_fin)",
+        "CREATE INDEX IF NOT EXISTS idx_usager_mairie_role ON usager (mairie_id, role)",
+        "CREATE INDEX IF NOT EXISTS idx_usager_role ON usager (role)",
+    ]),
+    (4, "ticket.mairie_id et index des filtres de la liste admin (pagination par date_creation, id)", [
+        "ALTER TABLE ticket ADD COLUMN mairie_id INTEGER REFERENCES mairie(id)",
+        "UPDATE ticket SET mairie_id = (SELECT u.mairie_id FROM usager u WHERE u.id = ticket.createur_id)",
+        "CREATE INDEX IF NOT EXISTS idx_ticket_date_creation ON ticket (date_creation)",
+        "CREATE INDEX IF NOT EXISTS idx_ticket_statut_date ON ticket (statut, date_creation)",
+        "CREATE INDEX IF NOT EXISTS idx_ticket_contrat_date ON ticket (contrat, date_creation)",
+        "CREATE INDEX IF NOT EXISTS idx_ticket_type_date ON ticket (type_prestation, date_creation)",
+        "CREATE INDEX IF NOT EXISTS idx_ticket_mairie_date ON ticket (mairie_id, date_creation)",
+    ]),
+    (5, "Compteurs de charge des techniciens tenus par triggers", [
+        '''CREATE TABLE IF NOT EXISTS charge_technicien (
+            technicien_id INTEGER PRIMARY KEY REFERENCES usager(id),
+            actifs INTEGER NOT NULL DEFAULT 0
+        )''',
+        # Un ticket compte pour son technicien tant que statut != 'Terminé'
+        '''CREATE TRIGGER IF NOT EXISTS trg_charge_insert AFTER INSERT ON ticket
+           WHEN NEW.technicien_id IS NOT NULL AND NEW.statut != 'Terminé'
+           BEGIN
+               INSERT INTO charge_technicien (technicien_id, actifs) VALUES (NEW.technicien_id, 1)
+               ON CONFLICT (technicien_id) DO UPDATE SET actifs = actifs + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_charge_delete AFTER DELETE ON ticket
+           WHEN OLD.technicien_id IS NOT NULL AND OLD.statut != 'Terminé'
+           BEGIN
+               UPDATE charge_technicien SET actifs = actifs - 1 WHERE technicien_id = OLD.technicien_id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_charge_update_ancien AFTER UPDATE OF technicien_id, statut ON ticket
+           WHEN OLD.technicien_id IS NOT NULL AND OLD.statut != 'Terminé'
+           BEGIN
+               UPDATE charge_technicien SET actifs = actifs - 1 WHERE technicien_id = OLD.technicien_id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_charge_update_nouveau AFTER UPDATE OF technicien_id, statut ON ticket
+           WHEN NEW.technicien_id IS NOT NULL AND NEW.statut != 'Terminé'
+           BEGIN
+               INSERT INTO charge_technicien (technicien_id, actifs) VALUES (NEW.technicien_id, 1)
+               ON CONFLICT (technicien_id) DO UPDATE SET actifs = actifs + 1;
+           END''',
+        'DELETE FROM charge_technicien',
+        '''INSERT INTO charge_technicien (technicien_id, actifs)
+           SELECT technicien_id, COUNT(*) FROM ticket
+           WHERE technicien_id IS NOT NULL AND statut != 'Terminé'
+           GROUP BY technicien_id''',
+    ]),
+    (6, "Séquence de modification des tickets (versions de données, ETag)", [
+        "CREATE TABLE IF NOT EXISTS compteur (nom TEXT PRIMARY KEY, valeur INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO compteur (nom, valeur) VALUES ('ticket', 0)",
+        "ALTER TABLE ticket ADD COLUMN seq_modif INTEGER",
+        # Chaque écriture sur ticket prend le numéro suivant de compteur('ticket')
+        '''CREATE TRIGGER IF NOT EXISTS trg_seq_insert AFTER INSERT ON ticket
+           BEGIN
+               UPDATE compteur SET valeur = valeur + 1 WHERE nom = 'ticket';
+               UPDATE ticket SET seq_modif = (SELECT valeur FROM compteur WHERE nom = 'ticket')
+               WHERE id = NEW.id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_seq_update AFTER UPDATE ON ticket
+           WHEN NEW.seq_modif IS OLD.seq_modif
+           BEGIN
+               UPDATE compteur SET valeur = valeur + 1 WHERE nom = 'ticket';
+               UPDATE ticket SET seq_modif = (SELECT valeur FROM compteur WHERE nom = 'ticket')
+               WHERE id = NEW.id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_seq_delete AFTER DELETE ON ticket
+           BEGIN
+               UPDATE compteur SET valeur = valeur + 1 WHERE nom = 'ticket';
+           END''',
+        "UPDATE ticket SET seq_modif = id",
+        "UPDATE compteur SET valeur = (SELECT COALESCE(MAX(id), 0) FROM ticket) WHERE nom = 'ticket'",
+    ]),
+    (7, "SLA précalculé : échéance à l'assignation, temps écoulé et dépassement à la clôture", [
+        "ALTER TABLE ticket ADD COLUMN sla_echeance DATETIME",
+        "ALTER TABLE ticket ADD COLUMN sla_heures_ecoulees REAL",
+        "ALTER TABLE ticket ADD COLUMN sla_depasse INTEGER",
+        '''UPDATE ticket SET sla_echeance = datetime(date_creation,
+               CASE contrat WHEN 'Gold' THEN '+4 hours' WHEN 'Silver' THEN '+24 hours' ELSE '+72 hours' END)
+           WHERE technicien_id IS NOT NULL OR contrat IS NOT NULL''',
+        '''UPDATE ticket SET
+               sla_heures_ecoulees = ROUND((julianday(date_fin) - julianday(date_creation)) * 24, 2),
+               sla_depasse = date_fin > COALESCE(sla_echeance, datetime(date_creation, '+72 hours'))
+           WHERE statut = 'Terminé' AND date_fin IS NOT NULL''',
+        # "En retard" = ticket ouvert dont l'échéance est passée : simple plage sur l'index partiel
+        "CREATE INDEX IF NOT EXISTS idx_ticket_sla_ouverts ON ticket (sla_echeance) WHERE statut != 'Terminé'",
+        "CREATE INDEX IF NOT EXISTS idx_ticket_sla_depasse ON ticket (sla_depasse, date_fin)",
+    ]),
+    (8, "Recherche plein texte : index FTS5 ticket_fts sur titre et description, tenu par triggers", [
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS ticket_fts USING fts5(
+               titre, description,
+               content='ticket', content_rowid='id',
+               tokenize='unicode61 remove_diacritics 2',
+               prefix='2 3')''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_fts_insert AFTER INSERT ON ticket
+           BEGIN
+               INSERT INTO ticket_fts (rowid, titre, description) VALUES (NEW.id, NEW.titre, NEW.description);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_fts_delete AFTER DELETE ON ticket
+           BEGIN
+               INSERT INTO ticket_fts (ticket_fts, rowid, titre, description)
+               VALUES ('delete', OLD.id, OLD.titre, OLD.description);
+           END''',
+        # Seuls les changements de texte touchent l'index (pas les statuts, SLA, seq_modif...)
+        '''CREATE TRIGGER IF NOT EXISTS trg_fts_update AFTER UPDATE OF titre, description ON ticket
+           BEGIN
+               INSERT INTO ticket_fts (ticket_fts, rowid, titre, description)
+               VALUES ('delete', OLD.id, OLD.titre, OLD.description);
+               INSERT INTO ticket_fts (rowid, titre, description) VALUES (NEW.id, NEW.titre, NEW.description);
+           END''',
+        "INSERT INTO ticket_fts (ticket_fts) VALUES ('rebuild')",
+    ]),
+    (9, "mairie : clé unique (nom, ville) sans accents ni casse, pour les imports en UPSERT", _cle_unique_mairie),
+    # Une ligne par portée, incrémentée dans la transaction de chaque écriture qui la touche.
+    # UNION (et non VALUES, dont column1/column2 ne se résolvent pas dans un trigger) : dédoublonne aussi
+    (10, "Versions des portées de cache (cache_version), tenues par triggers sur ticket et usager", [
+        '''CREATE TABLE IF NOT EXISTS cache_version (
+               portee TEXT NOT NULL,
+               ident INTEGER NOT NULL,
+               version INTEGER NOT NULL,
+               PRIMARY KEY (portee, ident)
+           ) WITHOUT ROWID''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_version_ticket_insert AFTER INSERT ON ticket
+           BEGIN
+               INSERT INTO cache_version (portee, ident, version)
+               SELECT portee, ident, 1 FROM (
+                   SELECT 'mairie' AS portee, NEW.mairie_id AS ident
+                   UNION SELECT 'technicien' AS portee, NEW.technicien_id AS ident
+                   UNION SELECT 'createur' AS portee, NEW.createur_id AS ident
+               ) WHERE ident IS NOT NULL
+               ON CONFLICT (portee, ident) DO UPDATE SET version = version + 1;
+           END''',
+        # Pas sur la mise à jour de seq_modif faite par trg_seq_update (même condition que lui)
+        '''CREATE TRIGGER IF NOT EXISTS trg_version_ticket_update AFTER UPDATE ON ticket
+           WHEN NEW.seq_modif IS OLD.seq_modif
+           BEGIN
+               INSERT INTO cache_version (portee, ident, version)
+               SELECT portee, ident, 1 FROM (
+                   SELECT 'mairie' AS portee, NEW.mairie_id AS ident
+                   UNION SELECT 'mairie' AS portee, OLD.mairie_id AS ident
+                   UNION SELECT 'technicien' AS portee, NEW.technicien_id AS ident
+                   UNION SELECT 'technicien' AS portee, OLD.technicien_id AS ident
+                   UNION SELECT 'createur' AS portee, NEW.createur_id AS ident
+               ) WHERE ident IS NOT NULL
+               ON CONFLICT (portee, ident) DO UPDATE SET version = version + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_version_ticket_delete AFTER DELETE ON ticket
+           BEGIN
+               INSERT INTO cache_version (portee, ident, version)
+               SELECT portee, ident, 1 FROM (
+                   SELECT 'mairie' AS portee, OLD.mairie_id AS ident
+                   UNION SELECT 'technicien' AS portee, OLD.technicien_id AS ident
+                   UNION SELECT 'createur' AS portee, OLD.createur_id AS ident
+               ) WHERE ident IS NOT NULL
+               ON CONFLICT (portee, ident) DO UPDATE SET version = version + 1;
+           END''',
+        # Un usager modifié ou supprimé : son profil en cache, et les tableaux de sa mairie (nom du demandeur)
+        '''CREATE TRIGGER IF NOT EXISTS trg_version_usager_update AFTER UPDATE ON usager
+           BEGIN
+               INSERT INTO cache_version (portee, ident, version)
+               SELECT portee, ident, 1 FROM (
+                   SELECT 'usager' AS portee, NEW.id AS ident
+                   UNION SELECT 'mairie' AS portee, NEW.mairie_id AS ident
+                   UNION SELECT 'mairie' AS portee, OLD.mairie_id AS ident
+               ) WHERE ident IS NOT NULL
+               ON CONFLICT (portee, ident) DO UPDATE SET version = version + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_version_usager_delete AFTER DELETE ON usager
+           BEGIN
+               INSERT INTO cache_version (portee, ident, version)
+               SELECT portee, ident, 1 FROM (
+                   SELECT 'usager' AS portee, OLD.id AS ident
+                   UNION SELECT 'mairie' AS portee, OLD.mairie_id AS ident
+               ) WHERE ident IS NOT NULL
+               ON CONFLICT (portee, ident) DO UPDATE SET version = version + 1;
+           END''',
+    ]),
+    # Le tableau du technicien et celui du référent affichent le nom et le service du demandeur :
+    # renommer ou supprimer un usager périme les portées de ses tickets (idx_ticket_createur_date),
+    # y compris ceux restés dans une mairie qu'il a quittée
+    (11, "Versions des portées des tickets d'un usager renommé ou supprimé", [
+        '''CREATE TRIGGER IF NOT EXISTS trg_version_usager_tickets_update AFTER UPDATE OF nom, service ON usager
+           WHEN NEW.nom IS NOT OLD.nom OR NEW.service IS NOT OLD.service
+           BEGIN
+               INSERT INTO cache_version (portee, ident, version)
+               SELECT portee, ident, 1 FROM (
+                   SELECT 'technicien' AS portee, technicien_id AS ident FROM ticket WHERE createur_id = NEW.id
+                   UNION SELECT 'mairie' AS portee, mairie_id AS ident FROM ticket WHERE createur_id = NEW.id
+               ) WHERE ident IS NOT NULL
+               ON CONFLICT (portee, ident) DO UPDATE SET version = version + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_version_usager_tickets_delete AFTER DELETE ON usager
+           BEGIN
+               INSERT INTO cache_version (portee, ident, version)
+               SELECT portee, ident, 1 FROM (
+                   SELECT 'technicien' AS portee, technicien_id AS ident FROM ticket WHERE createur_id = OLD.id
+                   UNION SELECT 'mairie' AS portee, mairie_id AS ident FROM ticket WHERE createur_id = OLD.id
+               ) WHERE ident IS NOT NULL
+               ON CONFLICT (portee, ident) DO UPDATE SET version = version + 1;
+           END''',
+    ]),
+    # Nom et ville d'une mairie sont imprimés dans le rapport PDF, qui doit changer de version
+    # quand on les corrige (import en UPSERT) ; portée distincte de 'mairie', qui suit les tickets
+    (12, "Versions des fiches de mairie (fiche_mairie), tenues par triggers sur mairie", [
+        '''CREATE TRIGGER IF NOT EXISTS trg_version_mairie_update AFTER UPDATE OF nom, ville ON mairie
+           WHEN NEW.nom IS NOT OLD.nom OR NEW.ville IS NOT OLD.ville
+           BEGIN
+               INSERT INTO cache_version (portee, ident, version) VALUES ('fiche_mairie', NEW.id, 1)
+               ON CONFLICT (portee, ident) DO UPDATE SET version = version + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_version_mairie_delete AFTER DELETE ON mairie
+           BEGIN
+               INSERT INTO cache_version (portee, ident, version) VALUES ('fiche_mairie', OLD.id, 1)
+               ON CONFLICT (portee, ident) DO UPDATE SET version = version + 1;
+           END''',
+    ]),
+    (13, "SLA : retard en heures figé à la clôture (sla_retard_heures)", [
+        "ALTER TABLE ticket ADD COLUMN sla_retard_heures REAL",
+        '''UPDATE ticket SET sla_retard_heures = ROUND((julianday(date_fin)
+               - julianday(COALESCE(sla_echeance, datetime(date_creation, '+72 hours')))) * 24, 2)
+           WHERE statut = 'Terminé' AND sla_depasse AND date_fin IS NOT NULL''',
+    ]),
+    # Mot de passe, codes de récupération, rehachage à la connexion : rien de tout cela n'est
+    # affiché, ça ne doit plus périmer les tableaux de la mairie. Le profil en cache (load_user)
+    # porte aussi premier_login, qui n'avance que la portée de l'usager
+    (14, "trg_version_usager_update limité aux colonnes affichées (nom, prénom, rôle, mairie, service)", [
+        "DROP TRIGGER IF EXISTS trg_version_usager_update",
+        '''CREATE TRIGGER IF NOT EXISTS trg_version_usager_update
+           AFTER UPDATE OF nom, prenom, role, mairie_id, service ON usager
+           WHEN NEW.nom IS NOT OLD.nom OR NEW.prenom IS NOT OLD.prenom OR NEW.role IS NOT OLD.role
+                OR NEW.mairie_id IS NOT OLD.mairie_id OR NEW.service IS NOT OLD.service
+           BEGIN
+               INSERT INTO cache_version (portee, ident, version)
+               SELECT portee, ident, 1 FROM (
+                   SELECT 'usager' AS portee, NEW.id AS ident
+                   UNION SELECT 'mairie' AS portee, NEW.mairie_id AS ident
+                   UNION SELECT 'mairie' AS portee, OLD.mairie_id AS ident
+               ) WHERE ident IS NOT NULL
+               ON CONFLICT (portee, ident) DO UPDATE SET version = version + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_version_usager_profil AFTER UPDATE OF premier_login ON usager
+           WHEN NEW.premier_login IS NOT OLD.premier_login
+           BEGIN
+               INSERT INTO cache_version (portee, ident, version) VALUES ('usager', NEW.id, 1)
+               ON CONFLICT (portee, ident) DO UPDATE SET version = version + 1;
+           END''',
+    ]),
+]
+
+
+
+def version_actuelle(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            date_application DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def appliquer_migrations(conn, cible=None):
+    """Applique les migrations manquantes, chacune dans sa transaction. Renvoie les numéros appliqués."""
+    derniere = MIGRATIONS[-1][0] if cible is None else cible
+    if version_actuelle(conn) >= derniere:
+        return []
+    appliquees = []
+    for numero, description, etapes in MIGRATIONS:
+        if cible is not None and numero > cible:
+            break
+        # BEGIN IMMEDIATE : deux workers qui démarrent ensemble ne migrent pas en double
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if numero <= version_actuelle(conn):
+                conn.rollback()
+                continue
+            if callable(etapes):
+                etapes(conn)
+            else:
+                for sql in etapes:
+                    conn.execute(sql)
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                         (numero, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        appliquees.append(numero)
+    return appliquees
+
+
+# Requêtes des tableaux de bord contrôlées par `flask verifier-plans`
+REQUETES_DASHBOARD = {
+    'dashboard_technicien': ('''
+        SELECT t.*, u.nom as demandeur, u.service
+        FROM ticket t JOIN usager u ON t.createur_id = u.id
+        WHERE t.technicien_id = ? ORDER BY t.date_creation DESC''', (1,)),
+    'espace_mairie': ('''
+        SELECT * FROM ticket WHERE createur_id = ? ORDER BY date_creation DESC''', (1,)),
+    'dashboard_referent (membres)': ('''
+        SELECT id, nom, prenom, email, service FROM usager
+        WHERE mairie_id = ? AND role = 'personnel_mairie' ''', (1,)),
+    'dashboard_referent (tickets)': ('''
+        SELECT t.*, u.nom as demandeur, u.service
+        FROM ticket t JOIN usager u ON t.createur_id = u.id
+        WHERE t.mairie_id = ? ORDER BY t.date_creation DESC''', (1,)),
+    'gestion_equipe': ('''
+        SELECT id, nom, prenom, email, role FROM usager
+        WHERE role IN ('technicien', 'admin_prestataire')''', ()),
+    'prestations_admin (techniciens)': ('''
+        SELECT u.id, u.prenom, u.nom, COALESCE(c.actifs, 0) as charge
+        FROM usager u LEFT JOIN charge_technicien c ON c.technicien_id = u.id
+        WHERE u.role = 'technicien' OR u.role IS NULL''', ()),
+    'prestations_admin (page suivante)': ('''
+        SELECT t.*, u.nom as demandeur, tech.nom as tech_nom
+        FROM ticket t JOIN usager u ON t.createur_id = u.id
+        LEFT JOIN usager tech ON t.technicien_id = tech.id
+        WHERE (t.date_creation, t.id) < (?, ?)
+        ORDER BY t.date_creation DESC, t.id DESC LIMIT 51''', ('2026-01-01 00:00:00', 1)),
+    'prestations_admin (filtre mairie)': ('''
+        SELECT t.*, u.nom as demandeur, tech.nom as tech_nom
+        FROM ticket t JOIN usager u ON t.createur_id = u.id
+        LEFT JOIN usager tech ON t.technicien_id = tech.id
+        WHERE t.mairie_id = ? AND (t.date_creation, t.id) < (?, ?)
+        ORDER BY t.date_creation DESC, t.id DESC LIMIT 51''', (1, '2026-01-01 00:00:00', 1)),
+    'tickets en retard': ('''
+        SELECT id FROM ticket
+        WHERE statut != 'Terminé' AND sla_echeance < datetime('now')''', ()),
+    'rapport (période)': ('''
+        SELECT t.*, u.nom as demandeur, m.nom as nom_mairie, tech.nom as tech_nom
+        FROM ticket t JOIN usager u ON t.createur_id = u.id
+        JOIN mairie m ON t.mairie_id = m.id
+        LEFT JOIN usager tech ON t.technicien_id = tech.id
+        WHERE t.date_creation >= ? AND t.date_creation < ?
+        ORDER BY t.date_creation''', ('2026-01-01 00:00:00', '2026-02-01 00:00:00')),
+    'rapport (version des noms)': ('''
+        SELECT COALESCE(SUM(version), 0) FROM cache_version
+        WHERE portee IN ('fiche_mairie', 'usager')''', ()),
+    'versions des tickets d\'un usager renommé': ('''
+        SELECT technicien_id, mairie_id FROM ticket WHERE createur_id = ?''', (1,)),
+    'api version (portée)': ('''
+        SELECT version FROM cache_version WHERE portee = ? AND ident = ?''', ('technicien', 1)),
+    'api version (globale)': ('''
+        SELECT valeur FROM compteur WHERE nom = 'ticket' ''', ()),
+    'recherche (référent)': (recherche.SQL_RECHERCHE.format(portee="AND t.mairie_id = ?"),
+                             ('"ecran"*', 1, 2001, 21, 0)),
+    'purge tickets terminés': ('''
+        SELECT id FROM ticket
+        WHERE statut = 'Terminé' AND date_fin < datetime('now', '-30 days')''', ()),
+}
+
+
+def _parcours_complets(plan):
+    """Lignes SCAN du plan qui parcourent une vraie table.
+
+    Ne comptent pas : le parcours d'une sous-requête matérialisée (bornée par
+    son propre plan) et une table FTS5 interrogée par MATCH, qui apparaît en
+    "SCAN ... VIRTUAL TABLE INDEX n:M..." alors que c'est une recherche d'index.
+    """
+    intermediaires = {ligne.split()[1] for ligne in plan if ligne.startswith(('MATERIALIZE', 'CO-ROUTINE'))}
+    return [ligne for ligne in plan
+            if ligne.startswith('SCAN')
+            and ligne.split()[1] not in intermediaires
+            and not re.search(r'VIRTUAL TABLE INDEX \d+:M', ligne)]
+
+
+def plans_avec_scan(conn, requetes=None):
+    """Renvoie {nom: [lignes du plan]} pour chaque requête qui parcourt une table entière."""
+    fautives = {}
+    for nom, (sql, params) in (requetes or REQUETES_DASHBOARD).items():
+        plan = [r[3] for r in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        if _parcours_complets(plan):
+            fautives[nom] = plan
+    return fautives
+
+
+def init_app(app):
+    app.config.setdefault('MIGRATIONS_AUTO', True)
+    pool = app.extensions['pool_sqlite']
+
+    if app.config['MIGRATIONS_AUTO']:
+        conn = pool.acquerir()
+        try:
+            appliquees = appliquer_migrations(conn)
+        finally:
+            pool.liberer(conn)
+        if appliquees:
+            app.logger.info("Migrations appliquées : %s", ', '.join(map(str, appliquees)))
+
+    @app.cli.command('migrer')
+    @click.option('--cible', type=int, default=None, help="Version à atteindre (par défaut : la dernière).")
+    def migrer(cible):
+        """Applique les migrations de schéma en attente."""
+        conn = pool.acquerir()
+        try:
+            appliquees = appliquer_migrations(conn, cible)
+            version = version_actuelle(conn)
+        finally:
+            pool.liberer(conn)
+        click.echo(f"Migrations appliquées : {appliquees or 'aucune'} - version du schéma : {version}")
+
+    @app.cli.command('verifier-plans')
+    def verifier_plans():
+        """Échoue si une requête de tableau de bord parcourt une table entière (SCAN)."""
+        conn = pool.acquerir()
+        try:
+            fautives = plans_avec_scan(conn)
+        finally:
+            pool.liberer(conn)
+        for nom, plan in fautives.items():
+            click.echo(f"SCAN dans {nom} :")
+            for ligne in plan:
+                click.echo(f"    {ligne}")
+        if fautives:
+            sys.exit(1)
+        click.echo(f"{len(REQUETES_DASHBOARD)} requêtes vérifiées, aucun SCAN.")
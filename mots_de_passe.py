@@ -0,0 +1,132 @@
+"""Hachage des mots de passe (werkzeug : scrypt ou pbkdf2), calculé dans un pool de threads borné.
+
+Le coût se règle par MDP_METHODE, au format de werkzeug ('scrypt:32768:8:1',
+'pbkdf2:sha256:600000'...). hashlib relâche le GIL pendant le calcul : les
+MDP_THREADS threads du pool hachent en parallèle, et les connexions en trop
+attendent une place (MDP_FILE_MAX au plus) au lieu d'occuper tous les cœurs
+au détriment des autres requêtes du worker. Un mot de passe encore en clair,
+ou haché avec une autre méthode que MDP_METHODE, est rehaché à la première
+connexion réussie. `python outils/bench_mdp.py` mesure les connexions/s par coût.
+"""
+import hmac
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as DelaiDepasse
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+PREFIXES = ('scrypt:', 'pbkdf2:')
+
+
+class HachageSature(Exception):
+    """Trop de calculs en attente : la demande est refusée plutôt que mise en file sans fin."""
+
+
+def est_hache(stocke):
+    """Faux pour un mot de passe encore stocké en clair (comptes d'avant le hachage)."""
+    return bool(stocke) and stocke.startswith(PREFIXES) and stocke.count('$') == 2
+
+
+def methode(stocke):
+    """'scrypt:32768:8:1' pour un hachage werkzeug, None pour un mot de passe en clair."""
+    return stocke.split('$', 1)[0] if est_hache(stocke) else None
+
+
+class Hacheur:
+    """Hache et vérifie les mots de passe dans un pool de threads borné, propre au worker."""
+
+    def __init__(self, methode_hachage='scrypt:32768:8:1', threads=2, file_max=32, attente_max=10.0):
+        # Méthode complète telle que werkzeug l'écrit ('scrypt' -> 'scrypt:32768:8:1') :
+        # c'est elle qu'on compare aux hachages stockés pour savoir s'il faut rehacher
+        self._leurre = generate_password_hash('leurre', methode_hachage)
+        self.methode = methode(self._leurre)
+        self.attente_max = attente_max
+        self._executeur = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='mdp')
+        self._places = threading.BoundedSemaphore(threads + file_max)
+        self._verrou = threading.Lock()
+        self._stats = {'hachages': 0, 'verifications': 0, 'echecs': 0, 'rehachages': 0,
+                       'saturations': 0, 'duree_calcul_s': 0.0}
+        self.threads, self.file_max = threads, file_max
+
+    def _mesurer(self, cle, fonction, *args):
+        debut = time.perf_counter()
+        resultat = fonction(*args)
+        with self._verrou:
+            self._stats[cle] += 1
+            self._stats['duree_calcul_s'] += time.perf_counter() - debut
+        return resultat
+
+    def _soumettre(self, cle, fonction, *args, bloquant=False):
+        # bloquant : un import attend sa place ; une requête de connexion est refusée tout de suite
+        if not self._places.acquire(blocking=bloquant, timeout=self.attente_max if bloquant else None):
+            self.compter('saturations')
+            raise HachageSature(f"{self.threads + self.file_max} calculs de mot de passe déjà en cours")
+        futur = self._executeur.submit(self._mesurer, cle, fonction, *args)
+        futur.add_done_callback(lambda _: self._places.release())
+        return futur
+
+    def _executer(self, cle, fonction, *args):
+        try:
+            return self._soumettre(cle, fonction, *args).result(self.attente_max)
+        except DelaiDepasse:
+            self.compter('saturations')
+            raise HachageSature(f"calcul de mot de passe non terminé après {self.attente_max} s")
+
+    def hacher(self, mdp):
+        return self._executer('hachages', generate_password_hash, mdp, self.methode)
+
+    def hacher_lot(self, mdps):
+        """{mot de passe: hachage} pour un import, un seul calcul par mot de passe distinct.
+
+        Les comptes créés avec le même mot de passe initial partagent son hachage :
+        le casser pour l'un revient de toute façon à le connaître pour tous.
+        """
+        futurs = {mdp: self._soumettre('hachages', generate_password_hash, mdp, self.methode, bloquant=True)
+                  for mdp in set(mdps)}
+        return {mdp: futur.result() for mdp, futur in futurs.items()}
+
+    def verifier(self, stocke, mdp):
+        """(mot de passe correct, nouveau hachage à enregistrer ou None).
+
+        stocke vaut None pour un email inconnu : on paie quand même un calcul
+        complet, pour ne pas révéler par le temps de réponse quels comptes existent.
+        """
+        mdp = mdp or ''
+        if stocke is None:
+            self._executer('verifications', check_password_hash, self._leurre, mdp)
+            ok = False
+        elif est_hache(stocke):
+            ok = self._executer('verifications', check_password_hash, stocke, mdp)
+        else:
+            ok = hmac.compare_digest(stocke.encode(), mdp.encode())
+        if not ok:
+            self.compter('echecs')
+            return False, None
+        if methode(stocke) != self.methode:
+            self.compter('rehachages')
+            return True, self.hacher(mdp)
+        return True, None
+
+    def compter(self, cle, n=1):
+        with self._verrou:
+            self._stats[cle] += n
+
+    def statistiques(self):
+        with self._verrou:
+            calculs = self._stats['hachages'] + self._stats['verifications']
+            return dict(self._stats,
+                        duree_calcul_s=round(self._stats['duree_calcul_s'], 3),
+                        duree_moyenne_ms=round(1000 * self._stats['duree_calcul_s'] / calculs, 1) if calculs else None,
+                        methode=self.methode, threads=self.threads, file_max=self.file_max)
+
+
+def init_app(app):
+    app.config.setdefault('MDP_METHODE', 'scrypt:32768:8:1')
+    app.config.setdefault('MDP_THREADS', 2)
+    app.config.setdefault('MDP_FILE_MAX', 32)
+    app.config.setdefault('MDP_ATTENTE_MAX', 10.0)
+    app.extensions['mots_de_passe'] = Hacheur(app.config['MDP_METHODE'],
+                                              app.config['MDP_THREADS'],
+                                              app.config['MDP_FILE_MAX'],
+                                              app.config['MDP_ATTENTE_MAX'])
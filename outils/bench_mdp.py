@@ -0,0 +1,73 @@
+"""Benchmark des connexions par seconde selon la méthode de hachage des mots de passe.
+
+Pour chaque méthode (format werkzeug de MDP_METHODE), des clients simulés
+vérifient en boucle un mot de passe à travers mots_de_passe.Hacheur, comme la
+route de connexion : même pool borné de MDP_THREADS threads. Affiche les
+connexions/s et la latence p50/p95 vue par un client.
+
+    python outils/bench_mdp.py
+    python outils/bench_mdp.py --methodes scrypt:16384:8:1 pbkdf2:sha256:600000 --threads 4 --clients 16
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+from mots_de_passe import Hacheur  # noqa: E402
+
+METHODES = ['pbkdf2:sha256:100000', 'pbkdf2:sha256:600000',
+            'scrypt:16384:8:1', 'scrypt:32768:8:1', 'scrypt:65536:8:1']
+
+
+def mesurer(methode, threads, clients, duree):
+    hacheur = Hacheur(methode, threads, file_max=clients)
+    stocke = hacheur.hacher('Connexion1$')
+    latences, verrou = [], threading.Lock()
+    fin = time.monotonic() + duree
+
+    def client():
+        mesures = []
+        while time.monotonic() < fin:
+            debut = time.perf_counter()
+            correct, _ = hacheur.verifier(stocke, 'Connexion1$')
+            assert correct
+            mesures.append(time.perf_counter() - debut)
+        with verrou:
+            latences.extend(mesures)
+
+    debut = time.perf_counter()
+    fils = [threading.Thread(target=client) for _ in range(clients)]
+    for f in fils:
+        f.start()
+    for f in fils:
+        f.join()
+    ecoule = time.perf_counter() - debut
+    centiles = statistics.quantiles(latences, n=100) if len(latences) > 1 else latences * 99
+    return {'connexions_s': len(latences) / ecoule,
+            'p50_ms': 1000 * centiles[49],
+            'p95_ms': 1000 * centiles[94],
+            'calcul_ms': hacheur.statistiques()['duree_moyenne_ms']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--methodes', nargs='+', default=METHODES)
+    parser.add_argument('--threads', type=int, default=2, help="MDP_THREADS : taille du pool de hachage.")
+    parser.add_argument('--clients', type=int, default=8, help="Connexions simultanées simulées.")
+    parser.add_argument('--duree', type=float, default=3.0, help="Secondes de mesure par méthode.")
+    args = parser.parse_args()
+
+    print(f"{args.threads} thread(s) de hachage, {args.clients} client(s), {args.duree} s par méthode")
+    for methode in args.methodes:
+        m = mesurer(methode, args.threads, args.clients, args.duree)
+        print(f"{methode:>24} : {m['connexions_s']:>7.1f} connexions/s  "
+              f"calcul {m['calcul_ms']:>6} ms  p50 {m['p50_ms']:>7.1f} ms  p95 {m['p95_ms']:>7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark mémoire du rapport mensuel sur des mois synthétiques.
+
+Pour chaque taille, un process neuf remplit une base temporaire avec N
+tickets du mois courant, construit le PDF en flux (rapports.construire_pdf)
+et mesure son pic de mémoire résidente. Le script échoue si un pic dépasse
+le budget. Les pages étant écrites au fil de l'eau, le pic ne doit pas
+dépendre de N.
+
+    python outils/bench_rapport.py                       # 10k, 100k, 500k
+    python outils/bench_rapport.py --tailles 10000 --budget-mo 48
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+
+def remplir(chemin, n):
+    import migrations
+    conn = sqlite3.connect(chemin)
+    conn.row_factory = sqlite3.Row
+    migrations.appliquer_migrations(conn)
+    conn.execute("INSERT INTO mairie (nom, ville) VALUES ('Mairie centre', 'Amiens')")
+    conn.execute("INSERT INTO usager (nom, prenom, email, mdp, role, mairie_id) "
+                 "VALUES ('Dubois', 'Sophie', 's.dubois@mairie.fr', 'x', 'personnel_mairie', 1)")
+    conn.execute("INSERT INTO usager (nom, prenom, email, mdp, role) "
+                 "VALUES ('Gautier', 'Julien', 'j.gautier@presta.fr', 'x', 'technicien')")
+    contrats = ['Gold', 'Silver', 'Bronze', None]
+    statuts = ['Nouveau', 'En cours', 'En attente de validation', 'Terminé']
+
+    def tickets():
+        for i in range(n):
+            statut = random.choice(statuts)
+            yield (f"Ticket {i}", "Description", 'materiel', statut, 1, 1, 2,
+                   random.choice(contrats), random.randint(1, 100) if statut == 'Terminé' else None)
+
+    conn.executemany('''
+        INSERT INTO ticket (titre, description, type_prestation, statut, createur_id, mairie_id,
+                            technicien_id, contrat, date_creation, date_fin)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?,
+                datetime('now', 'start of month', '+1 hour'),
+                CASE WHEN ?9 IS NULL THEN NULL
+                     ELSE datetime('now', 'start of month', '+1 hour', '+' || ?9 || ' hours') END)
+    ''', tickets())
+    conn.commit()
+    conn.close()
+
+
+def mesurer(n):
+    """Exécuté dans un process dédié : renvoie les mesures pour n tickets."""
+    import rapports
+    with tempfile.TemporaryDirectory() as dossier:
+        base = os.path.join(dossier, 'bench.db')
+        remplir(base, n)
+        avant = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        conn = sqlite3.connect(base)
+        conn.row_factory = sqlite3.Row
+        debut = time.perf_counter()
+        sortie = os.path.join(dossier, 'rapport.pdf')
+        periode = rapports.periode()
+        curseur = conn.execute(rapports.SQL_TICKETS_PERIODE, (periode['debut'], periode['fin']))
+        rapports.construire_pdf(rapports.lire_par_lots(curseur), periode['titre'], sortie)
+        duree = time.perf_counter() - debut
+        apres = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {'tickets': n,
+                'duree_s': round(duree, 2),
+                'pdf_mo': round(os.path.getsize(sortie) / 1e6, 2),
+                # ru_maxrss est en Kio sous Linux
+                'pic_rss_mo': round(apres / 1024, 1),
+                'hausse_pendant_rapport_mo': round((apres - avant) / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tailles', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    parser.add_argument('--budget-mo', type=float, default=64.0,
+                        help="Pic de mémoire résidente maximal accepté par process (Mo).")
+    parser.add_argument('--une-taille', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.une_taille:
+        print(json.dumps(mesurer(args.une_taille)))
+        return
+
+    echecs = 0
+    for n in args.tailles:
+        sortie = subprocess.run([sys.executable, __file__, '--une-taille', str(n)],
+                                capture_output=True, text=True, check=True)
+        mesure = json.loads(sortie.stdout.strip().splitlines()[-1])
+        ok = mesure['pic_rss_mo'] <= args.budget_mo
+        echecs += not ok
+        print(f"{n:>8} tickets : {mesure['duree_s']:>7}s  PDF {mesure['pdf_mo']:>6} Mo  "
+              f"pic RSS {mesure['pic_rss_mo']:>6} Mo (+{mesure['hausse_pendant_rapport_mo']} Mo)"
+              f"  {'OK' if ok else 'BUDGET DÉPASSÉ'}")
+    sys.exit(1 if echecs else 0)
+
+
+if __name__ == '__main__':
+    main()
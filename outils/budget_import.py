@@ -0,0 +1,73 @@
+"""Budget du temps d'import à froid de l'application (python -X importtime).
+
+Chaque essai lance un process neuf qui importe app.py, sans construire
+l'application ni ouvrir la base, et lit le rapport de -X importtime. Affiche
+le temps cumulé et les imports directs les plus lourds. Le script échoue si
+le meilleur essai dépasse le budget ou si un module à charger au premier
+usage (ReportLab, openpyxl...) est importé au démarrage. Les mêmes règles
+sont vérifiées par tests/test_budget_import.py.
+
+    python outils/budget_import.py
+    python outils/budget_import.py --budget-ms 300 --essais 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dépendances lourdes et rares : importées dans la fonction qui s'en sert (rapports.construire_pdf...)
+MODULES_DIFFERES = ['reportlab', 'PIL', 'openpyxl']
+# Temps cumulé de `import app` (ms), mesuré autour de 240 ms dont ~210 pour Flask
+BUDGET_MS = 450.0
+
+
+def mesurer(module):
+    """{nom: (propre_us, cumule_us, profondeur)} pour un import de module dans un process neuf."""
+    resultat = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                              cwd=RACINE, capture_output=True, text=True)
+    if resultat.returncode:
+        raise SystemExit(f"Import de {module} impossible :\n{resultat.stderr[-2000:]}")
+    imports = {}
+    for ligne in resultat.stderr.splitlines():
+        if not ligne.startswith('import time:') or 'self [us]' in ligne:
+            continue
+        propre, cumule, nom = ligne[len('import time:'):].split('|')
+        profondeur = (len(nom) - len(nom.lstrip())) // 2
+        imports[nom.strip()] = (int(propre), int(cumule), profondeur)
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS,
+                        help="Temps cumulé maximal du meilleur essai.")
+    parser.add_argument('--essais', type=int, default=3,
+                        help="Process lancés ; le plus rapide compte (le premier compile aussi les .pyc).")
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    essais = [mesurer(args.module) for _ in range(args.essais)]
+    meilleur = min(essais, key=lambda imports: imports[args.module][1])
+    total_ms = meilleur[args.module][1] / 1000
+    print(f"import {args.module} : {total_ms:.1f} ms (meilleur de {args.essais}, budget {args.budget_ms:.0f} ms)")
+
+    directs = sorted((cumule, nom) for nom, (_, cumule, profondeur) in meilleur.items() if profondeur == 1)
+    for cumule, nom in reversed(directs[-args.top:]):
+        print(f"  {cumule / 1000:>8.1f} ms  {nom}")
+
+    echecs = []
+    if total_ms > args.budget_ms:
+        echecs.append(f"{total_ms:.1f} ms > budget de {args.budget_ms:.0f} ms")
+    presents = sorted({nom.split('.')[0] for nom in meilleur} & set(MODULES_DIFFERES))
+    if presents:
+        echecs.append("modules à charger au premier usage importés au démarrage : " + ", ".join(presents))
+    for message in echecs:
+        print(f"ÉCHEC : {message}")
+    sys.exit(1 if echecs else 0)
+
+
+if __name__ == '__main__':
+    main()
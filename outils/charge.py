@@ -0,0 +1,297 @@
+"""Test de charge : parcours par rôle rejoués en parallèle, latence p50/p95/p99 et débit par route.
+
+Chaque utilisateur simulé est un thread qui se connecte avec un compte de la
+base (générée par outils/generer_donnees.py, mot de passe commun), puis
+enchaîne le parcours de son rôle jusqu'à la fin de la mesure :
+
+- agent de mairie : tableau de bord, API de suivi (ETag), recherche, parfois un nouveau ticket ;
+- technicien      : ses tickets, API, demande de clôture d'un ticket en cours ;
+- référent        : tableau de bord de la mairie, API, confirmation d'une clôture ;
+- admin           : liste filtrée, API admin, assignation d'un ticket nouveau, statistiques.
+
+--mode client passe par le client de test Flask (dans le process, sans
+réseau) ; --mode serveur démarre un serveur WSGI werkzeug multi-thread local
+et l'interroge en HTTP, comme un navigateur. La base passée est modifiée :
+travailler sur une copie.
+
+    python outils/generer_donnees.py --sortie /tmp/charge.db
+    python outils/charge.py --base /tmp/charge.db --utilisateurs 32 --duree 30
+    python outils/charge.py --base /tmp/charge.db --mode serveur --repartition agent=6,technicien=2,referent=1,admin=1
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+from app import create_app  # noqa: E402
+from generer_donnees import MDP_COMPTES  # noqa: E402
+
+MOTS_RECHERCHE = ['wifi', 'écran', 'imprimante', 'excel', 'antivirus', 'vpn', 'windows', 'souris']
+ROLES = {'agent': 'personnel_mairie', 'technicien': 'technicien', 'referent': 'referent',
+         'admin': 'admin_prestataire'}
+
+
+class ClientTest:
+    """Client de test Flask : même interface que ClientHTTP, sans réseau."""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def requete(self, methode, chemin, donnees=None, entetes=None):
+        reponse = self._client.open(chemin, method=methode, data=donnees, headers=entetes or {})
+        return reponse.status_code, reponse.headers, reponse.get_data()
+
+
+class _SansRedirection(urllib.request.HTTPRedirectHandler):
+    # Une redirection est mesurée comme la réponse de sa route, pas suivie
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class ClientHTTP:
+    """Client HTTP avec sa propre session (cookies), vers le serveur local."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self._ouvreur = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _SansRedirection)
+
+    def requete(self, methode, chemin, donnees=None, entetes=None):
+        corps = urllib.parse.urlencode(donnees).encode() if donnees is not None else None
+        demande = urllib.request.Request(self.base_url + chemin, data=corps, method=methode,
+                                         headers=entetes or {})
+        try:
+            with self._ouvreur.open(demande, timeout=60) as reponse:
+                return reponse.status, reponse.headers, reponse.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+
+class Mesures:
+    """Durées par route, partagées par tous les utilisateurs simulés."""
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._durees = {}
+        self._erreurs = {}
+
+    def ajouter(self, route, duree, erreur):
+        with self._verrou:
+            self._durees.setdefault(route, []).append(duree)
+            if erreur:
+                self._erreurs[route] = self._erreurs.get(route, 0) + 1
+
+    def rapport(self, ecoule):
+        lignes = {}
+        with self._verrou:
+            for route, durees in self._durees.items():
+                centiles = statistics.quantiles(durees, n=100) if len(durees) > 1 else durees * 99
+                lignes[route] = {'requetes': len(durees), 'erreurs': self._erreurs.get(route, 0),
+                                 'req_s': round(len(durees) / ecoule, 1),
+                                 'p50_ms': round(1000 * centiles[49], 1),
+                                 'p95_ms': round(1000 * centiles[94], 1),
+                                 'p99_ms': round(1000 * centiles[98], 1)}
+        return lignes
+
+
+class Utilisateur:
+    """Un compte connecté qui rejoue le parcours de son rôle."""
+
+    def __init__(self, client, mesures, email, alea, techniciens):
+        self.client = client
+        self.mesures = mesures
+        self.email = email
+        self.alea = alea
+        self.techniciens = techniciens
+        self.etags = {}
+
+    def appeler(self, route, methode, chemin, donnees=None, attendus=(200, 302, 304)):
+        entetes = {}
+        if chemin in self.etags:
+            entetes['If-None-Match'] = self.etags[chemin]
+        debut = time.perf_counter()
+        statut, reponse_entetes, corps = self.client.requete(methode, chemin, donnees, entetes)
+        self.mesures.ajouter(route, time.perf_counter() - debut, statut not in attendus)
+        if reponse_entetes.get('ETag'):
+            self.etags[chemin] = reponse_entetes['ETag']
+        return statut, corps
+
+    def api(self, route, chemin):
+        """Tickets de l'API de suivi ([] si la copie locale est à jour : 304)."""
+        statut, corps = self.appeler(route, 'GET', chemin)
+        return json.loads(corps)['tickets'] if statut == 200 else []
+
+    def connecter(self):
+        statut, _ = self.appeler('POST /', 'POST', '/', {'email': self.email, 'mdp': MDP_COMPTES}, attendus=(302,))
+        return statut == 302
+
+    def parcours_agent(self):
+        self.appeler('GET /mairie/dashboard', 'GET', '/mairie/dashboard')
+        self.api('GET /api/v1/mairie/tickets', '/api/v1/mairie/tickets')
+        self.appeler('GET /recherche', 'GET', f"/recherche?q={urllib.parse.quote(self.alea.choice(MOTS_RECHERCHE))}")
+        if self.alea.random() < 0.1:
+            self.appeler('POST /mairie/nouveau-ticket', 'POST', '/mairie/nouveau-ticket',
+                         {'titre': 'Poste bloqué', 'description': "L'écran reste figé au démarrage.",
+                          'type_prestation': self.alea.choice(['connexion', 'materiel', 'logiciel'])})
+
+    def parcours_technicien(self):
+        self.appeler('GET /technicien/mes-tickets', 'GET', '/technicien/mes-tickets')
+        tickets = self.api('GET /api/v1/technicien/tickets', '/api/v1/technicien/tickets')
+        en_cours = [t['id'] for t in tickets if t['statut'] == 'En cours']
+        if en_cours and self.alea.random() < 0.3:
+            self.appeler('POST /admin/update_statut/<id>', 'POST', f"/admin/update_statut/{self.alea.choice(en_cours)}",
+                         {'statut': 'Terminé'})
+
+    def parcours_referent(self):
+        self.appeler('GET /referent/dashboard', 'GET', '/referent/dashboard')
+        tickets = self.api('GET /api/v1/referent/tickets', '/api/v1/referent/tickets')
+        a_valider = [t['id'] for t in tickets if t['statut'] == 'En attente de validation']
+        if a_valider and self.alea.random() < 0.3:
+            self.appeler('POST /mairie/confirmer-cloture/<id>', 'POST',
+                         f"/mairie/confirmer-cloture/{self.alea.choice(a_valider)}")
+
+    def parcours_admin(self):
+        self.appeler('GET /admin/prestations', 'GET', '/admin/prestations?statut=Nouveau')
+        nouveaux = self.api('GET /api/v1/admin/tickets', '/api/v1/admin/tickets?statut=Nouveau&taille=50')
+        if nouveaux and self.alea.random() < 0.5:
+            self.appeler('POST /admin/assigner/<id>', 'POST', f"/admin/assigner/{self.alea.choice(nouveaux)['id']}",
+                         {'technicien_id': self.alea.choice(self.techniciens),
+                          'contrat': self.alea.choice(['Gold', 'Silver', 'Bronze'])})
+        if self.alea.random() < 0.2:
+            self.appeler('GET /admin/statistiques', 'GET', '/admin/statistiques')
+
+
+def choisir_comptes(base, repartition, nombre, alea):
+    """[(rôle, email)] : `nombre` comptes distincts selon les poids de repartition."""
+    conn = sqlite3.connect(base)
+    disponibles = {role: [r[0] for r in conn.execute('SELECT email FROM usager WHERE role = ?', (ROLES[role],))]
+                   for role in repartition}
+    techniciens = [r[0] for r in conn.execute("SELECT id FROM usager WHERE role = 'technicien'")]
+    conn.close()
+    for emails in disponibles.values():
+        alea.shuffle(emails)
+    roles = [role for role in repartition if disponibles[role]]
+    comptes, pris = [], dict.fromkeys(roles, 0)
+    for _ in range(nombre):
+        role = alea.choices(roles, [repartition[r] for r in roles])[0]
+        # Plusieurs sessions sur un même compte si le rôle en manque (un seul admin...)
+        emails = disponibles[role]
+        comptes.append((role, emails[pris[role] % len(emails)]))
+        pris[role] += 1
+    return comptes, techniciens
+
+
+def lire_repartition(texte):
+    repartition = {}
+    for morceau in texte.split(','):
+        role, _, poids = morceau.partition('=')
+        if role not in ROLES:
+            raise argparse.ArgumentTypeError(f"rôle inconnu : {role} (choix : {', '.join(ROLES)})")
+        repartition[role] = float(poids)
+    return repartition
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base', required=True, help="Base générée par outils/generer_donnees.py (modifiée).")
+    parser.add_argument('--mode', choices=['client', 'serveur'], default='client')
+    parser.add_argument('--utilisateurs', type=int, default=16, help="Utilisateurs simulés en parallèle.")
+    parser.add_argument('--duree', type=float, default=20.0, help="Secondes de mesure, connexions comprises.")
+    parser.add_argument('--pause', type=float, default=0.0, help="Secondes entre deux parcours d'un utilisateur.")
+    parser.add_argument('--repartition', type=lire_repartition, default='agent=6,technicien=2,referent=1,admin=1')
+    parser.add_argument('--profil', default='production', help="SQLITE_PROFIL de l'application.")
+    parser.add_argument('--json', help="Écrit aussi le rapport dans ce fichier.")
+    parser.add_argument('--graine', type=int, default=1)
+    args = parser.parse_args()
+
+    alea = random.Random(args.graine)
+    comptes, techniciens = choisir_comptes(args.base, args.repartition, args.utilisateurs, alea)
+    dossier = tempfile.mkdtemp(prefix='charge-')
+    app = create_app({
+        'DATABASE': os.path.abspath(args.base),
+        'SECRET_KEY': 'charge',
+        'SQLITE_PROFIL': args.profil,
+        'POOL_TAILLE': args.utilisateurs,
+        'RAPPORTS_DOSSIER': os.path.join(dossier, 'rapports'),
+        'CACHE_CHEMIN': os.path.join(dossier, 'cache.db'),
+        'RETENTION_INTERVALLE': 0,
+        # Toutes les connexions viennent de 127.0.0.1 : la limitation par IP fausserait la mesure
+        'LIMITE_CONNEXION_IP': {'capacite': 10 ** 6, 'par_minute': 10 ** 6},
+        'MDP_FILE_MAX': args.utilisateurs,
+    })
+
+    serveur = None
+    if args.mode == 'serveur':
+        from werkzeug.serving import make_server
+        # Un thread par connexion : l'équivalent d'un worker gthread avec autant de threads que d'utilisateurs
+        serveur = make_server('127.0.0.1', 0, app, threaded=True)
+        serveur.daemon_threads = True
+        threading.Thread(target=serveur.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{serveur.server_port}"
+        fabrique = lambda: ClientHTTP(base_url)  # noqa: E731
+    else:
+        fabrique = lambda: ClientTest(app)  # noqa: E731
+
+    mesures = Mesures()
+    fin = time.monotonic() + args.duree
+    parcours_effectues = []
+
+    def simuler(role, email, graine):
+        utilisateur = Utilisateur(fabrique(), mesures, email, random.Random(graine), techniciens)
+        if not utilisateur.connecter():
+            print(f"Connexion refusée : {email}")
+            return
+        parcours = getattr(utilisateur, f"parcours_{role}")
+        n = 0
+        while time.monotonic() < fin:
+            parcours()
+            n += 1
+            if args.pause:
+                time.sleep(args.pause)
+        parcours_effectues.append(n)
+
+    print(f"{args.utilisateurs} utilisateur(s) ({', '.join(f'{r}={sum(c[0] == r for c in comptes)}' for r in args.repartition)}), "
+          f"mode {args.mode}, {args.duree} s, base {args.base}")
+    debut = time.perf_counter()
+    fils = [threading.Thread(target=simuler, args=(role, email, alea.random())) for role, email in comptes]
+    for f in fils:
+        f.start()
+    for f in fils:
+        f.join()
+    ecoule = time.perf_counter() - debut
+    if serveur:
+        serveur.shutdown()
+    shutil.rmtree(dossier, ignore_errors=True)
+
+    lignes = mesures.rapport(ecoule)
+    total = sum(l['requetes'] for l in lignes.values())
+    largeur = max(map(len, lignes), default=10)
+    print(f"{'route':<{largeur}}  {'requêtes':>8}  {'erreurs':>7}  {'req/s':>7}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}")
+    for route, l in sorted(lignes.items(), key=lambda e: -e[1]['requetes']):
+        print(f"{route:<{largeur}}  {l['requetes']:>8}  {l['erreurs']:>7}  {l['req_s']:>7}  "
+              f"{l['p50_ms']:>8}  {l['p95_ms']:>8}  {l['p99_ms']:>8}")
+    print(f"Total : {total} requêtes en {ecoule:.1f} s, {total / ecoule:.1f} req/s, "
+          f"{sum(parcours_effectues)} parcours")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'parametres': {k: v for k, v in vars(args).items() if k != 'json'},
+                       'duree_s': round(ecoule, 2), 'total_req_s': round(total / ecoule, 1),
+                       'routes': lignes}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
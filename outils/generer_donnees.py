@@ -0,0 +1,318 @@
+"""Génère une base de démonstration à l'échelle réelle : mairies, comptes, tickets, inventaire.
+
+La base est créée par les migrations de l'application, puis remplie en
+quelques transactions (les triggers tiennent à jour l'index de recherche, les
+charges et les versions). Tous les comptes ont le mot de passe MDP_COMPTES,
+haché une seule fois, et premier_login = 0 : outils/charge.py peut s'y
+connecter directement. Même --graine, même base.
+
+    python outils/generer_donnees.py --sortie /tmp/charge.db
+    python outils/generer_donnees.py --sortie /tmp/charge.db --mairies 500 --tickets 1000000 --jours 730
+"""
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+import migrations  # noqa: E402
+from importation import SERVICES  # noqa: E402
+from app import CONFIG_DEFAUT, DUREES_CONTRAT  # noqa: E402
+from sla import SLA_HEURES  # noqa: E402
+from validation import cle_mairie, simplifier_chaine  # noqa: E402
+
+MDP_COMPTES = 'Charge2024$'
+
+VILLES = ['Amiens', 'Abbeville', 'Albert', 'Péronne', 'Montdidier', 'Doullens', 'Ham', 'Roye',
+          'Corbie', 'Rue', 'Nesle', 'Poix-de-Picardie', 'Villers-Bretonneux', 'Friville-Escarbotin']
+QUARTIERS = ['centre', 'nord', 'sud', 'est', 'ouest', 'annexe', 'principale']
+PRENOMS = ['Sophie', 'Julien', 'Marie', 'Thomas', 'Léa', 'Nicolas', 'Camille', 'Hugo', 'Chloé', 'Louis',
+           'Manon', 'Lucas', 'Emma', 'Arthur', 'Inès', 'Paul', 'Zoé', 'Jules', 'Anne', 'Pierre']
+NOMS = ['Dubois', 'Martin', 'Bernard', 'Leblanc', 'Gautier', 'Petit', 'Durand', 'Lefebvre', 'Moreau',
+        'Roux', 'Fournier', 'Girard', 'Bonnet', 'Dupont', 'Lambert', 'Fontaine', 'Rousseau', 'Vincent']
+SPECIALITES = ['Réseaux', 'Poste de travail', 'Logiciels métier', 'Sécurité', 'Téléphonie']
+
+# Type de prestation -> (poids, [(titre, description)])
+SUJETS = {
+    'connexion': (35, [('Coupure Wi-Fi', 'Plus de signal dans la salle du conseil.'),
+                       ('Internet lent', "Les pages mettent plus d'une minute à s'afficher."),
+                       ('VPN en panne', 'Impossible de joindre le serveur depuis la mairie annexe.')]),
+    'materiel': (30, [('Écran noir', "Le poste de l'accueil ne s'allume plus."),
+                      ('Imprimante bloquée', 'Bourrage papier permanent au service urbanisme.'),
+                      ('Souris défectueuse', 'Le clic droit ne répond plus.')]),
+    'logiciel': (25, [('Erreur Excel', "Impossible d'ouvrir les macros du fichier budget."),
+                      ('Logiciel état civil', "Message d'erreur à l'édition des actes."),
+                      ('Mise à jour Windows', 'Le poste redémarre en boucle après la mise à jour.')]),
+    'securite': (10, [('Alerte antivirus', "Un message d'alerte apparaît sur le serveur."),
+                      ('Courriel suspect', 'Pièce jointe ouverte par erreur, poste isolé.')]),
+}
+CONTRATS = (['Gold', 'Silver', 'Bronze'], [20, 50, 30])
+# Tickets récents (moins de 30 jours) : le reste est presque entièrement clos
+STATUTS_RECENTS = (['Nouveau', 'En cours', 'En attente de validation', 'Terminé'], [20, 35, 15, 30])
+STATUTS_ANCIENS = (['Nouveau', 'En cours', 'En attente de validation', 'Terminé'], [1, 3, 2, 94])
+# Délai moyen de résolution (heures) par contrat : une partie dépasse le SLA
+RESOLUTION_HEURES = {'Gold': 5, 'Silver': 20, 'Bronze': 48}
+
+# Tables de l'inventaire, présentes dans la base livrée mais hors migrations
+SQL_INVENTAIRE = [
+    '''CREATE TABLE IF NOT EXISTS mairies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        address TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password_hash TEXT NOT NULL,
+        role TEXT NOT NULL DEFAULT 'utilisateur',
+        mairie_id INTEGER, droit TEXT, can_add INTEGER DEFAULT 0, can_edit INTEGER DEFAULT 0,
+        can_delete INTEGER DEFAULT 0,
+        FOREIGN KEY (mairie_id) REFERENCES mairies(id)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS stock (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        brand TEXT,
+        model TEXT,
+        description TEXT,
+        quantity INTEGER DEFAULT 0,
+        min_quantity INTEGER DEFAULT 5,
+        location TEXT,
+        notes TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        mairie_id INTEGER
+    )''',
+    '''CREATE TABLE IF NOT EXISTS equipment (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        brand TEXT NOT NULL,
+        model TEXT NOT NULL,
+        serial_number TEXT NOT NULL,
+        purchase_date DATE NOT NULL,
+        state TEXT NOT NULL,
+        mairie_id INTEGER NOT NULL,
+        user_id INTEGER,
+        FOREIGN KEY (mairie_id) REFERENCES mairies(id),
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS demandes_equipement (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        mairie_id INTEGER NOT NULL,
+        nom_equipement TEXT NOT NULL,
+        type_equipement TEXT NOT NULL,
+        quantite INTEGER DEFAULT 1,
+        raison TEXT NOT NULL,
+        urgence TEXT DEFAULT 'normale',
+        statut TEXT DEFAULT 'en_attente',
+        date_demande TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        date_traitement TIMESTAMP,
+        commentaire_admin TEXT,
+        commentaire_super_admin TEXT, admin_id INTEGER, notes_admin TEXT, notes_superadmin TEXT,
+        stock_id INTEGER, quantity_requested INTEGER DEFAULT 1,
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (mairie_id) REFERENCES mairies(id)
+    )''',
+]
+MATERIELS = [('PC portable', 'Informatique', 'HP', 'ProBook 450'), ('PC fixe', 'Informatique', 'Dell', 'OptiPlex 7010'),
+             ('Écran 24"', 'Informatique', 'Iiyama', 'ProLite'), ('Imprimante', 'Impression', 'Brother', 'HL-L5100'),
+             ('Téléphone IP', 'Téléphonie', 'Yealink', 'T46U'), ('Onduleur', 'Électrique', 'APC', 'Back-UPS 700')]
+ETATS_EQUIPEMENT = (['En service', 'En panne', 'En réparation', 'Réformé'], [85, 6, 4, 5])
+STATUTS_DEMANDE = (['en_attente', 'validee', 'refusee', 'traitee'], [25, 15, 10, 50])
+
+
+def _format(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _personnes(alea, domaine, n):
+    """n identités distinctes [(nom, prenom, email)], emails au format p.nom@ ou prenom.nom@ exigé par l'application."""
+    identites = {}
+    for nom in NOMS:
+        for prenom in PRENOMS:
+            p, m = simplifier_chaine(prenom), simplifier_chaine(nom)
+            # p.nom n'est pris qu'une fois : Paul et Pierre Martin ne partagent pas p.martin@
+            for local in (f"{p[0]}.{m}", f"{p}.{m}"):
+                identites.setdefault(f"{local}@{domaine}", (nom, prenom))
+    if n > len(identites):
+        raise SystemExit(f"Au plus {len(identites)} comptes par domaine ({domaine}), {n} demandés")
+    return [(*identites[email], email) for email in alea.sample(sorted(identites), n)]
+
+
+def generer_comptes(conn, alea, mdp, n_mairies, n_personnel, n_techniciens):
+    """Mairies, admin, techniciens, un référent et n_personnel agents par mairie. Renvoie les id utiles."""
+    mairies = []
+    for i in range(n_mairies):
+        nom = f"Mairie {QUARTIERS[i % len(QUARTIERS)]} {i + 1}"
+        ville = VILLES[i % len(VILLES)]
+        cur = conn.execute('INSERT INTO mairie (nom, ville, nom_normalise, ville_normalise) VALUES (?, ?, ?, ?)',
+                           (nom, ville, *cle_mairie(nom, ville)))
+        mairies.append(cur.lastrowid)
+
+    comptes = []  # (nom, prenom, email, mdp, role, service, specialite, mairie_id)
+    prestataire = _personnes(alea, 'presta.fr', n_techniciens + 1)
+    nom, prenom, email = prestataire[0]
+    comptes.append((nom, prenom, email, mdp, 'admin_prestataire', None, None, None))
+    for nom, prenom, email in prestataire[1:]:
+        comptes.append((nom, prenom, email, mdp, 'technicien', None, alea.choice(SPECIALITES), None))
+    services = list(SERVICES.values())
+    for mairie_id in mairies:
+        (nom, prenom, email), *agents = _personnes(alea, f"mairie{mairie_id}.fr", n_personnel + 1)
+        comptes.append((nom, prenom, email, mdp, 'referent', None, None, mairie_id))
+        for nom, prenom, email in agents:
+            comptes.append((nom, prenom, email, mdp, 'personnel_mairie', alea.choice(services), None, mairie_id))
+    conn.executemany('''
+        INSERT INTO usager (nom, prenom, email, mdp, role, service, specialite, mairie_id, premier_login)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+    ''', comptes)
+
+    roles = {}
+    for u in conn.execute('SELECT id, role, mairie_id FROM usager'):
+        roles.setdefault(u[1], []).append((u[0], u[2]))
+    return mairies, roles
+
+
+def generer_tickets(conn, alea, n_tickets, jours, admin_id, createurs, techniciens):
+    """n_tickets répartis sur les `jours` derniers jours, aux heures ouvrées, avec statuts et SLA cohérents."""
+    maintenant = datetime.datetime.now().replace(microsecond=0)
+    types = list(SUJETS)
+    poids_types = [SUJETS[t][0] for t in types]
+
+    def lignes():
+        for _ in range(n_tickets):
+            age = alea.random() * jours
+            creation = (maintenant - datetime.timedelta(days=age)).replace(hour=alea.randint(8, 17),
+                                                                            minute=alea.randint(0, 59))
+            creation = min(creation, maintenant - datetime.timedelta(minutes=1))
+            type_p = alea.choices(types, poids_types)[0]
+            titre, description = alea.choice(SUJETS[type_p][1])
+            createur_id, mairie_id = alea.choice(createurs)
+            statut = alea.choices(*(STATUTS_RECENTS if age < 30 else STATUTS_ANCIENS))[0]
+            technicien_id = contrat = duree = echeance = fin = ecoulees = depasse = retard = None
+            if statut != 'Nouveau':
+                technicien_id = alea.choice(techniciens)
+                contrat = alea.choices(*CONTRATS)[0]
+                duree = DUREES_CONTRAT[contrat]
+                echeance = creation + datetime.timedelta(hours=SLA_HEURES[contrat])
+            if statut == 'Terminé':
+                heures = alea.expovariate(1 / RESOLUTION_HEURES[contrat])
+                fin_calculee = min(creation + datetime.timedelta(hours=heures), maintenant)
+                fin = _format(fin_calculee)
+                ecoulees = round((fin_calculee - creation).total_seconds() / 3600, 2)
+                depasse = int(fin_calculee > echeance)
+                if depasse:
+                    retard = round((fin_calculee - echeance).total_seconds() / 3600, 2)
+            yield (titre, description, type_p, statut, _format(creation), createur_id,
+                   admin_id if technicien_id else None, technicien_id, duree, contrat, fin, mairie_id,
+                   _format(echeance) if echeance else None, ecoulees, depasse, retard)
+
+    conn.executemany('''
+        INSERT INTO ticket (titre, description, type_prestation, statut, date_creation, createur_id,
+                            admin_id, technicien_id, duree, contrat, date_fin, mairie_id,
+                            sla_echeance, sla_heures_ecoulees, sla_depasse, sla_retard_heures)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', lignes())
+
+
+def generer_inventaire(conn, alea, mairies, mdp, stock_par_mairie, equipements_par_mairie, demandes_par_mairie):
+    for instruction in SQL_INVENTAIRE:
+        conn.execute(instruction)
+    conn.executemany('INSERT INTO mairies (id, name, address) SELECT id, nom, ville FROM mairie WHERE id = ?',
+                     [(m,) for m in mairies])
+    conn.executemany('INSERT INTO users (username, password_hash, role, mairie_id) VALUES (?, ?, ?, ?)',
+                     [(f"gestion{m}", mdp, 'admin', m) for m in mairies]
+                     + [(f"agent{m}", mdp, 'utilisateur', m) for m in mairies])
+    users = dict(conn.execute("SELECT mairie_id, id FROM users WHERE role = 'utilisateur'").fetchall())
+
+    aujourdhui = datetime.date.today()
+    stock, equipements, demandes = [], [], []
+    for m in mairies:
+        for i in range(stock_par_mairie):
+            nom, type_m, marque, modele = alea.choice(MATERIELS)
+            stock.append((nom, type_m, marque, modele, alea.randint(0, 20), 5, f"Réserve {i + 1}", m))
+        for i in range(equipements_par_mairie):
+            nom, type_m, marque, modele = alea.choice(MATERIELS)
+            achat = aujourdhui - datetime.timedelta(days=alea.randint(30, 2500))
+            equipements.append((nom, type_m, marque, modele, f"SN{m:04d}{i:05d}", achat.isoformat(),
+                                alea.choices(*ETATS_EQUIPEMENT)[0], m, users[m]))
+        for _ in range(demandes_par_mairie):
+            nom, type_m, _, _ = alea.choice(MATERIELS)
+            statut = alea.choices(*STATUTS_DEMANDE)[0]
+            demande = datetime.datetime.now() - datetime.timedelta(days=alea.random() * 365)
+            traitement = _format(demande + datetime.timedelta(days=alea.randint(1, 15))) if statut != 'en_attente' else None
+            quantite = alea.randint(1, 3)
+            demandes.append((users[m], m, nom, type_m, quantite, "Remplacement d'un poste",
+                             alea.choice(['faible', 'normale', 'normale', 'haute']), statut,
+                             _format(demande), traitement, quantite))
+    conn.executemany('''
+        INSERT INTO stock (name, type, brand, model, quantity, min_quantity, location, mairie_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', stock)
+    conn.executemany('''
+        INSERT INTO equipment (name, type, brand, model, serial_number, purchase_date, state, mairie_id, user_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', equipements)
+    conn.executemany('''
+        INSERT INTO demandes_equipement (user_id, mairie_id, nom_equipement, type_equipement, quantite, raison,
+                                         urgence, statut, date_demande, date_traitement, quantity_requested)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', demandes)
+    return len(stock), len(equipements), len(demandes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sortie', required=True, help="Fichier SQLite à créer (refusé s'il existe déjà).")
+    parser.add_argument('--mairies', type=int, default=200)
+    parser.add_argument('--personnel', type=int, default=10, help="Agents par mairie, en plus du référent.")
+    parser.add_argument('--techniciens', type=int, default=40)
+    parser.add_argument('--tickets', type=int, default=200000)
+    parser.add_argument('--jours', type=int, default=365, help="Ancienneté maximale des tickets.")
+    parser.add_argument('--stock', type=int, default=20, help="Articles en stock par mairie.")
+    parser.add_argument('--equipements', type=int, default=60, help="Équipements inventoriés par mairie.")
+    parser.add_argument('--demandes', type=int, default=30, help="Demandes d'équipement par mairie.")
+    parser.add_argument('--graine', type=int, default=1)
+    args = parser.parse_args()
+
+    if os.path.exists(args.sortie):
+        parser.error(f"{args.sortie} existe déjà")
+    alea = random.Random(args.graine)
+    debut = time.perf_counter()
+    # Un seul calcul : tous les comptes partagent le même mot de passe
+    mdp = generate_password_hash(MDP_COMPTES, CONFIG_DEFAUT['MDP_METHODE'])
+
+    conn = sqlite3.connect(args.sortie)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    migrations.appliquer_migrations(conn)
+
+    mairies, roles = generer_comptes(conn, alea, mdp, args.mairies, args.personnel, args.techniciens)
+    conn.commit()
+    createurs = [(u, m) for role in ('personnel_mairie', 'referent') for u, m in roles.get(role, [])]
+    techniciens = [u for u, _ in roles['technicien']]
+    generer_tickets(conn, alea, args.tickets, args.jours, roles['admin_prestataire'][0][0], createurs, techniciens)
+    conn.commit()
+    n_stock, n_equipements, n_demandes = generer_inventaire(conn, alea, mairies, mdp, args.stock,
+                                                             args.equipements, args.demandes)
+    conn.commit()
+    conn.execute('PRAGMA optimize')
+    admin = conn.execute("SELECT email FROM usager WHERE role = 'admin_prestataire'").fetchone()[0]
+    conn.close()
+
+    print(f"{args.sortie} : {len(mairies)} mairies, "
+          + ", ".join(f"{len(ids)} {role}" for role, ids in sorted(roles.items()))
+          + f", {args.tickets} tickets, {n_stock} articles en stock, {n_equipements} équipements, "
+            f"{n_demandes} demandes ({time.perf_counter() - debut:.1f} s)")
+    print(f"Mot de passe de tous les comptes : {MDP_COMPTES} (admin : {admin})")
+
+
+if __name__ == '__main__':
+    main()
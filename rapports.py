@@ -0,0 +1,247 @@
+"""Rapports PDF d'interventions : génération en tâche de fond et cache des fichiers sur disque.
+
+Un rapport couvre une période (mois, trimestre ou plage libre) et est identifié
+par cette période et la version de ses données : nombre de tickets, plus grand
+seq_modif, et versions des fiches de mairies et d'usagers (un renommage change
+le PDF sans toucher aux tickets). Tant que rien ne change, le même fichier est
+resservi ; sinon un job le reconstruit dans le pool de threads.
+
+La file est propre à chaque worker : un fichier verrou créé avec O_EXCL à
+côté du PDF fait qu'un seul process le génère, les autres attendent le
+fichier.
+
+Mémoire : les tickets sont lus par lots et chaque page est écrite dans le
+fichier dès qu'elle est pleine (rapports_pdf). Un job ne garde qu'un lot de
+tickets et une page, quelle que soit la période : un rapport annuel coûte
+le même pic qu'un rapport mensuel (outils/bench_rapport.py).
+"""
+import datetime
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Bornes demi-ouvertes [debut, fin) sur date_creation : l'index idx_ticket_date_creation
+# est utilisable et un mois donné n'inclut plus le même mois des années précédentes
+SQL_TICKETS_PERIODE = '''
+    SELECT t.*,
+           u.nom as demandeur,
+           m.nom as nom_mairie,
+           m.ville as ville_mairie,
+           tech.prenom as tech_prenom,
+           tech.nom as tech_nom
+    FROM ticket t
+    JOIN usager u ON t.createur_id = u.id
+    JOIN mairie m ON t.mairie_id = m.id
+    LEFT JOIN usager tech ON t.technicien_id = tech.id
+    WHERE t.date_creation >= ? AND t.date_creation < ?
+    ORDER BY t.date_creation
+'''
+
+
+class PeriodeInvalide(ValueError):
+    pass
+
+
+def _format_sql(jour):
+    return jour.strftime('%Y-%m-%d 00:00:00')
+
+
+def _mois_suivant(jour):
+    return datetime.date(jour.year + jour.month // 12, jour.month % 12 + 1, 1)
+
+
+def periode(mois=None, trimestre=None, du=None, au=None, aujourdhui=None):
+    """Décrit la période d'un rapport : {'cle', 'debut', 'fin', 'titre'}.
+
+    - du / au      : 'AAAA-MM-JJ', au inclus ;
+    - trimestre    : 'AAAA-T1' à 'AAAA-T4' ;
+    - mois         : 'AAAA-MM' ;
+    - rien         : le mois en cours.
+    """
+    try:
+        if du or au:
+            premier = datetime.date.fromisoformat(du)
+            dernier = datetime.date.fromisoformat(au)
+            if dernier < premier:
+                raise PeriodeInvalide("La date de fin précède la date de début.")
+            return {'cle': f"{premier}_{dernier}",
+                    'debut': _format_sql(premier),
+                    'fin': _format_sql(dernier + datetime.timedelta(days=1)),
+                    'titre': f"du {premier:%d/%m/%Y} au {dernier:%d/%m/%Y}"}
+        if trimestre:
+            annee, _, numero = trimestre.upper().partition('-T')
+            numero = int(numero)
+            if not 1 <= numero <= 4:
+                raise PeriodeInvalide(f"Trimestre inconnu : {trimestre}")
+            premier = datetime.date(int(annee), 3 * numero - 2, 1)
+            fin = _mois_suivant(_mois_suivant(_mois_suivant(premier)))
+            return {'cle': f"{premier.year}-T{numero}",
+                    'debut': _format_sql(premier),
+                    'fin': _format_sql(fin),
+                    'titre': f"T{numero} {premier.year}"}
+        if mois:
+            premier = datetime.datetime.strptime(mois, '%Y-%m').date()
+        else:
+            premier = (aujourdhui or datetime.date.today()).replace(day=1)
+    except PeriodeInvalide:
+        raise
+    except (TypeError, ValueError) as e:
+        raise PeriodeInvalide(f"Période invalide : {e}")
+    return {'cle': f"{premier:%Y-%m}",
+            'debut': _format_sql(premier),
+            'fin': _format_sql(_mois_suivant(premier)),
+            'titre': premier.strftime("%B %Y")}
+
+
+# Noms des mairies et des usagers (techniciens, demandeurs) imprimés dans le rapport.
+# Pas la portée 'mairie', qui suit aussi chaque écriture de ticket, de toute période
+SQL_VERSION_NOMS = '''
+    SELECT COALESCE(SUM(version), 0) FROM cache_version
+    WHERE portee IN ('fiche_mairie', 'usager')
+'''
+
+
+def version_donnees(conn, periode):
+    """Empreinte des données du rapport ; elle change à chaque ajout, modification ou suppression
+    d'un ticket de la période, et à chaque renommage de mairie ou d'usager."""
+    nombre, seq = conn.execute('''
+        SELECT COUNT(*), COALESCE(MAX(seq_modif), 0) FROM ticket t
+        WHERE t.date_creation >= ? AND t.date_creation < ?
+    ''', (periode['debut'], periode['fin'])).fetchone()
+    noms = conn.execute(SQL_VERSION_NOMS).fetchone()[0]
+    return f"{nombre}-{seq}-{noms}"
+
+
+def lire_par_lots(curseur, taille_lot=500):
+    """Parcourt un curseur avec fetchmany, sans jamais charger tout le résultat."""
+    while True:
+        lot = curseur.fetchmany(taille_lot)
+        if not lot:
+            return
+        yield from lot
+
+
+def construire_pdf(tickets, titre_periode, sortie):
+    """Écrit le PDF du rapport dans sortie (chemin ou fichier binaire).
+
+    tickets peut être un itérable paresseux (voir lire_par_lots) : les lignes
+    sont converties et écrites par pages (rapports_pdf.LIGNES_PAR_PAGE).
+    """
+    # Import différé : ReportLab n'est chargé qu'au premier rapport
+    import rapports_pdf
+    rapports_pdf.construire_pdf(tickets, titre_periode, sortie)
+
+
+class FileRapports:
+    """File locale (pool de threads, sans broker) des générations de rapports."""
+
+    def __init__(self, pool, dossier, workers=1, historique=100, verrou_max=900):
+        self.pool = pool
+        self.dossier = dossier
+        self.historique = historique
+        self.verrou_max = verrou_max
+        self._executeur = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rapport')
+        self._jobs = OrderedDict()
+        self._verrou = threading.Lock()
+        os.makedirs(dossier, exist_ok=True)
+
+    def chemin(self, periode, version):
+        return os.path.join(self.dossier, f"rapport_{periode['cle']}_{version}.pdf")
+
+    def demander(self, periode, version):
+        """Renvoie le job qui produit (période, version), en le créant si aucun n'est déjà en cours."""
+        with self._verrou:
+            for job in self._jobs.values():
+                if job['periode'] == periode and job['version'] == version and job['statut'] != 'erreur':
+                    return job
+            job = {'id': uuid.uuid4().hex, 'periode': periode, 'version': version,
+                   'statut': 'en_attente', 'erreur': None,
+                   'cree_a': time.time(), 'duree': None}
+            self._jobs[job['id']] = job
+            while len(self._jobs) > self.historique:
+                self._jobs.popitem(last=False)
+        self._executeur.submit(self._executer, job)
+        return job
+
+    def etat(self, job_id):
+        with self._verrou:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _prendre_verrou(self, destination):
+        """Crée le verrou de destination (O_EXCL) ; False si le PDF a été produit par un autre process."""
+        verrou = f"{destination}.verrou"
+        while True:
+            try:
+                os.close(os.open(verrou, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                # Un autre worker a pu terminer entre son test et notre verrou
+                if os.path.exists(destination):
+                    os.remove(verrou)
+                    return False
+                return True
+            except FileExistsError:
+                pass
+            if os.path.exists(destination):
+                return False
+            try:
+                # Verrou laissé par un worker arrêté en pleine génération
+                if time.time() - os.path.getmtime(verrou) > self.verrou_max:
+                    os.remove(verrou)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.5)
+
+    def _executer(self, job):
+        job['statut'] = 'en_cours'
+        debut = time.perf_counter()
+        periode = job['periode']
+        destination = self.chemin(periode, job['version'])
+        temporaire = f"{destination}.{job['id']}.tmp"
+        verrouille = False
+        try:
+            verrouille = self._prendre_verrou(destination)
+            if not verrouille:
+                job['statut'] = 'termine'
+                return
+            conn = self.pool.acquerir()
+            try:
+                # En WAL, cette lecture longue ne bloque pas les écritures des routes
+                curseur = conn.execute(SQL_TICKETS_PERIODE, (periode['debut'], periode['fin']))
+                construire_pdf(lire_par_lots(curseur), periode['titre'], temporaire)
+            finally:
+                self.pool.liberer(conn)
+            # Renommage atomique : un téléchargement ne voit jamais un PDF à moitié écrit
+            os.replace(temporaire, destination)
+            self._supprimer_anciennes_versions(periode, destination)
+            job['statut'] = 'termine'
+        except Exception as e:
+            job['statut'] = 'erreur'
+            job['erreur'] = str(e)
+            if os.path.exists(temporaire):
+                os.remove(temporaire)
+        finally:
+            if verrouille:
+                os.remove(f"{destination}.verrou")
+            job['duree'] = round(time.perf_counter() - debut, 3)
+
+    def _supprimer_anciennes_versions(self, periode, a_garder):
+        prefixe = f"rapport_{periode['cle']}_"
+        for nom in os.listdir(self.dossier):
+            chemin = os.path.join(self.dossier, nom)
+            if nom.startswith(prefixe) and nom.endswith('.pdf') and chemin != a_garder:
+                os.remove(chemin)
+
+
+def init_app(app):
+    app.config.setdefault('RAPPORTS_DOSSIER', os.path.join(app.instance_path, 'rapports'))
+    app.config.setdefault('RAPPORTS_WORKERS', 1)
+    # Âge (secondes) au-delà duquel le verrou d'une génération est tenu pour abandonné
+    app.config.setdefault('RAPPORTS_VERROU_MAX', 900)
+    app.extensions['rapports'] = FileRapports(app.extensions['pool_sqlite'],
+                                              app.config['RAPPORTS_DOSSIER'],
+                                              app.config['RAPPORTS_WORKERS'],
+                                              verrou_max=app.config['RAPPORTS_VERROU_MAX'])
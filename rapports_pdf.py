@@ -0,0 +1,211 @@
+"""Mise en page du rapport d'interventions, écrite page par page dans le fichier.
+
+Chaque page est dessinée puis écrite tout de suite (flux zlib) : le process ne
+garde que la position de chaque objet PDF (8 octets), quel que soit le nombre
+de tickets. Le PDF n'utilise que les polices standard Helvetica, sans
+incorporation ; ReportLab ne sert qu'à mesurer les textes pour les centrer.
+
+Module à part pour que ReportLab ne soit chargé qu'au premier rapport
+construit, dans le thread du job, et pas au démarrage de chaque worker : voir
+rapports.construire_pdf.
+"""
+import array
+import functools
+import os
+import zlib
+
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+
+ENTETE = ['Date', 'Mairie / Ville', 'Sujet', 'Intervenant', 'Contrat', 'SLA']
+LARGEURS = [60, 100, 110, 90, 60, 80]
+
+# A4 en points, marges du rapport
+LARGEUR_PAGE, HAUTEUR_PAGE = 595.2756, 841.8898
+MARGE_HAUT = 36
+
+TAILLE_TITRE = 18
+TAILLE_TEXTE = 9
+INTERLIGNE = 10.8
+MARGE_CELLULE = 3
+HAUTEUR_ENTETE = INTERLIGNE + 2 * MARGE_CELLULE
+# Chaque ligne a deux lignes de texte (mairie, puis ville)
+HAUTEUR_LIGNE = 2 * INTERLIGNE + 2 * MARGE_CELLULE
+# Lignes par page : l'entête, le titre (première page) et 26 lignes tiennent dans la hauteur utile
+LIGNES_PAR_PAGE = 26
+# Tableau centré sur la page
+GAUCHE_TABLEAU = (LARGEUR_PAGE - sum(LARGEURS)) / 2
+DROITE_TABLEAU = GAUCHE_TABLEAU + sum(LARGEURS)
+
+# Couleurs RVB : entête #2c3e50, texte d'entête et lignes paires whitesmoke, grille grise
+FOND_ENTETE = (0.173, 0.243, 0.314)
+BLANC_FUME = (0.961, 0.961, 0.961)
+BLANC = (1, 1, 1)
+NOIR = (0, 0, 0)
+GRILLE = (0.502, 0.502, 0.502)
+
+POLICES = {'F1': 'Helvetica', 'F2': 'Helvetica-Bold'}
+
+
+def ligne_rapport(t):
+    # Dépassement et retard figés à la clôture (voir sla.py)
+    sla_info = "OK"
+    if t['statut'] == 'Terminé' and t['sla_depasse']:
+        sla_info = f"RETARD (+{int(t['sla_retard_heures'])}h)"
+
+    return [
+        t['date_creation'][:10],
+        f"{t['nom_mairie']}\n({t['ville_mairie']})",
+        t['titre'][:20],
+        f"{t['tech_prenom']} {t['tech_nom'][0] if t['tech_nom'] else ''}.",
+        t['contrat'] if t['contrat'] else "-",
+        sla_info
+    ]
+
+
+# Dates, mairies, contrats, techniciens : les mêmes textes reviennent à chaque page
+@functools.lru_cache(maxsize=4096)
+def _texte_mesure(texte, police, taille):
+    return stringWidth(texte, POLICES[police], taille), _chaine(texte)
+
+
+def _chaine(texte):
+    # Chaîne littérale PDF en WinAnsiEncoding ; hors de ce jeu, le caractère devient « ? »
+    brut = texte.encode('cp1252', errors='replace')
+    return b'(' + brut.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _couleur(rvb, operateur):
+    return ('%.3f %.3f %.3f %s' % (*rvb, operateur)).encode()
+
+
+class _Page:
+    """Opérateurs de dessin d'une seule page, dans le repère PDF (origine en bas à gauche)."""
+
+    def __init__(self):
+        self.operations = []
+
+    def texte_centre(self, texte, police, taille, x_centre, y):
+        largeur, chaine = _texte_mesure(texte, police, taille)
+        self.operations.append(b'BT /%s %d Tf %.2f %.2f Td %s Tj ET'
+                               % (police.encode(), taille, x_centre - largeur / 2, y, chaine))
+
+    def rectangle(self, x, y, largeur, hauteur, fond):
+        self.operations.append(_couleur(fond, 'rg'))
+        self.operations.append(b'%.2f %.2f %.2f %.2f re f' % (x, y, largeur, hauteur))
+
+    def ligne_tableau(self, cellules, haut, hauteur, fond, police, couleur_texte):
+        x = GAUCHE_TABLEAU
+        self.rectangle(x, haut - hauteur, DROITE_TABLEAU - GAUCHE_TABLEAU, hauteur, fond)
+        self.operations.append(_couleur(couleur_texte, 'rg'))
+        for cellule, largeur in zip(cellules, LARGEURS):
+            lignes = cellule.split('\n')
+            # Bloc de texte centré verticalement dans la cellule
+            base = haut - (hauteur - len(lignes) * INTERLIGNE) / 2 - TAILLE_TEXTE
+            for i, texte in enumerate(lignes):
+                self.texte_centre(texte, police, TAILLE_TEXTE, x + largeur / 2, base - i * INTERLIGNE)
+            x += largeur
+
+    def grille(self, haut, hauteurs):
+        gauche, droite = GAUCHE_TABLEAU, DROITE_TABLEAU
+        bas = haut - sum(hauteurs)
+        self.operations.append(_couleur(GRILLE, 'RG') + b' 0.5 w')
+        y = haut
+        for hauteur in [0] + hauteurs:
+            y -= hauteur
+            self.operations.append(b'%.2f %.2f m %.2f %.2f l S' % (gauche, y, droite, y))
+        x = gauche
+        for largeur in [0] + LARGEURS:
+            x += largeur
+            self.operations.append(b'%.2f %.2f m %.2f %.2f l S' % (x, haut, x, bas))
+
+    def contenu(self):
+        return zlib.compress(b'\n'.join(self.operations))
+
+
+class _EcrivainPDF:
+    """Écrit un PDF objet par objet : seules les positions des objets restent en mémoire.
+
+    Objets 1 à 4 : catalogue, arbre des pages (écrit à la fin), polices ;
+    puis, pour la page k, son contenu (5 + 2k) et la page elle-même (6 + 2k).
+    """
+
+    def __init__(self, fichier):
+        self.fichier = fichier
+        self.positions = array.array('Q', [0] * 5)
+        self.pages = 0
+        fichier.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._objet(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        for numero, nom in ((3, 'Helvetica'), (4, 'Helvetica-Bold')):
+            self._objet(numero, b'<< /Type /Font /Subtype /Type1 /BaseFont /%s '
+                                b'/Encoding /WinAnsiEncoding >>' % nom.encode())
+
+    def _objet(self, numero, corps):
+        if numero < len(self.positions):
+            self.positions[numero] = self.fichier.tell()
+        else:
+            self.positions.append(self.fichier.tell())
+        self.fichier.write(b'%d 0 obj\n' % numero + corps + b'\nendobj\n')
+
+    def ajouter_page(self, page):
+        contenu = page.contenu()
+        numero = 5 + 2 * self.pages
+        self._objet(numero, b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(contenu)
+                    + contenu + b'\nendstream')
+        self._objet(numero + 1, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.4f %.4f] '
+                                b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>'
+                    % (LARGEUR_PAGE, HAUTEUR_PAGE, numero))
+        self.pages += 1
+
+    def terminer(self):
+        self.positions[2] = self.fichier.tell()
+        self.fichier.write(b'2 0 obj\n<< /Type /Pages /Count %d /Kids [' % self.pages)
+        for k in range(self.pages):
+            self.fichier.write(b'%d 0 R ' % (6 + 2 * k))
+        self.fichier.write(b'] >>\nendobj\n')
+        debut_xref = self.fichier.tell()
+        self.fichier.write(b'xref\n0 %d\n0000000000 65535 f \n' % len(self.positions))
+        for position in self.positions[1:]:
+            self.fichier.write(b'%010d 00000 n \n' % position)
+        self.fichier.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                           % (len(self.positions), debut_xref))
+
+
+def _dessiner_page(lignes, titre):
+    page = _Page()
+    haut = HAUTEUR_PAGE - MARGE_HAUT
+    if titre:
+        page.operations.append(_couleur(NOIR, 'rg'))
+        page.texte_centre(titre, 'F2', TAILLE_TITRE, LARGEUR_PAGE / 2, haut - TAILLE_TITRE)
+        haut -= 40
+    page.ligne_tableau(ENTETE, haut, HAUTEUR_ENTETE, FOND_ENTETE, 'F2', BLANC_FUME)
+    y = haut - HAUTEUR_ENTETE
+    for i, cellules in enumerate(lignes):
+        page.ligne_tableau(cellules, y, HAUTEUR_LIGNE, BLANC if i % 2 == 0 else BLANC_FUME, 'F1', NOIR)
+        y -= HAUTEUR_LIGNE
+    page.grille(haut, [HAUTEUR_ENTETE] + [HAUTEUR_LIGNE] * len(lignes))
+    return page
+
+
+def construire_pdf(tickets, titre_periode, sortie):
+    """Écrit le PDF du rapport dans sortie (chemin ou fichier binaire).
+
+    tickets peut être un itérable paresseux (voir rapports.lire_par_lots) : les lignes
+    sont converties et écrites par pages de LIGNES_PAR_PAGE, l'entête répété sur chacune.
+    """
+    if isinstance(sortie, (str, os.PathLike)):
+        with open(sortie, 'wb') as fichier:
+            return construire_pdf(tickets, titre_periode, fichier)
+
+    ecrivain = _EcrivainPDF(sortie)
+    titre = f"Rapport d'Interventions - {titre_periode}"
+    lignes = []
+    for t in tickets:
+        lignes.append(ligne_rapport(t))
+        if len(lignes) == LIGNES_PAR_PAGE:
+            ecrivain.ajouter_page(_dessiner_page(lignes, titre))
+            lignes, titre = [], None
+    # Période vide : on garde au moins le titre et l'entête du tableau
+    if lignes or ecrivain.pages == 0:
+        ecrivain.ajouter_page(_dessiner_page(lignes, titre))
+    ecrivain.terminer()
@@ -0,0 +1,124 @@
+"""Recherche plein texte sur le titre et la description des tickets (FTS5).
+
+ticket_fts est un index FTS5 à contenu externe : il ne stocke que l'index, le
+texte reste dans ticket. Des triggers sur ticket le tiennent à jour
+(migration 8). Le tokenizer unicode61 avec remove_diacritics ignore les
+accents et la casse, comme simplifier_chaine. `flask reindexer-recherche`
+reconstruit l'index en cas de doute.
+"""
+import re
+import unicodedata
+
+import click
+
+SQL_RECONSTRUCTION = "INSERT INTO ticket_fts (ticket_fts) VALUES ('rebuild')"
+
+# Classement bm25 (le titre compte trois fois plus que la description) des
+# candidats les plus récents de la portée : l'index est lu par rowid décroissant
+# et s'arrête après `candidats` lignes, même pour un mot présent partout (classer
+# tout l'ensemble MATCH coûte jusqu'à 0,7 s sur 500 000 tickets). nb_candidats
+# compte les candidats lus : un de plus que la limite signale une recherche tronquée
+SQL_RECHERCHE = '''
+    SELECT t.id, t.titre, t.description, t.statut, t.type_prestation, t.contrat, t.date_creation,
+           t.mairie_id, t.technicien_id, t.createur_id, c.score, COUNT(*) OVER () as nb_candidats
+    FROM (
+        SELECT ticket_fts.rowid as id, bm25(ticket_fts, 3.0, 1.0) as score
+        FROM ticket_fts
+        JOIN ticket t ON t.id = ticket_fts.rowid
+        WHERE ticket_fts MATCH ? {portee}
+        ORDER BY ticket_fts.rowid DESC
+        LIMIT ?
+    ) c
+    JOIN ticket t ON t.id = c.id
+    ORDER BY c.score
+    LIMIT ? OFFSET ?
+'''
+
+_MOT = re.compile(r'\w+')
+
+
+def _normaliser(mot):
+    # Même repli que le tokenizer (et que simplifier_chaine) : sans accents, en minuscules
+    mot = unicodedata.normalize('NFD', mot)
+    return "".join(c for c in mot if unicodedata.category(c) != 'Mn').lower()
+
+
+def extrait(texte, mots, largeur=12):
+    """Passage de texte autour du premier mot trouvé, mots trouvés entre crochets.
+
+    Fait en Python sur la description déjà lue : snippet() de FTS5 relancerait
+    la requête MATCH (et l'expansion du préfixe) pour chaque ticket de la page.
+    """
+    # Comme requete_fts : mots entiers, sauf le dernier cherché en préfixe
+    *complets, prefixe = [_normaliser(m) for m in mots]
+    morceaux = (texte or '').split()
+    trouves = [any(j in complets or j.startswith(prefixe) for j in _MOT.findall(_normaliser(m)))
+               for m in morceaux]
+    debut = max(0, trouves.index(True) - 2) if True in trouves else 0
+    fenetre = [f"[{m}]" if t else m for m, t in zip(morceaux[debut:debut + largeur], trouves[debut:debut + largeur])]
+    return ('…' if debut else '') + ' '.join(fenetre) + ('…' if debut + largeur < len(morceaux) else '')
+
+
+def requete_fts(texte):
+    """Saisie libre -> requête MATCH : tous les mots exigés, le dernier en préfixe.
+
+    Chaque mot est mis entre guillemets : la syntaxe FTS5 (AND, NEAR, *, ^...)
+    tapée par l'usager n'est jamais interprétée. None si rien à chercher.
+    """
+    mots = _MOT.findall(texte or '')
+    if not mots:
+        return None
+    return ' '.join(f'"{m}"' for m in mots) + '*'
+
+
+def rechercher(conn, texte, condition=None, params=(), limite=20, decalage=0, candidats=2000):
+    """Tickets correspondant à texte, du plus au moins pertinent, limités à une portée SQL sur t.
+
+    Renvoie (tickets, tronque) : des dicts avec un champ 'extrait' (passage de la
+    description, mots trouvés entre crochets), et vrai si plus de `candidats`
+    tickets correspondent, auquel cas seuls les plus récents ont été classés.
+    """
+    requete = requete_fts(texte)
+    if requete is None:
+        return [], False
+    mots = _MOT.findall(texte)
+    portee = f"AND {condition}" if condition else ""
+    tickets = [dict(t) for t in conn.execute(SQL_RECHERCHE.format(portee=portee),
+                                             [requete, *params, candidats + 1, limite, decalage])]
+    tronque = bool(tickets) and tickets[0]['nb_candidats'] > candidats
+    for t in tickets:
+        del t['nb_candidats']
+        t['extrait'] = extrait(t['description'], mots)
+    return tickets, tronque
+
+
+def reconstruire(conn):
+    """Réindexe tous les tickets puis compacte l'index. Renvoie le nombre de tickets indexés."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(SQL_RECONSTRUCTION)
+        conn.execute("INSERT INTO ticket_fts (ticket_fts) VALUES ('optimize')")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return conn.execute('SELECT COUNT(*) FROM ticket').fetchone()[0]
+
+
+def init_app(app):
+    app.config.setdefault('RECHERCHE_PAR_PAGE', 20)
+    app.config.setdefault('RECHERCHE_PAGES_MAX', 50)
+    # Tickets récents classés par pertinence : borne le coût d'un mot très courant.
+    # Au-delà, la recherche le signale et se précise par période (du / au)
+    app.config.setdefault('RECHERCHE_CANDIDATS', 2000)
+
+    @app.cli.command('reindexer-recherche')
+    def reindexer_recherche():
+        """Reconstruit l'index plein texte des tickets depuis la table ticket."""
+        pool = app.extensions['pool_sqlite']
+        conn = pool.acquerir()
+        try:
+            n = reconstruire(conn)
+        finally:
+            pool.liberer(conn)
+        click.echo(f"Index de recherche reconstruit : {n} ticket(s).")
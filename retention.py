@@ -0,0 +1,106 @@
+"""Rétention des tickets : purge par lots, hors des routes GET.
+
+La purge tourne dans un thread de fond de chaque worker (RETENTION_INTERVALLE
+secondes, 0 pour désactiver) ou à la main via `flask purger`.
+"""
+import threading
+import time
+
+import click
+
+
+def purger(conn, regles, taille_lot=500):
+    """Supprime les tickets dont date_fin dépasse la rétention de leur statut.
+
+    regles : {statut: jours}. Chaque lot est une transaction courte, pour ne
+    jamais garder le verrou d'écriture longtemps. Renvoie {statut: lignes supprimées}.
+    """
+    supprimes = {}
+    for statut, jours in regles.items():
+        total = 0
+        while True:
+            cur = conn.execute('''
+                DELETE FROM ticket WHERE id IN (
+                    SELECT id FROM ticket
+                    WHERE statut = ? AND date_fin < datetime('now', ?)
+                    LIMIT ?)
+            ''', (statut, f'-{int(jours)} days', taille_lot))
+            conn.commit()
+            total += cur.rowcount
+            if cur.rowcount < taille_lot:
+                break
+        supprimes[statut] = total
+    return supprimes
+
+
+def compter(conn, regles):
+    """Nombre de tickets que purger() supprimerait, par statut."""
+    return {statut: conn.execute('''
+                SELECT COUNT(*) FROM ticket
+                WHERE statut = ? AND date_fin < datetime('now', ?)
+            ''', (statut, f'-{int(jours)} days')).fetchone()[0]
+            for statut, jours in regles.items()}
+
+
+def executer(app):
+    pool = app.extensions['pool_sqlite']
+    debut = time.perf_counter()
+    conn = pool.acquerir()
+    try:
+        supprimes = purger(conn, app.config['RETENTION_JOURS'], app.config['RETENTION_LOT'])
+    finally:
+        pool.liberer(conn)
+    app.logger.info("Rétention : %d ticket(s) purgé(s) en %.2fs (%s)", sum(supprimes.values()),
+                    time.perf_counter() - debut, ', '.join(f"{statut}: {n}" for statut, n in supprimes.items()))
+    return supprimes
+
+
+class PlanificateurRetention(threading.Thread):
+    def __init__(self, app):
+        super().__init__(name='retention', daemon=True)
+        self.app = app
+        self.arret = threading.Event()
+
+    def run(self):
+        intervalle = self.app.config['RETENTION_INTERVALLE']
+        while not self.arret.wait(intervalle):
+            try:
+                executer(self.app)
+            except Exception:
+                # Le thread ne doit pas mourir pour une base momentanément verrouillée
+                self.app.logger.exception("Rétention : échec de la purge")
+
+
+def init_app(app):
+    app.config.setdefault('RETENTION_JOURS', {'Terminé': 30})
+    app.config.setdefault('RETENTION_LOT', 500)
+    app.config.setdefault('RETENTION_INTERVALLE', 3600)
+
+    verrou = threading.Lock()
+
+    @app.before_request
+    def _demarrer_planificateur():
+        # Démarré à la première requête, donc dans le process du worker (après un fork éventuel)
+        if app.extensions.get('retention') is not None or not app.config['RETENTION_INTERVALLE']:
+            return
+        with verrou:
+            if app.extensions.get('retention') is None:
+                planificateur = PlanificateurRetention(app)
+                planificateur.start()
+                app.extensions['retention'] = planificateur
+
+    @app.cli.command('purger')
+    @click.option('--simulation', is_flag=True, help="Compte les tickets concernés sans rien supprimer.")
+    def purger_commande(simulation):
+        """Purge les tickets clos au-delà de leur durée de rétention."""
+        if simulation:
+            pool = app.extensions['pool_sqlite']
+            conn = pool.acquerir()
+            try:
+                for statut, n in compter(conn, app.config['RETENTION_JOURS']).items():
+                    click.echo(f"{statut} : {n} ticket(s) à purger")
+            finally:
+                pool.liberer(conn)
+        else:
+            for statut, n in executer(app).items():
+                click.echo(f"{statut} : {n} ticket(s) purgé(s)")
@@ -0,0 +1,23 @@
+"""Délais d'intervention (SLA) par contrat, pour l'application, les tableaux et le rapport PDF.
+
+L'échéance d'un ticket (sla_echeance) est fixée à l'assignation ; à la
+clôture, le temps écoulé, le dépassement et le retard sont figés
+(sla_heures_ecoulees, sla_depasse, sla_retard_heures) par SQL_CLOTURE. Les
+tableaux et le rapport lisent ces colonnes, jamais le contrat : changer un
+délai ici ne réécrit pas l'histoire des tickets déjà assignés. Les
+migrations 7 et 13 gardent leur propre copie de la règle, le texte d'une
+migration appliquée ne change plus.
+"""
+
+# Délai d'intervention par contrat, en heures
+SLA_HEURES = {'Gold': 4, 'Silver': 24, 'Bronze': 72}
+# Sans contrat (ticket jamais assigné) ou contrat inconnu
+SLA_DEFAUT_HEURES = 72
+
+
+def limite_heures(contrat):
+    return SLA_HEURES.get(contrat, SLA_DEFAUT_HEURES)
+
+
+# Échéance d'un ticket en SQL ; un ticket clos sans avoir été assigné n'en a pas : délai par défaut
+SQL_ECHEANCE = f"COALESCE(sla_echeance, datetime(date_creation, '+{SLA_DEFAUT_HEURES} hours'))"
@@ -0,0 +1,63 @@
+"""Base neuve migrée pour les tests, remplie au besoin par les fonctions inserer_*.
+
+La fixture application sert cette même base : conn.commit() avant d'appeler
+une route. Les usagers insérés ont le mot de passe en clair 'x' (ancien
+format, reconnu et rehaché à la première connexion).
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'mairie.db')
+    conn.row_factory = sqlite3.Row
+    migrations.appliquer_migrations(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def application(tmp_path, conn):
+    import app
+    return app.create_app({
+        'DATABASE': str(tmp_path / 'mairie.db'),
+        'SECRET_KEY': 'test',
+        'TESTING': True,
+        'RAPPORTS_DOSSIER': str(tmp_path / 'rapports'),
+        'RETENTION_INTERVALLE': 0,
+        # Hachage rapide : le coût de production ne change rien à ce qui est testé
+        'MDP_METHODE': 'pbkdf2:sha256:1000',
+    })
+
+
+def connecter(application, email, mdp='x'):
+    client = application.test_client()
+    client.post('/', data={'email': email, 'mdp': mdp})
+    return client
+
+
+def inserer_mairie(conn, nom='Amiens', ville='Amiens'):
+    return conn.execute('INSERT INTO mairie (nom, ville) VALUES (?, ?)', (nom, ville)).lastrowid
+
+
+def inserer_usager(conn, email, role, mairie_id=None, nom='Dubois'):
+    return conn.execute('''
+        INSERT INTO usager (nom, prenom, email, mdp, role, mairie_id)
+        VALUES (?, 'Sophie', ?, 'x', ?, ?)
+    ''', (nom, email, role, mairie_id)).lastrowid
+
+
+def inserer_ticket(conn, createur_id, mairie_id, date_creation, technicien_id=None, statut='Nouveau'):
+    return conn.execute('''
+        INSERT INTO ticket (titre, description, type_prestation, createur_id, mairie_id, technicien_id,
+                            statut, date_creation)
+        VALUES ('Écran', 'Écran noir', 'materiel', ?, ?, ?, ?, ?)
+    ''', (createur_id, mairie_id, technicien_id, statut, date_creation)).lastrowid
@@ -0,0 +1,50 @@
+import pytest
+
+from conftest import connecter, inserer_mairie, inserer_ticket, inserer_usager
+
+
+@pytest.fixture
+def comptes(conn):
+    mairie_id = inserer_mairie(conn)
+    comptes = {
+        'agent': inserer_usager(conn, 's.dubois@mairie-amiens.fr', 'personnel_mairie', mairie_id),
+        'referent': inserer_usager(conn, 'j.leblanc@gmail.com', 'referent', mairie_id, nom='Leblanc'),
+        'technicien': inserer_usager(conn, 'j.gautier@presta.fr', 'technicien', nom='Gautier'),
+        'admin': inserer_usager(conn, 't.lefebvre@presta.fr', 'admin_prestataire', nom='Lefebvre'),
+    }
+    comptes['ticket'] = inserer_ticket(conn, comptes['agent'], mairie_id, '2026-03-01 10:00:00',
+                                       technicien_id=comptes['technicien'], statut='En cours')
+    conn.commit()
+    return comptes
+
+
+@pytest.mark.parametrize('email, url', [
+    ('s.dubois@mairie-amiens.fr', '/api/v1/mairie/tickets'),
+    ('j.leblanc@gmail.com', '/api/v1/referent/tickets'),
+    ('j.gautier@presta.fr', '/api/v1/technicien/tickets'),
+    ('t.lefebvre@presta.fr', '/api/v1/admin/tickets'),
+])
+def test_etag_puis_304_puis_nouvelle_version(application, conn, comptes, email, url):
+    client = connecter(application, email)
+
+    premiere = client.get(url)
+    assert premiere.status_code == 200
+    etag = premiere.headers['ETag']
+    assert [t['id'] for t in premiere.get_json()['tickets']] == [comptes['ticket']]
+
+    inchangee = client.get(url, headers={'If-None-Match': etag})
+    assert inchangee.status_code == 304
+    assert inchangee.get_data() == b''
+
+    conn.execute("UPDATE ticket SET statut = 'En attente de validation' WHERE id = ?", (comptes['ticket'],))
+    conn.commit()
+    changee = client.get(url, headers={'If-None-Match': etag})
+    assert changee.status_code == 200
+    assert changee.headers['ETag'] != etag
+    assert changee.get_json()['tickets'][0]['statut'] == 'En attente de validation'
+
+
+def test_api_refusee_aux_autres_roles(application, comptes):
+    client = connecter(application, 's.dubois@mairie-amiens.fr')
+    for url in ('/api/v1/technicien/tickets', '/api/v1/referent/tickets', '/api/v1/admin/tickets'):
+        assert client.get(url).status_code == 403
@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'outils'))
+
+import budget_import
+
+
+def test_import_app_dans_le_budget_sans_modules_differes():
+    # Process neufs ; le plus rapide compte (le premier compile aussi les .pyc)
+    essais = [budget_import.mesurer('app') for _ in range(3)]
+    meilleur = min(essais, key=lambda imports: imports['app'][1])
+
+    presents = sorted({nom.split('.')[0] for nom in meilleur} & set(budget_import.MODULES_DIFFERES))
+    assert presents == [], f"importés au démarrage : {', '.join(presents)}"
+    total_ms = meilleur['app'][1] / 1000
+    assert total_ms <= budget_import.BUDGET_MS, f"import app : {total_ms:.1f} ms > {budget_import.BUDGET_MS:.0f} ms"
@@ -0,0 +1,70 @@
+from conftest import connecter, inserer_mairie, inserer_ticket, inserer_usager
+
+
+def versions(conn):
+    return {(p, i): v for p, i, v in conn.execute('SELECT portee, ident, version FROM cache_version')}
+
+
+def test_mot_de_passe_ne_perime_pas_les_tableaux_de_la_mairie(conn):
+    mairie_id = inserer_mairie(conn)
+    agent_id = inserer_usager(conn, 's.dubois@mairie-amiens.fr', 'personnel_mairie', mairie_id)
+    avant = versions(conn)
+
+    conn.execute("UPDATE usager SET mdp = 'scrypt:...' WHERE id = ?", (agent_id,))
+    conn.execute("UPDATE usager SET nom = nom, service = service WHERE id = ?", (agent_id,))
+    assert versions(conn) == avant
+
+    # premier_login est dans le profil en cache, pas dans les tableaux
+    conn.execute('UPDATE usager SET premier_login = 0 WHERE id = ?', (agent_id,))
+    apres = versions(conn)
+    assert apres.get(('usager', agent_id), 0) == avant.get(('usager', agent_id), 0) + 1
+    assert apres.get(('mairie', mairie_id)) == avant.get(('mairie', mairie_id))
+
+    conn.execute("UPDATE usager SET prenom = 'Sophia' WHERE id = ?", (agent_id,))
+    renomme = versions(conn)
+    assert renomme[('usager', agent_id)] == apres[('usager', agent_id)] + 1
+    assert renomme[('mairie', mairie_id)] == apres.get(('mairie', mairie_id), 0) + 1
+
+
+# --- Fragments rendus (fragments.py), périmés par une écriture d'une autre connexion ---
+
+def tableau_technicien(conn):
+    mairie_id = inserer_mairie(conn)
+    agent_id = inserer_usager(conn, 's.dubois@mairie-amiens.fr', 'personnel_mairie', mairie_id)
+    technicien_id = inserer_usager(conn, 'j.gautier@presta.fr', 'technicien', nom='Gautier')
+    inserer_ticket(conn, agent_id, mairie_id, '2026-03-01 10:00:00', technicien_id=technicien_id, statut='En cours')
+    conn.commit()
+    return agent_id
+
+
+def statistiques(application):
+    return application.extensions['fragments'].statistiques()['routes']['dashboard_technicien']
+
+
+def test_fragment_perime_par_le_renommage_du_demandeur(application, conn):
+    agent_id = tableau_technicien(conn)
+    client = connecter(application, 'j.gautier@presta.fr')
+    assert 'Dubois' in client.get('/technicien/mes-tickets').get_data(as_text=True)
+    assert 'Dubois' in client.get('/technicien/mes-tickets').get_data(as_text=True)
+    assert (statistiques(application)['miss'], statistiques(application)['hits']) == (1, 1)
+
+    # conn n'est pas une connexion du pool de l'application : comme un autre worker
+    conn.execute("UPDATE usager SET nom = 'Durand' WHERE id = ?", (agent_id,))
+    conn.commit()
+    page = client.get('/technicien/mes-tickets').get_data(as_text=True)
+
+    assert 'Durand' in page and 'Dubois' not in page
+    assert statistiques(application)['miss'] == 2
+
+
+def test_fragment_perime_par_la_suppression_du_demandeur(application, conn):
+    agent_id = tableau_technicien(conn)
+    client = connecter(application, 'j.gautier@presta.fr')
+    assert 'Écran' in client.get('/technicien/mes-tickets').get_data(as_text=True)
+
+    conn.execute('DELETE FROM usager WHERE id = ?', (agent_id,))
+    conn.commit()
+
+    # Le tableau joint le demandeur : son ticket n'y figure plus
+    assert 'Écran' not in client.get('/technicien/mes-tickets').get_data(as_text=True)
+    assert statistiques(application)['miss'] == 2
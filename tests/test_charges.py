@@ -0,0 +1,57 @@
+from conftest import inserer_mairie, inserer_ticket, inserer_usager
+
+import charges
+
+
+def charges_actuelles(conn):
+    return dict(conn.execute('SELECT technicien_id, actifs FROM charge_technicien WHERE actifs != 0'))
+
+
+def charges_attendues(conn):
+    return dict(conn.execute('''
+        SELECT technicien_id, COUNT(*) FROM ticket
+        WHERE technicien_id IS NOT NULL AND statut != 'Terminé' GROUP BY technicien_id
+    '''))
+
+
+def test_compteurs_suivent_assignation_cloture_et_suppression(conn):
+    mairie_id = inserer_mairie(conn)
+    agent_id = inserer_usager(conn, 's.dubois@mairie-amiens.fr', 'personnel_mairie', mairie_id)
+    tech_a = inserer_usager(conn, 'j.gautier@presta.fr', 'technicien', nom='Gautier')
+    tech_b = inserer_usager(conn, 'l.durand@presta.fr', 'technicien', nom='Durand')
+
+    t1 = inserer_ticket(conn, agent_id, mairie_id, '2026-03-01 10:00:00', technicien_id=tech_a)
+    t2 = inserer_ticket(conn, agent_id, mairie_id, '2026-03-02 10:00:00', technicien_id=tech_a)
+    inserer_ticket(conn, agent_id, mairie_id, '2026-03-03 10:00:00', technicien_id=tech_b, statut='Terminé')
+    t4 = inserer_ticket(conn, agent_id, mairie_id, '2026-03-04 10:00:00')
+    assert charges_actuelles(conn) == {tech_a: 2}
+
+    conn.execute('UPDATE ticket SET technicien_id = ? WHERE id = ?', (tech_b, t2))
+    conn.execute("UPDATE ticket SET technicien_id = ?, statut = 'En cours' WHERE id = ?", (tech_b, t4))
+    assert charges_actuelles(conn) == {tech_a: 1, tech_b: 2}
+
+    conn.execute("UPDATE ticket SET statut = 'Terminé' WHERE id = ?", (t1,))
+    conn.execute('DELETE FROM ticket WHERE id = ?', (t4,))
+    # Rouvrir un ticket terminé le recompte
+    conn.execute("UPDATE ticket SET statut = 'En cours' WHERE technicien_id = ? AND statut = 'Terminé'", (tech_b,))
+    assert charges_actuelles(conn) == {tech_b: 2}
+    assert charges_actuelles(conn) == charges_attendues(conn)
+
+
+def test_recalculer_corrige_les_compteurs_faux(conn):
+    mairie_id = inserer_mairie(conn)
+    agent_id = inserer_usager(conn, 's.dubois@mairie-amiens.fr', 'personnel_mairie', mairie_id)
+    tech_a = inserer_usager(conn, 'j.gautier@presta.fr', 'technicien', nom='Gautier')
+    tech_b = inserer_usager(conn, 'l.durand@presta.fr', 'technicien', nom='Durand')
+    inserer_ticket(conn, agent_id, mairie_id, '2026-03-01 10:00:00', technicien_id=tech_a)
+    conn.commit()
+
+    # Écritures faites triggers absents (ancienne version, import brut...)
+    conn.execute('UPDATE charge_technicien SET actifs = 7 WHERE technicien_id = ?', (tech_a,))
+    conn.execute('INSERT INTO charge_technicien (technicien_id, actifs) VALUES (?, 3)', (tech_b,))
+    conn.commit()
+
+    assert charges.recalculer(conn) == 2
+    assert charges_actuelles(conn) == {tech_a: 1}
+    # Déjà juste : rien à corriger
+    assert charges.recalculer(conn) == 0
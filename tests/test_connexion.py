@@ -0,0 +1,92 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+from conftest import inserer_mairie, inserer_usager
+
+
+@pytest.fixture
+def agent(conn):
+    ident = inserer_usager(conn, 's.dubois@mairie-amiens.fr', 'personnel_mairie', inserer_mairie(conn))
+    conn.commit()
+    return ident
+
+
+def mdp_stocke(conn, ident):
+    return conn.execute('SELECT mdp FROM usager WHERE id = ?', (ident,)).fetchone()[0]
+
+
+def se_connecter(client, mdp, email='s.dubois@mairie-amiens.fr'):
+    return client.post('/', data={'email': email, 'mdp': mdp})
+
+
+# --- Hachage et rehachage à la connexion ---
+
+@pytest.mark.parametrize('ancien', ['x', generate_password_hash('x', 'pbkdf2:sha256:500')])
+def test_ancien_mot_de_passe_rehache_a_la_connexion(application, conn, agent, ancien):
+    conn.execute('UPDATE usager SET mdp = ? WHERE id = ?', (ancien, agent))
+    conn.commit()
+
+    reponse = se_connecter(application.test_client(), 'x')
+
+    assert reponse.status_code == 302
+    assert reponse.headers['Location'] == '/profil/modifier-mdp'
+    nouveau = mdp_stocke(conn, agent)
+    assert nouveau.startswith('pbkdf2:sha256:1000$')
+    # Le nouveau hachage est lu tel quel ensuite, sans être refait
+    assert se_connecter(application.test_client(), 'x').status_code == 302
+    assert mdp_stocke(conn, agent) == nouveau
+    assert application.extensions['mots_de_passe'].statistiques()['rehachages'] == 1
+
+
+@pytest.mark.parametrize('email, mdp', [('s.dubois@mairie-amiens.fr', 'X'), ('inconnu@mairie-amiens.fr', 'x')])
+def test_connexion_refusee_sans_rehachage(application, conn, agent, email, mdp):
+    reponse = se_connecter(application.test_client(), mdp, email)
+
+    assert reponse.status_code == 200
+    assert 'Identifiants incorrects' in reponse.get_data(as_text=True)
+    assert mdp_stocke(conn, agent) == 'x'
+    statistiques = application.extensions['mots_de_passe'].statistiques()
+    assert (statistiques['echecs'], statistiques['rehachages']) == (1, 0)
+
+
+# --- Limitation des tentatives (limitation.py) ---
+
+@pytest.fixture
+def acces_base(application, monkeypatch):
+    """Compte les connexions prises dans le pool."""
+    pool = application.extensions['pool_sqlite']
+    acquerir, acces = pool.acquerir, []
+    monkeypatch.setattr(pool, 'acquerir', lambda *args, **kwargs: acces.append(1) or acquerir(*args, **kwargs))
+    return acces
+
+
+def test_email_limite_refuse_avant_la_base(application, agent, acces_base):
+    client = application.test_client()
+    capacite = application.config['LIMITE_CONNEXION_EMAIL']['capacite']
+    for _ in range(capacite):
+        assert se_connecter(client, 'mauvais').status_code == 200
+    assert len(acces_base) == capacite
+    hachages = application.extensions['mots_de_passe'].statistiques()['verifications']
+
+    # Même email, casse et espaces compris ; même le bon mot de passe est refusé
+    reponse = se_connecter(client, 'x', ' S.Dubois@mairie-amiens.fr')
+
+    assert reponse.status_code == 429
+    assert int(reponse.headers['Retry-After']) > 0
+    assert 'Trop de tentatives' in reponse.get_data(as_text=True)
+    assert len(acces_base) == capacite
+    assert application.extensions['mots_de_passe'].statistiques()['verifications'] == hachages
+    # Un autre email depuis la même IP passe encore
+    assert se_connecter(client, 'x', 'p.martin@mairie-amiens.fr').status_code == 200
+
+
+def test_ip_limitee_quel_que_soit_l_email(application, agent, acces_base):
+    capacite = application.config['LIMITE_CONNEXION_IP']['capacite']
+    client = application.test_client()
+    for i in range(capacite):
+        se_connecter(client, 'x', f'inconnu{i}@mairie-amiens.fr')
+
+    assert se_connecter(client, 'x').status_code == 429
+    assert len(acces_base) == capacite
+    statistiques = application.extensions['limitation'].statistiques()
+    assert statistiques['refus_par_route'] == {'login': {'ip': 1, 'email': 0}}
@@ -0,0 +1,145 @@
+import io
+import re
+
+import pytest
+
+import importation
+from conftest import inserer_mairie, inserer_usager
+from mots_de_passe import Hacheur
+
+
+@pytest.fixture
+def hacheur():
+    return Hacheur('pbkdf2:sha256:1000')
+
+
+def csv(texte, nom='import.csv'):
+    return importation.lire_lignes(io.BytesIO(texte.encode('utf-8')), nom)
+
+
+# --- Personnel d'une mairie (importer_personnel) ---
+
+PERSONNEL = """\
+Prénom;Nom;Email;Service;Mdp
+Paul;Martin;p.martin@mairie-amiens.fr;technique;Secret1!
+Léa;Petit;lea.petit@gmail.com;Comptabilité;
+Paul;Martin;paul.martin@mairie-amiens.fr;RH;Secret1!
+Marc;Roy;m.roy@mairie-amiens.fr;Cuisine;Secret1!
+Ana;Lopez;a.lopez@mairie-amiens.fr;Accueil;faible
+Sophie;Dubois;s.dubois@mairie-amiens.fr;Accueil;Secret1!
+Paul;Martin;P.Martin@mairie-amiens.fr;Accueil;Secret1!
+"""
+
+
+def test_import_personnel_cree_les_valides_et_rapporte_les_autres(conn, hacheur):
+    mairie_id = inserer_mairie(conn)
+    inserer_usager(conn, 's.dubois@mairie-amiens.fr', 'personnel_mairie', mairie_id)
+    conn.commit()
+
+    rapport = importation.importer_personnel(conn, csv(PERSONNEL), mairie_id, hacheur, mdp_initial='Initial1!')
+
+    assert rapport['crees'] == 3
+    assert rapport['erreurs'] == [
+        (5, "service inconnu : Cuisine"),
+        (6, "mot de passe absent ou trop faible"),
+        (7, "s.dubois@mairie-amiens.fr : cet email existe déjà"),
+        # Email comparé en minuscules
+        (8, "p.martin@mairie-amiens.fr : en double dans le fichier")]
+    crees = conn.execute('''
+        SELECT email, service, mdp FROM usager WHERE mairie_id = ? AND email != 's.dubois@mairie-amiens.fr'
+        ORDER BY email
+    ''', (mairie_id,)).fetchall()
+    assert [(r['email'], r['service']) for r in crees] == [
+        ('lea.petit@gmail.com', 'Comptabilité'), ('p.martin@mairie-amiens.fr', 'Technique'),
+        ('paul.martin@mairie-amiens.fr', 'RH')]
+    assert all(r['mdp'].startswith('pbkdf2:sha256:1000$') for r in crees)
+
+
+def test_import_personnel_rejoue_sans_doublon(conn, hacheur):
+    mairie_id = inserer_mairie(conn)
+    conn.commit()
+    fichier = "prenom,nom,email,service\nPaul,Martin,p.martin@mairie-amiens.fr,Accueil\n"
+
+    assert importation.importer_personnel(conn, csv(fichier), mairie_id, hacheur, 'Initial1!')['crees'] == 1
+    rapport = importation.importer_personnel(conn, csv(fichier), mairie_id, hacheur, 'Initial1!')
+
+    assert rapport['crees'] == 0
+    assert rapport['erreurs'] == [(2, "p.martin@mairie-amiens.fr : cet email existe déjà")]
+    assert conn.execute('SELECT COUNT(*) FROM usager').fetchone()[0] == 1
+
+
+@pytest.mark.parametrize('texte, nom, message', [
+    ("prenom;nom;email\n", 'import.csv', "Colonne(s) manquante(s) : service"),
+    ("prenom;nom;email;service\n", 'import.txt', "Formats acceptés"),
+    ("prenom;nom;email;service\n" + "a;b;c;d\n" * 3, 'import.csv', "Fichier trop long"),
+])
+def test_import_personnel_fichier_refuse_sans_ecriture(conn, hacheur, texte, nom, message):
+    mairie_id = inserer_mairie(conn)
+    conn.commit()
+
+    with pytest.raises(importation.ImportationInvalide, match=re.escape(message)):
+        importation.importer_personnel(conn, csv(texte, nom), mairie_id, hacheur, 'Initial1!', lignes_max=2)
+    assert conn.execute('SELECT COUNT(*) FROM usager').fetchone()[0] == 0
+
+
+# --- Mairies et référents (importer_mairies) ---
+
+MAIRIES = """\
+mairie,ville,referent_prenom,referent_nom,referent_email,referent_mdp
+Mairie Centre,Amiens,Jean,Leblanc,j.leblanc@gmail.com,Secret1!
+MAIRIE CENTRE,amiens,,,,
+Mairie,Abbeville,Ana,Roy,,
+Mairie,Péronne,Luc,Noir,l.noir@gmail.com,
+Mairie,Albert,Jean,Leblanc,j.leblanc@gmail.com,Secret1!
+"""
+
+
+def mairies(conn):
+    return conn.execute('SELECT id, nom, ville FROM mairie ORDER BY id').fetchall()
+
+
+def test_import_mairies_rapporte_doublons_et_referents_refuses(conn, hacheur):
+    rapport = importation.importer_mairies(conn, csv(MAIRIES), hacheur)
+
+    assert rapport['erreurs'] == [
+        # Même mairie sans accents ni casse
+        (3, "MAIRIE CENTRE (amiens) : déjà en ligne 2"),
+        (4, "référent incomplet : prénom, nom et email sont obligatoires"),
+        (5, "mairie enregistrée, référent l.noir@gmail.com refusé : mot de passe absent ou trop faible"),
+        (6, "j.leblanc@gmail.com : en double dans le fichier")]
+    assert [tuple(m)[1:] for m in mairies(conn)] == [('Mairie Centre', 'Amiens'), ('Mairie', 'Péronne')]
+    assert (rapport['crees'], rapport['referents']) == (2, {'crees': 1, 'mis_a_jour': 0})
+
+
+def test_import_mairies_rejoue_en_mise_a_jour(conn, hacheur):
+    premier = "mairie;ville;referent_prenom;referent_nom;referent_email;referent_mdp\n" \
+              "Mairie Centre;Amiens;Jean;Leblanc;j.leblanc@gmail.com;Secret1!\n"
+    importation.importer_mairies(conn, csv(premier), hacheur)
+    (mairie_id, _, _), = mairies(conn)
+    mdp = conn.execute("SELECT mdp FROM usager WHERE email = 'j.leblanc@gmail.com'").fetchone()[0]
+
+    # Même mairie, libellé corrigé ; le référent change de nom mais garde son mot de passe
+    second = "mairie;ville;referent_prenom;referent_nom;referent_email;referent_mdp\n" \
+             "MAIRIE  centre ;AMIENS;Jean;Le Blanc;j.leblanc@gmail.com;Autre1!x\n"
+    rapport = importation.importer_mairies(conn, csv(second), hacheur)
+
+    assert (rapport['crees'], rapport['mis_a_jour']) == (0, 1)
+    assert rapport['referents'] == {'crees': 0, 'mis_a_jour': 1}
+    assert [tuple(m) for m in mairies(conn)] == [(mairie_id, 'MAIRIE  centre', 'AMIENS')]
+    assert tuple(conn.execute("SELECT nom, mdp, mairie_id FROM usager WHERE email = 'j.leblanc@gmail.com'")
+                 .fetchone()) == ('Le Blanc', mdp, mairie_id)
+
+
+def test_import_mairies_ne_reprend_pas_l_email_d_un_autre_role(conn, hacheur):
+    inserer_mairie(conn)
+    inserer_usager(conn, 'j.gautier@presta.fr', 'technicien', nom='Gautier')
+    conn.commit()
+    fichier = "mairie,ville,referent_prenom,referent_nom,referent_email\nMairie,Abbeville,Jean,Gautier,j.gautier@presta.fr\n"
+
+    rapport = importation.importer_mairies(conn, csv(fichier), hacheur, mdp_initial='Initial1!')
+
+    assert rapport['erreurs'] == [(2, "mairie enregistrée, référent j.gautier@presta.fr refusé : "
+                                      "email déjà utilisé par un autre compte")]
+    assert tuple(conn.execute("SELECT role, mairie_id FROM usager WHERE email = 'j.gautier@presta.fr'")
+                 .fetchone()) == ('technicien', None)
+    assert [m['ville'] for m in mairies(conn)] == ['Amiens', 'Abbeville']
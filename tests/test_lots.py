@@ -0,0 +1,181 @@
+import pytest
+
+from conftest import connecter, inserer_mairie, inserer_ticket, inserer_usager
+
+
+@pytest.fixture
+def comptes(conn):
+    amiens = inserer_mairie(conn)
+    abbeville = inserer_mairie(conn, 'Mairie centre', 'Abbeville')
+    comptes = {
+        'amiens': amiens,
+        'abbeville': abbeville,
+        'agent': inserer_usager(conn, 's.dubois@mairie-amiens.fr', 'personnel_mairie', amiens),
+        'collegue': inserer_usager(conn, 'p.martin@mairie-amiens.fr', 'personnel_mairie', amiens, nom='Martin'),
+        'agent_abbeville': inserer_usager(conn, 'a.roy@abbeville.fr', 'personnel_mairie', abbeville, nom='Roy'),
+        'referent': inserer_usager(conn, 'j.leblanc@gmail.com', 'referent', amiens, nom='Leblanc'),
+        'technicien': inserer_usager(conn, 'j.gautier@presta.fr', 'technicien', nom='Gautier'),
+        'autre_technicien': inserer_usager(conn, 'l.durand@presta.fr', 'technicien', nom='Durand'),
+        'admin': inserer_usager(conn, 't.lefebvre@presta.fr', 'admin_prestataire', nom='Lefebvre'),
+    }
+    conn.commit()
+    return comptes
+
+
+def ticket(conn, comptes, createur='agent', mairie='amiens', technicien=None, statut='Nouveau'):
+    return inserer_ticket(conn, comptes[createur], comptes[mairie], '2026-03-01 10:00:00',
+                          technicien_id=comptes[technicien] if technicien else None, statut=statut)
+
+
+def etats(conn, *ids):
+    return {t['id']: tuple(t)[1:] for t in conn.execute(
+        f"SELECT id, statut, technicien_id, contrat FROM ticket WHERE id IN ({','.join('?' * len(ids))})", ids)}
+
+
+# --- Assignation groupée (/admin/assigner-lot) ---
+
+def test_assignation_groupee_resultat_par_ticket(application, conn, comptes):
+    libre = ticket(conn, comptes)
+    reassigne = ticket(conn, comptes, technicien='autre_technicien', statut='En cours')
+    termine = ticket(conn, comptes, technicien='autre_technicien', statut='Terminé')
+    mauvais_tech, mauvais_contrat = ticket(conn, comptes), ticket(conn, comptes)
+    conn.commit()
+    tech = comptes['technicien']
+
+    reponse = connecter(application, 't.lefebvre@presta.fr').post('/admin/assigner-lot', json={'affectations': [
+        {'ticket_id': libre, 'technicien_id': tech, 'contrat': 'Gold'},
+        {'ticket_id': reassigne, 'technicien_id': tech, 'contrat': 'Silver'},
+        {'ticket_id': libre, 'technicien_id': tech, 'contrat': 'Bronze'},
+        {'ticket_id': termine, 'technicien_id': tech, 'contrat': 'Gold'},
+        {'ticket_id': 999, 'technicien_id': tech, 'contrat': 'Gold'},
+        {'ticket_id': mauvais_tech, 'technicien_id': comptes['agent'], 'contrat': 'Gold'},
+        {'ticket_id': mauvais_contrat, 'technicien_id': tech, 'contrat': 'Platine'},
+    ]})
+
+    assert reponse.status_code == 200
+    corps = reponse.get_json()
+    assert corps['assignes'] == 2
+    assert [r['erreur'] for r in corps['resultats']] == [
+        None, None, "ticket en double dans le lot", "ticket déjà terminé", "ticket introuvable",
+        "technicien inconnu", "contrat inconnu"]
+    assert etats(conn, libre, reassigne, termine, mauvais_tech, mauvais_contrat) == {
+        libre: ('En cours', tech, 'Gold'),
+        reassigne: ('En cours', tech, 'Silver'),
+        termine: ('Terminé', comptes['autre_technicien'], None),
+        mauvais_tech: ('Nouveau', None, None),
+        mauvais_contrat: ('Nouveau', None, None),
+    }
+    # Charges tenues par triggers dans la même transaction
+    assert dict(conn.execute('SELECT technicien_id, actifs FROM charge_technicien WHERE actifs != 0')) == {tech: 2}
+
+
+def test_assignation_groupee_par_formulaire(application, conn, comptes):
+    ids = [ticket(conn, comptes), ticket(conn, comptes)]
+    conn.commit()
+
+    reponse = connecter(application, 't.lefebvre@presta.fr').post('/admin/assigner-lot', data={
+        'tickets': [str(i) for i in ids], 'technicien_id': str(comptes['technicien']), 'contrat': 'Bronze'})
+
+    assert reponse.status_code == 302
+    assert set(etats(conn, *ids).values()) == {('En cours', comptes['technicien'], 'Bronze')}
+
+
+def test_assignation_groupee_reservee_a_l_admin(application, conn, comptes):
+    libre = ticket(conn, comptes)
+    conn.commit()
+
+    reponse = connecter(application, 'j.gautier@presta.fr').post('/admin/assigner-lot', json={'affectations': [
+        {'ticket_id': libre, 'technicien_id': comptes['technicien'], 'contrat': 'Gold'}]})
+
+    assert reponse.status_code == 403
+    assert etats(conn, libre)[libre] == ('Nouveau', None, None)
+
+
+def test_assignation_groupee_lot_trop_grand_refuse_en_entier(application, conn, comptes):
+    application.config['TICKETS_LOT_MAX'] = 2
+    ids = [ticket(conn, comptes) for _ in range(3)]
+    conn.commit()
+
+    reponse = connecter(application, 't.lefebvre@presta.fr').post('/admin/assigner-lot', json={'affectations': [
+        {'ticket_id': i, 'technicien_id': comptes['technicien'], 'contrat': 'Gold'} for i in ids]})
+
+    assert reponse.status_code == 413
+    assert set(etats(conn, *ids).values()) == {('Nouveau', None, None)}
+
+
+# --- Statut et clôture groupés (/tickets/statut-lot, /mairie/confirmer-cloture-lot) ---
+
+def test_statut_groupe_du_technicien_limite_a_ses_tickets_ouverts(application, conn, comptes):
+    sien = ticket(conn, comptes, technicien='technicien', statut='En cours')
+    autre = ticket(conn, comptes, technicien='autre_technicien', statut='En cours')
+    clos = ticket(conn, comptes, technicien='technicien', statut='Terminé')
+    conn.commit()
+
+    reponse = connecter(application, 'j.gautier@presta.fr').post(
+        '/tickets/statut-lot', json={'tickets': [sien, autre, clos, 999], 'statut': 'Terminé'})
+
+    assert reponse.get_json() == {'traites': [sien], 'refuses': sorted([autre, clos, 999])}
+    # "Terminé" attend la confirmation de la mairie
+    assert [s for s, _, _ in etats(conn, sien, autre, clos).values()] == [
+        'En attente de validation', 'En cours', 'Terminé']
+
+
+def test_statut_groupe_de_l_admin_sur_tous_les_tickets_ouverts(application, conn, comptes):
+    ids = [ticket(conn, comptes, technicien='technicien', statut='Nouveau'),
+           ticket(conn, comptes, technicien='autre_technicien', statut='Nouveau')]
+    conn.commit()
+
+    reponse = connecter(application, 't.lefebvre@presta.fr').post(
+        '/tickets/statut-lot', json={'tickets': ids, 'statut': 'En cours'})
+
+    assert reponse.get_json() == {'traites': ids, 'refuses': []}
+    assert {s for s, _, _ in etats(conn, *ids).values()} == {'En cours'}
+
+
+@pytest.mark.parametrize('corps, statut', [
+    ({'tickets': ['²'], 'statut': 'En cours'}, 400),
+    ({'tickets': ['٣'], 'statut': 'En cours'}, 400),
+    ({'tickets': [1.5], 'statut': 'En cours'}, 400),
+    ({'tickets': '1,2', 'statut': 'En cours'}, 400),
+    ({'tickets': [1], 'statut': 'Annulé'}, 400),
+])
+def test_statut_groupe_corps_invalide(application, conn, comptes, corps, statut):
+    client = connecter(application, 't.lefebvre@presta.fr')
+    reponse = client.post('/tickets/statut-lot', json=corps)
+    assert reponse.status_code == statut
+    assert 'erreur' in reponse.get_json()
+
+
+def test_statut_groupe_refuse_aux_agents(application, conn, comptes):
+    sien = ticket(conn, comptes, statut='Nouveau')
+    conn.commit()
+
+    reponse = connecter(application, 's.dubois@mairie-amiens.fr').post(
+        '/tickets/statut-lot', json={'tickets': [sien], 'statut': 'En cours'})
+
+    assert reponse.status_code == 403
+    assert etats(conn, sien)[sien][0] == 'Nouveau'
+
+
+def test_cloture_groupee_par_portee(application, conn, comptes):
+    attente = 'En attente de validation'
+    du_collegue = ticket(conn, comptes, createur='collegue', technicien='technicien', statut=attente)
+    de_l_agent = ticket(conn, comptes, technicien='technicien', statut=attente)
+    abbeville = ticket(conn, comptes, createur='agent_abbeville', mairie='abbeville',
+                       technicien='technicien', statut=attente)
+    en_cours = ticket(conn, comptes, technicien='technicien', statut='En cours')
+    conn.commit()
+    lot = {'tickets': [du_collegue, de_l_agent, abbeville, en_cours]}
+
+    # Agent : ses propres demandes seulement
+    reponse = connecter(application, 's.dubois@mairie-amiens.fr').post('/mairie/confirmer-cloture-lot', json=lot)
+    assert reponse.get_json()['traites'] == [de_l_agent]
+
+    # Référent : toute sa mairie, pas celle d'à côté ni les tickets pas encore en attente
+    reponse = connecter(application, 'j.leblanc@gmail.com').post('/mairie/confirmer-cloture-lot', json=lot)
+    assert reponse.get_json() == {'traites': [du_collegue], 'refuses': sorted([de_l_agent, abbeville, en_cours])}
+    assert [s for s, _, _ in etats(conn, du_collegue, de_l_agent, abbeville, en_cours).values()] == [
+        'Terminé', 'Terminé', attente, 'En cours']
+
+    reponse = connecter(application, 'j.gautier@presta.fr').post('/mairie/confirmer-cloture-lot', json=lot)
+    assert reponse.status_code == 403
@@ -0,0 +1,56 @@
+"""Plans des requêtes que les routes exécutent vraiment, captées au passage (set_trace_callback).
+
+REQUETES_DASHBOARD (flask verifier-plans) en garde une copie pour contrôler
+une base de production ; ici, c'est le SQL des fonctions de app.py qui est
+expliqué, paramètres compris.
+"""
+import pytest
+
+import app
+import migrations
+
+CURSEUR = ('2026-01-01 00:00:00', 5)
+
+
+def requetes_executees(conn, appel):
+    """SQL envoyé à SQLite pendant appel(), paramètres déjà substitués."""
+    requetes = []
+    conn.set_trace_callback(requetes.append)
+    try:
+        appel()
+    finally:
+        conn.set_trace_callback(None)
+    return requetes
+
+
+def page_admin(conn, args, curseur=None):
+    _, conditions, params = app.filtres_tickets_admin(args)
+    return app.page_tickets_admin(conn, conditions, params, curseur, 50)
+
+
+# (nom, appel, index attendu sur ticket)
+CAS = [
+    ('tableau technicien', lambda conn: app.tickets_technicien(conn, 1), 'idx_ticket_technicien_date'),
+    ('tableau agent', lambda conn: app.tickets_createur(conn, 1), 'idx_ticket_createur_date'),
+    ('tableau référent', lambda conn: app.tickets_referent(conn, 1), 'idx_ticket_mairie_date'),
+    ('admin, première page', lambda conn: page_admin(conn, {}), 'idx_ticket_date_creation'),
+    ('admin, page suivante', lambda conn: page_admin(conn, {}, CURSEUR), 'idx_ticket_date_creation'),
+    ('admin, en retard', lambda conn: page_admin(conn, {'en_retard': '1'}), 'idx_ticket_sla_ouverts'),
+] + [
+    (f"admin, filtre {cle}{suite}", lambda conn, cle=cle, curseur=curseur: page_admin(conn, {cle: '1'}, curseur), index)
+    for cle, index in [('statut', 'idx_ticket_statut_date'), ('contrat', 'idx_ticket_contrat_date'),
+                       ('type_prestation', 'idx_ticket_type_date'), ('mairie', 'idx_ticket_mairie_date')]
+    for suite, curseur in [('', None), (', page suivante', CURSEUR)]
+]
+
+
+@pytest.mark.parametrize('nom, appel, index', CAS, ids=[cas[0] for cas in CAS])
+def test_requetes_des_routes_indexees(conn, nom, appel, index):
+    requetes = requetes_executees(conn, lambda: appel(conn))
+    assert requetes, nom
+    for sql in requetes:
+        plan = [r[3] for r in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+        assert any(f'USING INDEX {index}' in ligne for ligne in plan), plan
+        # Seule exception au « pas de SCAN » : parcourir l'index attendu dans l'ordre, arrêté par LIMIT
+        assert not [ligne for ligne in migrations._parcours_complets(plan)
+                    if f'USING INDEX {index}' not in ligne], plan
@@ -0,0 +1,78 @@
+import io
+import re
+
+from conftest import inserer_mairie, inserer_ticket, inserer_usager
+
+import rapports
+import rapports_pdf
+
+
+def test_rapport_mensuel_exclut_le_meme_mois_des_autres_annees(conn):
+    mairie_id = inserer_mairie(conn)
+    agent_id = inserer_usager(conn, 's.dubois@mairie-amiens.fr', 'personnel_mairie', mairie_id)
+    dates = {
+        'dans le mois': '2026-03-15 10:00:00',
+        'premier instant': '2026-03-01 00:00:00',
+        'dernier jour': '2026-03-31 23:59:59',
+        'mars 2025': '2025-03-15 10:00:00',
+        'mars 2024': '2024-03-01 00:00:00',
+        'février': '2026-02-28 23:59:59',
+        'avril': '2026-04-01 00:00:00',
+    }
+    ids = {nom: inserer_ticket(conn, agent_id, mairie_id, date) for nom, date in dates.items()}
+    conn.commit()
+
+    periode = rapports.periode(mois='2026-03')
+    lus = [t['id'] for t in conn.execute(rapports.SQL_TICKETS_PERIODE, (periode['debut'], periode['fin']))]
+
+    assert sorted(lus) == sorted(ids[nom] for nom in ('dans le mois', 'premier instant', 'dernier jour'))
+
+    # Une modification d'une autre année ne change pas la version du rapport
+    version = rapports.version_donnees(conn, periode)
+    assert version.startswith('3-')
+    conn.execute("UPDATE ticket SET statut = 'En cours' WHERE id = ?", (ids['mars 2025'],))
+    assert rapports.version_donnees(conn, periode) == version
+
+
+def test_rapport_lu_par_idx_ticket_date_creation(conn):
+    periode = rapports.periode(mois='2026-03')
+    plan = [r[3] for r in conn.execute('EXPLAIN QUERY PLAN ' + rapports.SQL_TICKETS_PERIODE,
+                                       (periode['debut'], periode['fin']))]
+    assert any(ligne.startswith('SEARCH t USING INDEX idx_ticket_date_creation') for ligne in plan), plan
+
+
+def test_pdf_ecrit_page_par_page_avec_xref_valide():
+    ticket = {'date_creation': '2026-03-15 10:00:00', 'nom_mairie': 'Mairie (centre)', 'ville_mairie': 'Amiens',
+              'titre': 'Écran noir', 'tech_prenom': 'Julien', 'tech_nom': 'Gautier', 'contrat': 'Gold',
+              'statut': 'Terminé', 'sla_depasse': 0, 'date_fin': '2026-03-16 10:00:00',
+              'sla_echeance': '2026-03-15 14:00:00', 'sla_heures_ecoulees': 24, 'sla_retard_heures': None}
+    sortie = io.BytesIO()
+    rapports.construire_pdf(iter([ticket] * 60), 'mars 2026', sortie)
+    pdf = sortie.getvalue()
+
+    pages = -(-60 // rapports_pdf.LIGNES_PAR_PAGE)
+    assert pdf.startswith(b'%PDF-1.4') and pdf.endswith(b'%%EOF\n')
+    assert pdf.count(b'/Type /Page ') == pages
+    assert b'/Count %d' % pages in pdf
+    # Chaque entrée de la table xref pointe sur le début de son objet
+    debut_xref = int(pdf.rsplit(b'startxref\n', 1)[1].split(b'\n')[0])
+    entrees = re.findall(rb'(\d{10}) 00000 n', pdf[debut_xref:])
+    for numero, position in enumerate(entrees, start=1):
+        assert pdf[int(position):].startswith(b'%d 0 obj' % numero)
+
+
+def test_version_du_rapport_suit_les_renommages(conn):
+    mairie_id = inserer_mairie(conn)
+    agent_id = inserer_usager(conn, 's.dubois@mairie-amiens.fr', 'personnel_mairie', mairie_id)
+    tech_id = inserer_usager(conn, 'j.gautier@presta.fr', 'technicien', nom='Gautier')
+    inserer_ticket(conn, agent_id, mairie_id, '2026-03-15 10:00:00', technicien_id=tech_id)
+    conn.commit()
+    periode = rapports.periode(mois='2026-03')
+
+    versions = [rapports.version_donnees(conn, periode)]
+    conn.execute("UPDATE mairie SET nom = 'Mairie annexe' WHERE id = ?", (mairie_id,))
+    versions.append(rapports.version_donnees(conn, periode))
+    conn.execute("UPDATE usager SET nom = 'Gauthier' WHERE id = ?", (tech_id,))
+    versions.append(rapports.version_donnees(conn, periode))
+
+    assert len(set(versions)) == 3
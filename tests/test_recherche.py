@@ -0,0 +1,99 @@
+import pytest
+
+import recherche
+from conftest import connecter, inserer_mairie, inserer_ticket, inserer_usager
+
+
+def trouves(conn, texte, **kwargs):
+    return [t['id'] for t in recherche.rechercher(conn, texte, **kwargs)[0]]
+
+
+def test_triggers_tiennent_l_index_a_jour(conn):
+    mairie_id = inserer_mairie(conn)
+    agent = inserer_usager(conn, 's.dubois@mairie-amiens.fr', 'personnel_mairie', mairie_id)
+    ident = inserer_ticket(conn, agent, mairie_id, '2026-03-01 10:00:00')
+    conn.commit()
+    # Accents et casse ignorés, dernier mot en préfixe
+    assert trouves(conn, 'ecran') == [ident]
+    assert trouves(conn, 'ÉCRAN no') == [ident]
+
+    conn.execute("UPDATE ticket SET titre = 'Imprimante', description = 'Bourrage papier' WHERE id = ?", (ident,))
+    conn.commit()
+    assert trouves(conn, 'écran') == []
+    assert trouves(conn, 'bourrage') == [ident]
+
+    # Un changement de statut ne touche pas aux colonnes indexées
+    conn.execute("UPDATE ticket SET statut = 'En cours' WHERE id = ?", (ident,))
+    assert trouves(conn, 'imprimante') == [ident]
+
+    conn.execute('DELETE FROM ticket WHERE id = ?', (ident,))
+    conn.commit()
+    assert trouves(conn, 'imprimante') == []
+    # Lève une erreur si l'index diverge de la table ticket
+    conn.execute("INSERT INTO ticket_fts (ticket_fts) VALUES ('integrity-check')")
+
+
+def test_syntaxe_fts_de_l_usager_non_interpretee(conn):
+    assert recherche.requete_fts('écran OR "noir" NEAR*') == '"écran" "OR" "noir" "NEAR"*'
+    assert recherche.requete_fts(' ^*" ') is None
+    assert recherche.rechercher(conn, '***') == ([], False)
+
+
+def test_recherche_tronquee_au_dela_des_candidats(conn):
+    mairie_id = inserer_mairie(conn)
+    agent = inserer_usager(conn, 's.dubois@mairie-amiens.fr', 'personnel_mairie', mairie_id)
+    ids = [inserer_ticket(conn, agent, mairie_id, f'2026-03-{j:02d} 10:00:00') for j in range(1, 6)]
+    conn.commit()
+
+    tickets, tronque = recherche.rechercher(conn, 'écran', candidats=3)
+    assert tronque
+    # Seuls les plus récents sont classés : le plus ancien n'est jamais lu
+    assert ids[0] not in [t['id'] for t in tickets]
+    assert set(ids[-3:]) <= {t['id'] for t in tickets}
+
+    tickets, tronque = recherche.rechercher(conn, 'écran', candidats=5)
+    assert not tronque
+    assert len(tickets) == 5
+
+
+@pytest.fixture
+def comptes(conn):
+    amiens, abbeville = inserer_mairie(conn), inserer_mairie(conn, 'Abbeville', 'Abbeville')
+    comptes = {
+        'agent': inserer_usager(conn, 's.dubois@mairie-amiens.fr', 'personnel_mairie', amiens),
+        'collegue': inserer_usager(conn, 'p.martin@mairie-amiens.fr', 'personnel_mairie', amiens, nom='Martin'),
+        'agent_abbeville': inserer_usager(conn, 'a.roy@abbeville.fr', 'personnel_mairie', abbeville, nom='Roy'),
+        'referent': inserer_usager(conn, 'j.leblanc@gmail.com', 'referent', amiens, nom='Leblanc'),
+        'technicien': inserer_usager(conn, 'j.gautier@presta.fr', 'technicien', nom='Gautier'),
+        'admin': inserer_usager(conn, 't.lefebvre@presta.fr', 'admin_prestataire', nom='Lefebvre'),
+    }
+    comptes['de_l_agent'] = inserer_ticket(conn, comptes['agent'], amiens, '2026-03-01 10:00:00',
+                                           technicien_id=comptes['technicien'])
+    comptes['du_collegue'] = inserer_ticket(conn, comptes['collegue'], amiens, '2026-03-02 10:00:00')
+    comptes['d_abbeville'] = inserer_ticket(conn, comptes['agent_abbeville'], abbeville, '2026-03-03 10:00:00')
+    conn.commit()
+    return comptes
+
+
+@pytest.mark.parametrize('email, visibles', [
+    ('s.dubois@mairie-amiens.fr', ['de_l_agent']),
+    ('j.leblanc@gmail.com', ['de_l_agent', 'du_collegue']),
+    ('j.gautier@presta.fr', ['de_l_agent']),
+    ('t.lefebvre@presta.fr', ['de_l_agent', 'du_collegue', 'd_abbeville']),
+])
+def test_recherche_limitee_a_la_portee_du_role(application, comptes, email, visibles):
+    reponse = connecter(application, email).get('/api/v1/tickets/recherche?q=ecran')
+
+    assert reponse.status_code == 200
+    assert sorted(t['id'] for t in reponse.get_json()['tickets']) == sorted(comptes[v] for v in visibles)
+
+
+def test_recherche_tronquee_signalee_par_l_api(application, comptes):
+    application.config['RECHERCHE_CANDIDATS'] = 2
+    client = connecter(application, 't.lefebvre@presta.fr')
+
+    assert client.get('/api/v1/tickets/recherche?q=ecran').get_json()['tronque'] is True
+    # La période ramène la recherche sous la limite
+    donnees = client.get('/api/v1/tickets/recherche?q=ecran&du=2026-03-02&au=2026-03-02').get_json()
+    assert donnees['tronque'] is False
+    assert [t['id'] for t in donnees['tickets']] == [comptes['du_collegue']]
@@ -0,0 +1,31 @@
+from conftest import inserer_mairie, inserer_ticket, inserer_usager
+
+import app
+
+
+def test_retard_fige_a_la_cloture_et_efface_a_la_reouverture(conn):
+    mairie_id = inserer_mairie(conn)
+    agent_id = inserer_usager(conn, 's.dubois@mairie-amiens.fr', 'personnel_mairie', mairie_id)
+    tech_id = inserer_usager(conn, 'j.gautier@presta.fr', 'technicien', nom='Gautier')
+    en_retard = inserer_ticket(conn, agent_id, mairie_id, '2026-01-10 08:00:00', technicien_id=tech_id)
+    dans_les_temps = inserer_ticket(conn, agent_id, mairie_id, '2026-01-10 08:00:00', technicien_id=tech_id)
+    sans_echeance = inserer_ticket(conn, agent_id, mairie_id, '2026-01-10 08:00:00')
+    conn.execute("UPDATE ticket SET sla_echeance = '2026-01-10 12:00:00' WHERE id = ?", (en_retard,))
+    conn.execute("UPDATE ticket SET sla_echeance = '2999-01-01 00:00:00' WHERE id = ?", (dans_les_temps,))
+
+    conn.executemany(f'UPDATE ticket SET {app.SQL_CLOTURE} WHERE id = ?',
+                     [(en_retard,), (dans_les_temps,), (sans_echeance,)])
+    lignes = {t['id']: t for t in conn.execute(
+        "SELECT id, date_fin, sla_depasse, sla_retard_heures, "
+        "ROUND((julianday(date_fin) - julianday('2026-01-10 12:00:00')) * 24, 2) AS attendu, "
+        "ROUND((julianday(date_fin) - julianday('2026-01-13 08:00:00')) * 24, 2) AS attendu_defaut FROM ticket")}
+
+    assert lignes[en_retard]['sla_depasse'] == 1
+    assert lignes[en_retard]['sla_retard_heures'] == lignes[en_retard]['attendu']
+    assert (lignes[dans_les_temps]['sla_depasse'], lignes[dans_les_temps]['sla_retard_heures']) == (0, None)
+    # Clos sans assignation : échéance par défaut (72 h après la création)
+    assert lignes[sans_echeance]['sla_retard_heures'] == lignes[sans_echeance]['attendu_defaut']
+
+    conn.execute(app.SQL_CHANGEMENT_STATUT, ('En cours', en_retard))
+    assert tuple(conn.execute('SELECT sla_depasse, sla_retard_heures FROM ticket WHERE id = ?',
+                              (en_retard,)).fetchone()) == (None, None)
@@ -0,0 +1,48 @@
+"""Règles de saisie partagées par les formulaires et les imports en masse.
+
+Les expressions régulières sont compilées une fois au chargement du module :
+un import de plusieurs centaines de lignes ne recompile rien.
+"""
+import re
+import unicodedata
+
+# Partie après @ : gmail.com ou n'importe quel domaine finissant par .fr
+EMAIL = re.compile(r"^(?P<local>[^@]+)@(gmail\.com|[a-zA-Z0-9-]+\.fr)$")
+
+MDP_FORT = re.compile(r"^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[@$!%*?&])[A-Za-z\d@$!%*?&]{8,}$")
+
+
+def simplifier_chaine(texte):
+    """Supprime les accents, espaces et met en minuscule."""
+    if not texte: return ""
+    texte = unicodedata.normalize('NFD', texte)
+    texte = "".join([c for c in texte if unicodedata.category(c) != 'Mn']).lower()
+    return texte.replace(" ", "")
+
+
+def cle_mairie(nom, ville):
+    """(nom, ville) simplifiés : "Mairie Centre"/"AMIENS" et "mairie centre"/"Amiens" sont la même mairie."""
+    return simplifier_chaine((nom or '').strip()), simplifier_chaine((ville or '').strip())
+
+
+def valider_format_strict_email(email, prenom, nom):
+    """Vérifie le format prenom.nom@... ou p.nom@... avec domaines .fr ou gmail.com"""
+    p = simplifier_chaine(prenom)
+    n = simplifier_chaine(nom)
+    if not email or not p or not n:
+        return False
+    trouve = EMAIL.match(email.lower().strip())
+    # prenom.nom ou p.nom
+    return trouve is not None and trouve['local'] in (f"{p}.{n}", f"{p[0]}.{n}")
+
+
+def valider_securite_mdp(mdp):
+    """
+    Vérifie la force du mot de passe :
+    - 8 caractères minimum
+    - Au moins une majuscule
+    - Au moins une minuscule
+    - Au moins un chiffre
+    - Au moins un caractère spécial (@$!%*?&)
+    """
+    return MDP_FORT.match(mdp or '') is not None
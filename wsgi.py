@@ -0,0 +1,20 @@
+"""Point d'entrée WSGI de production.
+
+    MAIRIE_SECRET_KEY=... MAIRIE_DATABASE=/srv/mairie/mairie.db MAIRIE_SQLITE_PROFIL=production \
+        gunicorn -c gunicorn.conf.py wsgi:application
+
+L'application est construite une seule fois à l'import ; avec preload_app
+(gunicorn.conf.py), le parent applique les migrations et les workers la
+reçoivent toute prête par fork, chacun rouvrant ses connexions SQLite
+(app.apres_fork). Le démarrage est refusé si demarrage.verifier() signale un
+problème bloquant (clé de session absente, base hors WAL, schéma en retard...).
+"""
+import demarrage
+from app import create_app
+
+application = create_app()
+
+bloquants, avertissements = demarrage.verifier(application, production=True)
+demarrage.journaliser(application, bloquants, avertissements)
+if bloquants:
+    raise demarrage.DemarrageImpossible(f"{len(bloquants)} problème(s) bloquant(s), voir ci-dessus")